@@ -0,0 +1,145 @@
+# src/adaptive_stride.py
+import numpy as np
+from pose_detector import landmarks_to_array
+from rule_spec import load_exercises
+from utils import to_pixel_coords
+
+
+class AdaptiveStride:
+    """
+    Decides which frames get pose inference. After every inferred (key) frame
+    the stride grows by one up to max_stride while the person moves slowly,
+    and drops straight back to 1 (full rate) when:
+      - no pose was found,
+      - any joint of the exercise's rep rule moves faster than
+        velocity_thresh (normalized units per frame) between the last two
+        keyframes,
+      - a rep value (the rep rule per side, as scored) is within
+        angle_margin of a rep threshold, just crossed one, or would cross
+        one within the next stride at its current rate of change,
+      - a rep value turned around (its rate of change flipped sign).
+    exercise: a compiled rule_spec.Exercise or its name (default
+    bicep_curl); thresholds defaults to its rep_thresholds (rep up / down
+    and the rep rule's check thresholds).
+    """
+    def __init__(self, frame_size, max_stride=3, velocity_thresh=0.03,
+                 thresholds=None, angle_margin=5, exercise=None):
+        self.w, self.h = frame_size
+        self.max_stride = max_stride
+        self.velocity_thresh = velocity_thresh
+        self.angle_margin = angle_margin
+        self.stride = 1
+        self.next_key = 0
+        self.set_exercise(exercise, thresholds)
+
+    def set_exercise(self, exercise=None, thresholds=None):
+        """
+        Switches the rep rule (and thresholds) the stride follows; the next
+        keyframe starts afresh at full rate.
+        """
+        if exercise is None or isinstance(exercise, str):
+            exercise = load_exercises()[exercise or "bicep_curl"]
+        self.exercise = exercise
+        if thresholds is None:
+            thresholds = exercise.rep_thresholds
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.joints = sorted({j for joints in exercise.rep_joints.values() for j in joints})
+        self.last_idx = None
+        self.last_row = None
+        self.last_values = None
+        self.last_rate = None
+
+    def due(self, frame_idx):
+        return frame_idx >= self.next_key
+
+    def rep_values(self, row):
+        """
+        (left, right) values of the exercise's rep rule for one (33, 4)
+        landmark row, in the pixel space the rules are scored in.
+        """
+        values, _, _ = self.exercise.evaluate(to_pixel_coords(row, self.w, self.h))
+        rep = self.exercise.rep_values(values)
+        return np.array([rep["left"], rep["right"]], dtype=float)
+
+    def observe(self, frame_idx, row):
+        """
+        Feed the landmarks of an inferred frame; schedules the next keyframe.
+        """
+        values = None if np.isnan(row[0, 0]) else self.rep_values(row)
+        rate = None
+        if values is None or self.last_row is None or np.isnan(self.last_row[0, 0]):
+            fast = True
+        else:
+            gap = frame_idx - self.last_idx
+            step = row[self.joints, :2] - self.last_row[self.joints, :2]
+            velocity = np.max(np.linalg.norm(step, axis=1)) / gap
+            rate = (values - self.last_values) / gap
+            predicted = values + rate * (self.stride + 1)
+            side = np.sign(values[:, None] - self.thresholds)
+            near = np.abs(values[:, None] - self.thresholds) <= self.angle_margin
+            crossed = side != np.sign(self.last_values[:, None] - self.thresholds)
+            will_cross = side != np.sign(predicted[:, None] - self.thresholds)
+            # Interpolation cuts the peak off a turning point
+            turning = self.last_rate is not None and (rate * self.last_rate < 0).any()
+            fast = (velocity > self.velocity_thresh or near.any() or crossed.any()
+                    or will_cross.any() or turning)
+
+        self.stride = 1 if fast else min(self.stride + 1, self.max_stride)
+        self.next_key = frame_idx + self.stride
+        self.last_idx, self.last_row, self.last_values, self.last_rate = frame_idx, row, values, rate
+
+
+class StridedInference:
+    """
+    Offline wrapper: runs the detector on keyframes chosen by AdaptiveStride
+    (stride_kwargs, e.g. max_stride and exercise) and linearly interpolates landmarks for the frames in between. Frames
+    are held back until the next keyframe arrives, so output stays in order.
+
+    process(idx, frame) and flush() return lists of (idx, frame, row).
+    """
+    def __init__(self, detector, frame_size, telemetry=None, **stride_kwargs):
+        self.detector = detector
+        self.telemetry = telemetry
+        self.stride = AdaptiveStride(frame_size, **stride_kwargs)
+        self.pending = []
+        self.prev_key = None
+        self.inferred = 0
+
+    def _detect(self, frame):
+        self.inferred += 1
+        return landmarks_to_array(self.detector.detect(frame, self.telemetry))
+
+    def process(self, frame_idx, frame):
+        if not self.stride.due(frame_idx):
+            self.pending.append((frame_idx, frame))
+            return []
+
+        row = self._detect(frame)
+        self.stride.observe(frame_idx, row)
+        out = self._fill_pending(frame_idx, row)
+        out.append((frame_idx, frame, row))
+        self.prev_key = (frame_idx, row)
+        return out
+
+    def flush(self):
+        """
+        Frames after the last keyframe have no right-hand anchor; infer them.
+        """
+        out = [(i, f, self._detect(f)) for i, f in self.pending]
+        self.pending = []
+        return out
+
+    def _fill_pending(self, frame_idx, row):
+        if not self.pending:
+            return []
+        prev_idx, prev_row = self.prev_key
+        if np.isnan(prev_row[0, 0]) or np.isnan(row[0, 0]):
+            # Can't interpolate across a lost pose: run the detector instead
+            out = [(i, f, self._detect(f)) for i, f in self.pending]
+        else:
+            out = []
+            for i, f in self.pending:
+                t = (i - prev_idx) / (frame_idx - prev_idx)
+                out.append((i, f, ((1 - t) * prev_row + t * row).astype(np.float32)))
+        self.pending = []
+        return out
@@ -0,0 +1,209 @@
+# src/auto_quality.py
+"""
+Auto-scaling pose inference for the live loops: picks the pose model
+(model_complexity 0/1/2), an input downscale and the max inference stride
+so the measured detect cost per frame stays within a budget derived from
+the target fps.
+
+Modes are ordered best quality first (MODES). After every window of about
+one second the controller compares the average detect cost per frame with
+the budget:
+  - over budget: one step cheaper, right away;
+  - under UPGRADE_RATIO * budget for UPGRADE_WINDOWS windows in a row:
+    one step better.
+A mode that had to be left for being too slow is not retried for
+BACKOFF_S seconds, doubling each time it fails again, so the controller
+settles instead of oscillating between two neighbouring modes. The first
+inference after a switch (graph build / MediaPipe's resize stall) is not
+measured.
+
+Models that can't be loaded (the lite / heavy ones are downloaded on first
+use) are dropped from the ladder.
+"""
+import time
+from collections import deque
+import cv2
+from pose_detector import PoseDetector, landmarks_to_array
+from adaptive_stride import AdaptiveStride
+from frame_buffers import FramePool, readonly
+
+# (model_complexity, downscale, max_stride), best quality first. Stride is
+# the cheapest step (AdaptiveStride only skips frames in slow phases),
+# then input size, then the model.
+MODES = [
+    (2, 1.0, 1),
+    (2, 1.0, 2),
+    (1, 1.0, 1),
+    (1, 1.0, 2),
+    (1, 1.0, 3),
+    (1, 0.75, 3),
+    (1, 0.5, 3),
+    (0, 0.5, 3),
+    (0, 0.5, 4),
+    (0, 0.35, 4)
+]
+START_MODE = (1, 1.0, 1)  # PoseDetector's defaults
+MODEL_NAMES = {0: "lite", 1: "full", 2: "heavy"}
+
+# Share of the frame interval detection may use (the rest is capture,
+# rules and drawing)
+DETECT_SHARE = 0.8
+UPGRADE_RATIO = 0.6
+UPGRADE_WINDOWS = 3
+BACKOFF_S = 5.0
+MAX_BACKOFF_S = 120.0
+
+
+class QualityController:
+    """
+    Wraps the detector, its AdaptiveStride and the mode ladder. Call
+    process(frame_idx, frame_bgr) once per frame: it returns the new
+    results on inferred frames and None on frames the stride skips.
+
+    target_fps sets the budget (DETECT_SHARE of the frame interval);
+    budget_ms overrides it. max_stride caps the ladder's strides.
+    settings: other PoseDetector settings (model_complexity is ignored).
+    exercise: the compiled exercise (or its name) being scored; the stride
+    follows its rep rule (see AdaptiveStride), set_exercise() switches it.
+    """
+    def __init__(self, target_fps=30.0, budget_ms=None, settings=None, max_stride=4,
+                 modes=MODES, start=START_MODE, exercise=None):
+        self.target_fps = target_fps
+        self.exercise = exercise
+        self.budget_ms = budget_ms if budget_ms is not None else 1000.0 * DETECT_SHARE / target_fps
+        self.settings = PoseDetector.resolve_settings(settings)
+        self.modes = list(dict.fromkeys((c, d, min(s, max_stride)) for c, d, s in modes))
+        self.window = max(1, round(target_fps))
+        self.detectors = {}
+        self.stride = None
+        self.switches = []
+        self._costs = deque(maxlen=self.window)
+        self._blocked = {}
+        self._backoff = {}
+        self._calm = 0
+        self._pending = 0
+        self._skip_next = True
+        self._frame = 0
+        self._small = FramePool()
+        start = (start[0], start[1], min(start[2], max_stride))
+        self.level = self.modes.index(start) if start in self.modes else 0
+        self._detector()
+
+    @property
+    def mode(self):
+        return self.modes[self.level]
+
+    @property
+    def label(self):
+        """
+        Short description of the current mode for feedback overlays.
+        """
+        complexity, scale, stride = self.mode
+        return f"{MODEL_NAMES[complexity]} model, {int(round(scale * 100))}% input, stride <= {stride}"
+
+    @property
+    def cost_ms(self):
+        return 1000.0 * sum(self._costs) / len(self._costs) if self._costs else 0.0
+
+    def process(self, frame_idx, frame_bgr, rgb=None, telemetry=None):
+        """
+        rgb: the same frame already converted (see frame_buffers.rgb_view).
+        """
+        h, w = frame_bgr.shape[:2]
+        if self.stride is None:
+            self.stride = AdaptiveStride((w, h), max_stride=self.mode[2], exercise=self.exercise)
+        self._frame += 1
+        if not self.stride.due(frame_idx):
+            self._record(0.0)
+            return None
+
+        t0 = time.perf_counter()
+        _, scale, _ = self.mode
+        if scale < 1.0:
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            src = frame_bgr if rgb is None else rgb
+            small = cv2.resize(src, size, dst=self._small.take((size[1], size[0], 3)),
+                               interpolation=cv2.INTER_AREA)
+            frame_bgr, rgb = small, (None if rgb is None else readonly(small))
+        results = self._detector().detect(frame_bgr, telemetry, rgb)
+        elapsed = time.perf_counter() - t0
+        self.stride.observe(frame_idx, landmarks_to_array(results))
+
+        if self._skip_next:
+            self._skip_next = False  # warm-up after a switch: not representative
+        else:
+            self._record(elapsed)
+        return results
+
+    def report(self):
+        return {"mode": self.label, "model_complexity": self.mode[0], "downscale": self.mode[1],
+                "max_stride": self.mode[2], "detect_ms_per_frame": round(self.cost_ms, 2),
+                "budget_ms": round(self.budget_ms, 2), "switches": len(self.switches)}
+
+    def set_exercise(self, exercise):
+        self.exercise = exercise
+        if self.stride is not None:
+            self.stride.set_exercise(exercise)
+
+    def reset(self):
+        for detector in self.detectors.values():
+            detector.reset()
+        self.stride = None
+
+    def close(self):
+        for detector in self.detectors.values():
+            detector.close()
+        self.detectors = {}
+
+    def _detector(self):
+        complexity = self.mode[0]
+        while complexity not in self.detectors:
+            try:
+                self.detectors[complexity] = PoseDetector(**{**self.settings, "model_complexity": complexity})
+            except Exception as e:
+                # e.g. lite / heavy model not downloadable offline
+                print(f"auto_quality: model_complexity={complexity} unavailable ({e}); skipping")
+                rest = [m for m in self.modes if m[0] != complexity]
+                if not rest:
+                    raise
+                # Next cheaper mode that is left, else the cheapest one
+                after = [m for m in self.modes[self.level:] if m[0] != complexity]
+                self.modes = rest
+                self.level = rest.index(after[0]) if after else len(rest) - 1
+                complexity = self.mode[0]
+        return self.detectors[complexity]
+
+    def _record(self, seconds):
+        self._costs.append(seconds)
+        self._pending += 1
+        if self._pending < self.window:
+            return
+        self._pending = 0
+        cost = self.cost_ms
+        if cost > self.budget_ms and self.level + 1 < len(self.modes):
+            backoff = self._backoff.get(self.mode, BACKOFF_S)
+            self._blocked[self.mode] = self._frame + backoff * self.target_fps
+            self._backoff[self.mode] = min(2 * backoff, MAX_BACKOFF_S)
+            self._switch(self.level + 1, cost)
+        elif cost < UPGRADE_RATIO * self.budget_ms and self.level > 0:
+            self._calm += 1
+            better = self.modes[self.level - 1]
+            if self._calm >= UPGRADE_WINDOWS and self._frame >= self._blocked.get(better, 0):
+                self._switch(self.level - 1, cost)
+        else:
+            self._calm = 0
+
+    def _switch(self, level, cost):
+        old = self.mode
+        self.level = level
+        self._detector()
+        if self.mode != old:
+            self.switches.append({"frame": self._frame, "from": old, "to": self.mode,
+                                  "detect_ms_per_frame": round(cost, 2)})
+        self._costs.clear()
+        self._pending = 0
+        self._calm = 0
+        self._skip_next = True
+        if self.stride is not None:
+            self.stride.max_stride = self.mode[2]
+            self.stride.stride = min(self.stride.stride, self.mode[2])
@@ -0,0 +1,142 @@
+# src/batch_process.py
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import cv2
+import pandas as pd
+from pose_detector import PoseDetector
+from landmark_cache import LandmarkCache
+from main import process_video, EXERCISES, OUTPUT_DIR
+
+BATCH_OUT = os.path.join(OUTPUT_DIR, "batch")
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+# Leading summary.csv columns (every row has them, also failed ones);
+# an empty batch still writes a table with these
+SUMMARY_COLUMNS = ["video", "exercise", "name", "status"]
+
+# Per-worker state: one MediaPipe graph per process, never shared
+_worker = {}
+
+
+def collect_videos(source):
+    """
+    `source` is a directory (searched recursively) or a manifest text file
+    with one video path per line (relative to the manifest; '#' comments ok).
+    """
+    if os.path.isdir(source):
+        videos = []
+        for root, _, files in os.walk(source):
+            videos += [os.path.join(root, f) for f in files if f.lower().endswith(VIDEO_EXTS)]
+        return sorted(videos)
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [ln.strip() for ln in f]
+    return [ln if os.path.isabs(ln) else os.path.join(base, ln)
+            for ln in lines if ln and not ln.startswith("#")]
+
+
+def job_name(video_path, exercise):
+    """
+    Output file stem: video name + exercise + short hash of the video's full
+    path, so clips with the same name in different folders don't overwrite
+    each other and scoring a video as another exercise is a separate job.
+    """
+    stem = os.path.splitext(os.path.basename(video_path))[0].replace(" ", "_")
+    return f"{stem}_{exercise}_{hashlib.sha1(os.path.abspath(video_path).encode()).hexdigest()[:8]}"
+
+
+def _init_worker(settings, cache_dir):
+    # Workers already run in parallel; keep OpenCV from spawning its own pool
+    cv2.setNumThreads(1)
+    _worker["detector"] = PoseDetector(**settings)
+    _worker["cache"] = LandmarkCache(cache_dir) if cache_dir else None
+
+
+def _process_one(job):
+    video_path, out_dir, exercise = job
+    name = job_name(video_path, exercise)
+    row = {"video": video_path, "exercise": exercise, "name": name}
+    try:
+        _, summary = process_video(
+            video_path,
+            os.path.join(out_dir, name + "_annotated.mp4"),
+            os.path.join(out_dir, name + "_angles.csv"),
+            exercise=exercise,
+            cache=_worker["cache"],
+            detector=_worker["detector"]
+        )
+    except Exception as e:
+        return dict(row, status="error", error=str(e))
+
+    row = dict(row, status="ok", **summary)
+    # Summary file is the "done" marker used for resuming; write it last, atomically
+    done_path = os.path.join(out_dir, name + ".summary.json")
+    with open(done_path + ".tmp", "w") as f:
+        json.dump(row, f)
+    os.replace(done_path + ".tmp", done_path)
+    return row
+
+
+def run_batch(source, out_dir=BATCH_OUT, exercise="bicep_curl", workers=None,
+              detector_settings=None, cache_dir=None, resume=True):
+    """
+    Score every video from `source` in a process pool. Writes per-video
+    annotated mp4 + angles CSV and an aggregated summary.csv to out_dir.
+    With resume=True videos that already have a summary for this exercise
+    are skipped, so a crashed run can simply be started again.
+    """
+    if exercise not in EXERCISES:
+        raise ValueError(f"Unknown exercise: {exercise}")
+    os.makedirs(out_dir, exist_ok=True)
+    videos = collect_videos(source)
+
+    rows, jobs = [], []
+    for v in videos:
+        done_path = os.path.join(out_dir, job_name(v, exercise) + ".summary.json")
+        done = None
+        if resume and os.path.exists(done_path):
+            with open(done_path) as f:
+                done = json.load(f)
+        if done is not None and done.get("exercise") == exercise:
+            rows.append(done)
+        else:
+            jobs.append((v, out_dir, exercise))
+    print(f"{len(videos)} videos, {len(rows)} already done, {len(jobs)} to process")
+
+    if jobs:
+        settings = PoseDetector.resolve_settings(detector_settings)
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(settings, cache_dir)) as pool:
+            for i, row in enumerate(pool.imap_unordered(_process_one, jobs), 1):
+                print(f"[{i}/{len(jobs)}] {row['status']}: {row['video']}")
+                rows.append(row)
+
+    if not rows:
+        print(f"No videos found in {source}")
+    table = pd.DataFrame(rows, columns=None if rows else SUMMARY_COLUMNS)
+    table = table.sort_values("video").reset_index(drop=True)
+    table.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a directory or manifest of exercise videos")
+    parser.add_argument("source", help="video directory or manifest file (one path per line)")
+    parser.add_argument("--out", default=BATCH_OUT)
+    parser.add_argument("--exercise", default="bicep_curl", choices=list(EXERCISES))
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--model-complexity", type=int, default=1, choices=[0, 1, 2])
+    parser.add_argument("--roi", action="store_true",
+                        help="crop inference to the tracked person (faster on high-res sources)")
+    parser.add_argument("--cache-dir", default=None, help="landmark cache dir (optional)")
+    parser.add_argument("--no-resume", action="store_true", help="reprocess videos that are already done")
+    args = parser.parse_args()
+
+    table = run_batch(args.source, args.out, exercise=args.exercise, workers=args.workers,
+                      detector_settings={"model_complexity": args.model_complexity, "roi": args.roi},
+                      cache_dir=args.cache_dir, resume=not args.no_resume)
+    print(table.to_string(index=False))
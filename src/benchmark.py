@@ -0,0 +1,296 @@
+# src/benchmark.py
+"""
+Benchmark suite for the pose -> rules -> reps pipeline.
+
+Measures frames/sec and per-call latency percentiles for:
+  - PoseDetector.detect at each model_complexity on the bundled videos/*.mp4
+  - every compiled exercise from exercises.json (per frame and as one
+    batch, plus its measure stage alone) on a synthetic landmark stream
+  - smooth_series (savgol vs ema) and detect_reps_from_angle_series
+  - cold-start import time of the entry points (fresh interpreter each),
+    against eagerly importing every heavy dependency
+  - the per-frame flip -> RGB -> MediaPipe input -> display path at 720p
+    and 4K, allocating vs reusing frame_buffers
+plus peak RSS, and writes everything as JSON so runs can be diffed across
+commits. --golden also runs the golden-output check (golden.py) in the
+same run and stores its result under "golden", so a speedup is only
+accepted together with unchanged outputs.
+
+usage: python src/benchmark.py [--quick] [--skip-detect] [--skip-imports] [--golden] [--out FILE] [--compare OLD.json]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+from pose_detector import PoseDetector
+from rule_spec import load_exercises
+from utils import smooth_series, detect_reps_from_angle_series, to_pixel_coords
+from synthetic import synthetic_curl_landmarks
+from frame_buffers import FramePool, rgb_view
+
+VIDEO_GLOB = "videos/*.mp4"
+BENCH_DIR = os.path.join("output", "benchmarks")
+FRAME_SIZE = (1280, 720)
+BUFFER_SIZES = [(1280, 720), (3840, 2160)]
+
+# Cold-start targets: (name, statement timed in a fresh interpreter)
+IMPORT_TARGETS = [
+    ("eager mediapipe+cv2+scipy.signal+pandas", "import mediapipe, cv2, scipy.signal, pandas"),
+    ("scoring", "import scoring"),
+    ("scoring+prewarm", "import scoring; scoring.prewarm()"),
+    ("server", "import server"),
+    ("main", "import main"),
+]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def latency_stats(samples_s):
+    """
+    Per-call wall times (seconds) -> count, fps and latency percentiles (ms).
+    """
+    a = np.asarray(samples_s) * 1000.0
+    total = a.sum() / 1000.0
+    return {
+        "n": int(len(a)),
+        "total_s": float(total),
+        "fps": float(len(a) / total) if total else 0.0,
+        "mean_ms": float(a.mean()),
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "p99_ms": float(np.percentile(a, 99)),
+        "max_ms": float(a.max())
+    }
+
+
+def time_calls(fn, args_iter):
+    samples = []
+    for args in args_iter:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    return latency_stats(samples)
+
+
+def time_repeat(fn, repeat):
+    return time_calls(fn, [()] * repeat)
+
+
+def bench_detect(videos, max_frames, complexities=(0, 1, 2)):
+    frames = {}
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        buf = []
+        while len(buf) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            buf.append(frame)
+        cap.release()
+        frames[os.path.basename(path)] = buf
+
+    out = {}
+    for mc in complexities:
+        for name, buf in frames.items():
+            try:
+                detector = PoseDetector(model_complexity=mc)
+            except Exception as e:
+                # Lite/heavy models are downloaded on first use; may be unavailable offline
+                out[f"model_complexity={mc}/{name}"] = {"error": str(e)}
+                continue
+            detector.detect(buf[0])  # graph warm-up, not timed
+            stats = time_calls(detector.detect, [(f,) for f in buf[1:]])
+            detector.close()
+            stats["peak_rss_mb"] = peak_rss_mb()
+            out[f"model_complexity={mc}/{name}"] = stats
+    return out
+
+
+def bench_rules(landmarks, repeat):
+    px = to_pixel_coords(landmarks, *FRAME_SIZE)
+    out = {}
+    # Compiled exercise specs: one frame per call (live path) and whole
+    # stream; the measure stage alone shows what the checks cost on top
+    for name, ex in load_exercises().items():
+        out[f"exercise/{name}"] = time_calls(ex.evaluate, [(row,) for row in px[:repeat]])
+        for suffix, fn in (("batch", ex.evaluate), ("measure_batch", ex.measure)):
+            # One call scores every frame; report per-frame throughput
+            batch = time_repeat(lambda: fn(px), 20)
+            batch["frames_per_call"] = len(px)
+            batch["fps"] = len(px) / (batch["total_s"] / batch["n"])
+            out[f"exercise/{name}_{suffix}"] = batch
+    return out
+
+
+def bench_series(landmarks, repeat):
+    ex = load_exercises()["bicep_curl"]
+    values, _, _ = ex.evaluate(to_pixel_coords(landmarks, *FRAME_SIZE))
+    angles = ex.rep_values(values)["left"].copy()
+    angles[::50] = np.nan  # a few dropouts, like real sessions
+    smoothed = smooth_series(angles, "savgol")
+    out = {}
+    for method in ("savgol", "ema"):
+        stats = time_repeat(lambda: smooth_series(angles, method), repeat)
+        stats["series_len"] = len(angles)
+        out[f"smooth_series[{method}]"] = stats
+    stats = time_repeat(lambda: detect_reps_from_angle_series(smoothed, 60, 150, 9), repeat)
+    stats["series_len"] = len(smoothed)
+    stats["reps"] = detect_reps_from_angle_series(smoothed, 60, 150, 9)[0]
+    out["detect_reps_from_angle_series"] = stats
+    return out
+
+
+def bench_frames(repeat):
+    """
+    The GUI's per-frame copies without inference: flip, BGR -> RGB, the
+    MediaPipe input packet, and the display frame.
+    """
+    from mediapipe.python import packet_creator
+    from mediapipe.python._framework_bindings.image_frame import ImageFormat
+
+    def packet(rgb):
+        packet_creator.create_image_frame(data=rgb, image_format=ImageFormat.SRGB)
+
+    def allocating(frame):
+        flipped = cv2.flip(frame, 1)
+        packet(cv2.cvtColor(flipped, cv2.COLOR_BGR2RGB))  # writeable: MediaPipe copies
+        return cv2.cvtColor(flipped, cv2.COLOR_BGR2RGB)
+
+    display = FramePool(4)
+
+    def reusing(frame):
+        flipped = cv2.flip(frame, 1, dst=display.take(frame.shape))
+        rgb, rgb_ro = rgb_view(flipped, dst=flipped)
+        packet(rgb_ro)
+        return rgb
+
+    out = {}
+    for w, h in BUFFER_SIZES:
+        frame = np.random.default_rng(0).integers(0, 256, (h, w, 3), dtype=np.uint8)
+        for name, fn in (("allocate", allocating), ("buffers", reusing)):
+            fn(frame)
+            out[f"frames/{w}x{h}/{name}"] = time_repeat(lambda: fn(frame), repeat)
+    return out
+
+
+def bench_imports(repeat):
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    out = {}
+    for name, stmt in IMPORT_TARGETS:
+        code = f"import time; t = time.perf_counter(); {stmt}; print(time.perf_counter() - t)"
+        samples = []
+        for _ in range(repeat):
+            proc = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                break
+            samples.append(float(proc.stdout.strip().splitlines()[-1]))
+        out[name] = (latency_stats(samples) if len(samples) == repeat
+                     else {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]})
+    return out
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import mediapipe as mp
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "mediapipe": getattr(mp, "__version__", None)
+    }
+
+
+def run(quick=False, skip_detect=False, videos=None, skip_imports=False):
+    n_frames = 600 if quick else 3000
+    repeat = 20 if quick else 100
+    landmarks = synthetic_curl_landmarks(n_frames)
+    report = {"env": environment(), "results": {}}
+    if not skip_detect:
+        videos = videos or sorted(glob.glob(VIDEO_GLOB))
+        report["results"]["detect"] = bench_detect(videos, max_frames=30 if quick else 120)
+    report["results"]["rules"] = bench_rules(landmarks, repeat=min(n_frames, 10 * repeat))
+    report["results"]["series"] = bench_series(landmarks, repeat)
+    report["results"]["frames"] = bench_frames(repeat)
+    if not skip_imports:
+        report["results"]["imports"] = bench_imports(3 if quick else 5)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def compare(old, new, threshold=0.10):
+    """
+    fps ratio new/old for every entry in both reports; returns the entries
+    that got slower by more than `threshold` (as {name: ratio}).
+    """
+    slower = {}
+    for group, results in new["results"].items():
+        for name, st in results.items():
+            prev = old.get("results", {}).get(group, {}).get(name)
+            if not prev or "fps" not in prev or "fps" not in st or not prev["fps"]:
+                continue
+            ratio = st["fps"] / prev["fps"]
+            if ratio < 1 - threshold:
+                slower[f"{group}/{name}"] = ratio
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pose -> rules -> reps")
+    parser.add_argument("--quick", action="store_true", help="fewer frames / repeats")
+    parser.add_argument("--skip-detect", action="store_true", help="skip MediaPipe timings")
+    parser.add_argument("--skip-imports", action="store_true", help="skip cold-start import timings")
+    parser.add_argument("--out", default=None, help=f"JSON path (default: {BENCH_DIR}/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier report; exit 1 on >10%% fps regressions")
+    parser.add_argument("--golden", action="store_true",
+                        help="also diff outputs against golden/ (golden.py); exit 1 on any difference")
+    args = parser.parse_args()
+
+    report = run(quick=args.quick, skip_detect=args.skip_detect, skip_imports=args.skip_imports)
+    if args.golden:
+        import golden
+        report["golden"] = golden.check()
+    out = args.out or os.path.join(BENCH_DIR, f"{report['env']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for group, results in report["results"].items():
+        for name, st in results.items():
+            if "error" in st:
+                print(f"{group:>7} {name:<45} skipped: {st['error']}")
+                continue
+            print(f"{group:>7} {name:<45} {st['fps']:>12.1f} fps  p50 {st['p50_ms']:.3f} ms  "
+                  f"p99 {st['p99_ms']:.3f} ms")
+    print(f"peak RSS {report['peak_rss_mb']:.0f} MB -> {out}")
+
+    failed = False
+    if args.golden:
+        golden.print_report(report["golden"])
+        failed = not all(r["ok"] for r in report["golden"].values())
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(json.load(f), report)
+        for name, ratio in slower.items():
+            print(f"REGRESSION {name}: {ratio:.2f}x of previous fps")
+        failed = failed or bool(slower)
+    sys.exit(1 if failed else 0)
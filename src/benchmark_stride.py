@@ -0,0 +1,68 @@
+# src/benchmark_stride.py
+"""
+Adaptive-stride accuracy/speed check on the bundled clip.
+
+Runs process_video at full rate and with max_stride = 2, 3 and compares
+the strided output against full rate. Stated tolerance:
+  - rep counts (left and right): identical
+  - smoothed elbow angles: mean abs error <= 2 deg, max abs error <= 15 deg
+Exits non-zero if any stride breaks the tolerance.
+
+usage: python src/benchmark_stride.py [video]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from main import process_video
+
+VIDEO = "videos/bicep_curl.mp4"
+STRIDES = (2, 3)
+ANGLE_MAE_TOL = 2.0
+ANGLE_MAX_TOL = 15.0
+ANGLE_COLS = ["left_elbow_angle_smoothed", "right_elbow_angle_smoothed"]
+
+
+def _run(video, out_dir, max_stride):
+    stats = {}
+    t0 = time.perf_counter()
+    df, summary = process_video(video, os.path.join(out_dir, f"s{max_stride}.mp4"),
+                                os.path.join(out_dir, f"s{max_stride}.csv"),
+                                stage_stats=stats, max_stride=max_stride)
+    wall = time.perf_counter() - t0
+    inferred = stats["infer"].get("inferred", summary["frames"])
+    return df, summary, wall, inferred
+
+
+def run(video=VIDEO):
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        base_df, base, base_wall, _ = _run(video, out_dir, 1)
+        for k in STRIDES:
+            df, summary, wall, inferred = _run(video, out_dir, k)
+            err = np.abs(df[ANGLE_COLS].to_numpy() - base_df[ANGLE_COLS].to_numpy())
+            res = {
+                "max_stride": k,
+                "inferred_frames": inferred,
+                "frames": summary["frames"],
+                "inference_saved": 1 - inferred / summary["frames"],
+                "wall_s": wall,
+                "speedup": base_wall / wall,
+                "reps": [summary["reps_left"], summary["reps_right"]],
+                "angle_mae": float(np.nanmean(err)),
+                "angle_max_err": float(np.nanmax(err))
+            }
+            res["ok"] = (res["reps"] == [base["reps_left"], base["reps_right"]]
+                         and res["angle_mae"] <= ANGLE_MAE_TOL
+                         and res["angle_max_err"] <= ANGLE_MAX_TOL)
+            results.append(res)
+    return {"video": video, "full_rate_wall_s": base_wall,
+            "full_rate_reps": [base["reps_left"], base["reps_right"]], "strided": results}
+
+
+if __name__ == "__main__":
+    report = run(sys.argv[1] if len(sys.argv) > 1 else VIDEO)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(r["ok"] for r in report["strided"]) else 1)
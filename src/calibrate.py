@@ -0,0 +1,293 @@
+# src/calibrate.py
+"""
+Threshold calibration over labelled sessions that were already processed
+once: landmarks come from the LandmarkCache (by video) or a session
+directory (session_store), so no inference is re-run.
+
+For every exercise in the manifest it sweeps
+  - the rep counter's up / down thresholds and min gap against the true
+    rep counts, and
+  - the thresholds of every rule check in exercises.json against per-frame
+    good / bad labels (balanced accuracy, both sides pooled),
+and reports the best settings next to the current ones. Each grid is
+evaluated in one go: rule checks as (settings x frames) array comparisons,
+the rep counter as one vectorized step per frame over all settings
+(utils.count_reps_grid). Sessions are spread over a process pool.
+
+Manifest (JSON):
+
+    {"sessions": [
+      {"exercise": "bicep_curl",
+       "video": "videos/bicep_curl.mp4",        # cached landmarks, or
+       "session": "output/session",             # a session directory
+       "reps": {"left": 3, "right": 3},         # or one int for both sides
+       "labels": "labels/bicep_curl.csv"}       # optional
+    ]}
+
+labels: a CSV with a "good" column (1 / 0, empty = unlabelled) and
+optionally one column per rule name for rule-specific labels, one row per
+frame; or an inline list of 1 / 0 / null.
+
+usage: python src/calibrate.py MANIFEST [--cache-dir DIR] [--workers N] [--out FILE]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from pose_detector import PoseDetector
+from landmark_cache import LandmarkCache, CACHE_DIR
+from session_store import SessionReader
+from rule_spec import load_spec, load_exercises, SPEC_PATH
+from utils import (
+    count_reps_grid, smooth_series, to_pixel_coords,
+    REP_MIN_GAP_S, SMOOTH_WINDOW, SMOOTH_POLY
+)
+
+# Sweep ranges: +/- span around the current value in steps of step
+REP_SPAN, REP_STEP = 30.0, 2.0
+MIN_GAP_S = [0.1, 0.2, 0.3, 0.4, 0.5, 0.75]
+RULE_GRID = {"angle": (30.0, 2.0), "dy": (20.0, 1.0), "abs_dy": (20.0, 1.0), "tilt": (20.0, 1.0)}
+OPS = ("le", "lt", "ge", "gt")
+
+
+def _offsets(span, step):
+    n = int(round(span / step))
+    return np.arange(-n, n + 1) * step
+
+
+def rep_grid(ex):
+    """
+    Flat (up, down, min_gap_s) candidate arrays around the exercise's settings.
+    """
+    up, down, gap = np.meshgrid(ex.rep_up + _offsets(REP_SPAN, REP_STEP),
+                                ex.rep_down + _offsets(REP_SPAN, REP_STEP),
+                                np.asarray(MIN_GAP_S), indexing="ij")
+    return up.ravel(), down.ravel(), gap.ravel()
+
+
+def rule_grids(ex, spec):
+    """
+    {rule name: (checks [(op, ok)], otherwise ok, thresholds (G, k))} for
+    every rule of the exercise that has checks.
+    """
+    grids = {}
+    for name in dict.fromkeys(ex.rule_names):
+        rule = spec["rules"][name]
+        checks = [(next(op for op in OPS if op in c), bool(c["ok"])) for c in rule.get("checks", [])]
+        if not checks:
+            continue
+        span, step = RULE_GRID[rule["measure"]]
+        axes = [float(c[op]) + _offsets(span, step) for c, (op, _) in zip(rule["checks"], checks)]
+        thresholds = np.stack([a.ravel() for a in np.meshgrid(*axes, indexing="ij")], axis=1)
+        grids[name] = (checks, bool(rule.get("otherwise", {}).get("ok", False)), thresholds)
+    return grids
+
+
+def rule_ok_grid(values, checks, otherwise_ok, thresholds):
+    """
+    Verdict of one rule for every threshold setting and frame: (G, N) bools.
+    Same first-passing-check semantics as rule_spec.Exercise.evaluate.
+    """
+    v = values[None, :]
+    ok = np.full((len(thresholds), len(values)), otherwise_ok)
+    for j in reversed(range(len(checks))):
+        op, check_ok = checks[j]
+        t = thresholds[:, j, None]
+        hit = v <= t if op == "le" else v < t if op == "lt" else v >= t if op == "ge" else v > t
+        ok = np.where(hit, check_ok, ok)
+    return ok
+
+
+def load_landmarks(entry, cache_dir=CACHE_DIR):
+    """
+    (landmarks (N, 33, 4), meta with fps / width / height) of a manifest entry.
+    """
+    if entry.get("session"):
+        reader = SessionReader(entry["session"])
+        return reader.read(columns=("landmarks",))["landmarks"], reader.meta
+    settings = PoseDetector.resolve_settings(entry.get("detector_settings"))
+    hit = LandmarkCache(cache_dir).load(entry["video"], settings)
+    if hit is None:
+        raise RuntimeError(f"No cached landmarks for {entry['video']}; "
+                           "run main.py or batch_process.py with a landmark cache first")
+    return hit
+
+
+def load_labels(entry, n):
+    """
+    {"good": (N,) float, <rule name>: (N,) float, ...}; NaN = unlabelled.
+    """
+    labels = entry.get("labels")
+    if labels is None:
+        return {}
+    if isinstance(labels, list):
+        cols = {"good": labels}
+    else:
+        df = pd.read_csv(labels)
+        cols = {c: df[c] for c in df.columns if c != "frame"}
+    out = {}
+    for name, col in cols.items():
+        a = np.full(n, np.nan)
+        col = pd.to_numeric(pd.Series(col), errors="coerce").to_numpy(dtype=float)[:n]
+        a[:len(col)] = col
+        out[name] = a
+    return out
+
+
+def evaluate_session(job):
+    """
+    Pool worker: per-setting rep errors and rule confusion counts of one session.
+    """
+    entry, cache_dir, spec_path = job
+    spec = load_spec(spec_path)
+    ex = load_exercises(spec=spec)[entry["exercise"]]
+    landmarks, meta = load_landmarks(entry, cache_dir)
+    values, _, _ = ex.evaluate(to_pixel_coords(landmarks, meta["width"], meta["height"]))
+    out = {"exercise": entry["exercise"], "frames": len(landmarks), "rules": {}}
+
+    truth = entry.get("reps")
+    if truth is not None:
+        truth = truth if isinstance(truth, dict) else {"left": truth, "right": truth}
+        up, down, gap_s = rep_grid(ex)
+        err = np.zeros(len(up))
+        sides = 0
+        for side, series in ex.rep_values(values).items():
+            if truth.get(side) is None:
+                continue
+            smoothed = smooth_series(series, "savgol", SMOOTH_WINDOW, SMOOTH_POLY)
+            counts = count_reps_grid(smoothed, up, down, (gap_s * meta["fps"]).astype(int))
+            err += np.abs(counts - truth[side])
+            sides += 1
+        out["rep_error"], out["rep_sides"] = err, sides
+
+    labels = load_labels(entry, len(landmarks))
+    if labels:
+        for name, (checks, otherwise_ok, thresholds) in rule_grids(ex, spec).items():
+            label = labels.get(name, labels.get("good"))
+            if label is None:
+                continue
+            cols = [i for i, r in enumerate(ex.rule_names) if r == name]
+            v = values[:, cols].T.ravel()
+            y = np.tile(label, len(cols))
+            keep = ~np.isnan(v) & ~np.isnan(y)
+            pred = rule_ok_grid(v[keep], checks, otherwise_ok, thresholds)
+            good = y[keep] > 0.5
+            # Confusion counts per setting, "good form" as the positive class
+            tp = (pred & good).sum(axis=1)
+            fp = (pred & ~good).sum(axis=1)
+            out["rules"][name] = np.stack([tp, good.sum() - tp, fp, (~good).sum() - fp], axis=1)
+    return out
+
+
+def _balanced_accuracy(conf):
+    tp, fn, fp, tn = conf.T.astype(float)
+    pos, neg = tp + fn, tn + fp
+    if pos[0] and neg[0]:
+        return (tp / pos + tn / neg) / 2
+    return (tp + tn) / (pos + neg)
+
+
+def _best(score, distance):
+    # Highest score; ties go to the setting closest to the current one
+    return int(np.lexsort((distance, -score))[0])
+
+
+def calibrate(manifest, cache_dir=CACHE_DIR, workers=None, spec_path=SPEC_PATH):
+    """
+    Sweeps every exercise in the manifest; returns {exercise: report}.
+    """
+    with open(manifest) as f:
+        entries = json.load(f)["sessions"]
+    jobs = [(e, cache_dir, spec_path) for e in entries]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(evaluate_session, jobs)
+    else:
+        results = [evaluate_session(j) for j in jobs]
+
+    spec = load_spec(spec_path)
+    exercises = load_exercises(spec=spec)
+    report = {}
+    for name in dict.fromkeys(r["exercise"] for r in results):
+        ex = exercises[name]
+        runs = [r for r in results if r["exercise"] == name]
+        rep = {"sessions": len(runs), "frames": int(sum(r["frames"] for r in runs))}
+
+        rep_runs = [r for r in runs if "rep_error" in r]
+        if rep_runs:
+            up, down, gap_s = rep_grid(ex)
+            err = np.sum([r["rep_error"] for r in rep_runs], axis=0)
+            err[up >= down] = np.inf
+            dist = (np.abs(up - ex.rep_up) + np.abs(down - ex.rep_down)) / REP_STEP \
+                + np.abs(gap_s - REP_MIN_GAP_S) / 0.1
+            best = _best(-err, dist)
+            current = int(np.argmin(dist))
+            rep["reps"] = {
+                "settings": len(up),
+                "current": {"up": ex.rep_up, "down": ex.rep_down, "min_gap_s": REP_MIN_GAP_S,
+                            "abs_error": float(err[current])},
+                "best": {"up": float(up[best]), "down": float(down[best]),
+                         "min_gap_s": float(gap_s[best]), "abs_error": float(err[best])},
+                "sides": int(sum(r["rep_sides"] for r in rep_runs))
+            }
+
+        grids = rule_grids(ex, spec)
+        rules = {}
+        for rule_name, (checks, _, thresholds) in grids.items():
+            confs = [r["rules"][rule_name] for r in runs if rule_name in r["rules"]]
+            if not confs:
+                continue
+            conf = np.sum(confs, axis=0)
+            score = _balanced_accuracy(conf)
+            current_t = np.array([float(c[op]) for c, (op, _) in
+                                  zip(spec["rules"][rule_name]["checks"], checks)])
+            dist = np.abs(thresholds - current_t).sum(axis=1)
+            best = _best(score, dist)
+            current = int(np.argmin(dist))
+            rules[rule_name] = {
+                "settings": len(thresholds),
+                "labelled": int(conf[0].sum()),
+                "current": {"thresholds": [[op, t] for (op, _), t in zip(checks, current_t.tolist())],
+                            "score": float(score[current])},
+                "best": {"thresholds": [[op, t] for (op, _), t in zip(checks, thresholds[best].tolist())],
+                         "score": float(score[best])}
+            }
+        rep["rules"] = rules
+        report[name] = rep
+    return report
+
+
+def print_report(report):
+    for name, rep in report.items():
+        print(f"{name}: {rep['sessions']} sessions, {rep['frames']} frames")
+        if "reps" in rep:
+            cur, best = rep["reps"]["current"], rep["reps"]["best"]
+            print(f"  reps ({rep['reps']['settings']} settings): up {cur['up']:g} -> {best['up']:g}, "
+                  f"down {cur['down']:g} -> {best['down']:g}, min gap {cur['min_gap_s']:g} -> "
+                  f"{best['min_gap_s']:g} s; abs error {cur['abs_error']:g} -> {best['abs_error']:g} "
+                  f"over {rep['reps']['sides']} sides")
+        for rule_name, r in rep["rules"].items():
+            cur, best = r["current"], r["best"]
+            changes = ", ".join(f"{op} {t0:g} -> {t:g}"
+                                for (op, t0), (_, t) in zip(cur["thresholds"], best["thresholds"]))
+            print(f"  {rule_name} ({r['settings']} settings, {r['labelled']} labelled): {changes}; "
+                  f"balanced accuracy {cur['score']:.3f} -> {best['score']:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep rep / rule thresholds over labelled sessions")
+    parser.add_argument("manifest", help="JSON manifest of labelled sessions")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="landmark cache used for 'video' entries")
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--spec", default=SPEC_PATH, help="exercise spec to calibrate")
+    parser.add_argument("--out", default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = calibrate(args.manifest, args.cache_dir, args.workers, args.spec)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
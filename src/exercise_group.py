@@ -0,0 +1,39 @@
+# src/exercise_group.py
+import sys
+import cv2
+from multi_person import MultiPersonTracker, draw_tracks
+
+# Webcam by default, or a video file: python src/exercise_group.py class.mp4
+SOURCE = sys.argv[1] if len(sys.argv) > 1 else 0
+MAX_PEOPLE = 4
+
+cap = cv2.VideoCapture(SOURCE)
+if not cap.isOpened():
+    raise RuntimeError(f"Cannot open {SOURCE}")
+
+fps = cap.get(cv2.CAP_PROP_FPS) or 30
+# One pose graph per person; new people are picked up every half second
+tracker = MultiPersonTracker(max_people=MAX_PEOPLE, search_every=int(fps // 2) or 1, fps=fps)
+
+print("Press 'q' to quit.")
+
+while True:
+    ret, frame = cap.read()
+    if not ret:
+        break
+
+    tracks = tracker.update(frame)
+    draw_tracks(frame, tracks)
+    cv2.putText(frame, f"People: {sum(tr.visible for tr in tracks)}", (20, 40),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
+
+    cv2.imshow("Group Exercise Form Detection", frame)
+    key = cv2.waitKey(1)
+    if key == ord('q') or cv2.getWindowProperty("Group Exercise Form Detection", cv2.WND_PROP_VISIBLE) < 1:
+        break
+
+for tr in tracker.tracks:
+    print(f"Person #{tr.id}: reps L:{tr.reps['left']} R:{tr.reps['right']}")
+cap.release()
+cv2.destroyAllWindows()
+tracker.close()
@@ -1,200 +1,385 @@
-# src/exercise_gui.py
-import cv2
-import mediapipe as mp
-import tkinter as tk
-from tkinter import ttk, messagebox
-from threading import Thread
-from PIL import Image, ImageTk
-from form_rules import rule_bicep_elbow_angle, rule_tricep_extension
-
-# Map exercise to tutorial video path
-EXERCISE_VIDEOS = {
-    "bicep_curl": "D:/exercise-form-detection/videos/bicep_curl.mp4",
-    "tricep_curl": "D:/exercise-form-detection/videos/tricep curl.mp4"
-}
-
-class ExerciseApp:
-    def __init__(self, master):
-        self.master = master
-        self.master.title("Exercise Form Corrector")
-        self.master.geometry("1200x600")
-        self.running = False
-        self.cap = None
-        self.video_cap = None
-        self.mp_pose = mp.solutions.pose
-        self.mp_draw = mp.solutions.drawing_utils
-
-        # --- Left frame: Camera feed ---
-        self.left_frame = tk.Frame(master)
-        self.left_frame.pack(side=tk.LEFT, padx=10)
-
-        self.canvas = tk.Canvas(self.left_frame, width=640, height=480)
-        self.canvas.pack()
-
-        # --- Middle frame: Steps & Feedback ---
-        self.middle_frame = tk.Frame(master)
-        self.middle_frame.pack(side=tk.LEFT, fill=tk.Y, padx=10)
-
-        tk.Label(self.middle_frame, text="Select Exercise:").pack(pady=5)
-        self.exercise_var = tk.StringVar(value="bicep_curl")
-        self.dropdown = ttk.Combobox(self.middle_frame, textvariable=self.exercise_var)
-        self.dropdown['values'] = ["bicep_curl", "tricep_curl"]
-        self.dropdown.pack(pady=5)
-        self.dropdown.bind("<<ComboboxSelected>>", self.change_exercise)
-
-        self.start_btn = tk.Button(self.middle_frame, text="Start Camera", command=self.start_camera)
-        self.start_btn.pack(pady=5)
-
-        self.stop_btn = tk.Button(self.middle_frame, text="Stop Camera", command=self.stop_camera)
-        self.stop_btn.pack(pady=5)
-
-        self.reset_btn = tk.Button(self.middle_frame, text="Reset Reps", command=self.reset_reps)
-        self.reset_btn.pack(pady=5)
-
-        # Feedback
-        self.feedback_var = tk.StringVar(value="Feedback will appear here")
-        self.feedback_label = tk.Label(self.middle_frame, textvariable=self.feedback_var, fg="blue")
-        self.feedback_label.pack(pady=10)
-
-        # Rep counter
-        self.reps_var = tk.StringVar(value="Reps: 0")
-        self.reps_label = tk.Label(self.middle_frame, textvariable=self.reps_var, fg="green", font=("Arial", 14))
-        self.reps_label.pack(pady=10)
-
-        # Exercise steps
-        self.steps_text = tk.Text(self.middle_frame, height=20, width=30)
-        self.steps_text.pack(pady=10)
-        self.update_exercise_steps()
-
-        # --- Right frame: Video playback ---
-        self.right_frame = tk.Frame(master)
-        self.right_frame.pack(side=tk.LEFT, padx=10)
-
-        tk.Label(self.right_frame, text="Tutorial Video:").pack(pady=5)
-        self.video_canvas = tk.Canvas(self.right_frame, width=320, height=240, bg="black")
-        self.video_canvas.pack()
-
-        # Internal variables
-        self.current_angle = 0
-        self.direction = 0  # 0=down, 1=up
-        self.reps = 0
-
-        self.current_video_path = EXERCISE_VIDEOS[self.exercise_var.get()]
-        Thread(target=self.video_loop, daemon=True).start()
-
-    def update_exercise_steps(self):
-        ex = self.exercise_var.get()
-        self.steps_text.delete("1.0", tk.END)
-        if ex == "bicep_curl":
-            steps = "Bicep Curl Steps:\n1. Stand straight\n2. Hold dumbbell\n3. Curl up slowly\n4. Lower slowly\n5. Keep elbows close to body"
-        elif ex == "tricep_curl":
-            steps = "Tricep Extension Steps:\n1. Hold dumbbell overhead\n2. Lower behind head\n3. Extend back up\n4. Keep elbows fixed"
-        else:
-            steps = "No steps available"
-        self.steps_text.insert(tk.END, steps)
-
-    def change_exercise(self, event):
-        ex = self.exercise_var.get()
-        self.update_exercise_steps()
-        if ex in EXERCISE_VIDEOS:
-            self.current_video_path = EXERCISE_VIDEOS[ex]
-
-    def start_camera(self):
-        if not self.running:
-            self.running = True
-            self.cap = cv2.VideoCapture(0)
-            Thread(target=self.camera_loop, daemon=True).start()
-        else:
-            messagebox.showinfo("Info", "Camera already running")
-
-    def stop_camera(self):
-        self.running = False
-        if self.cap:
-            self.cap.release()
-        cv2.destroyAllWindows()
-        self.feedback_var.set("Camera stopped")
-        self.reps_var.set(f"Reps: {self.reps}")
-
-    def reset_reps(self):
-        self.reps = 0
-        self.direction = 0
-        self.reps_var.set("Reps: 0")
-
-    def camera_loop(self):
-        pose = self.mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-        while self.running and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-
-            frame = cv2.flip(frame, 1)
-            h, w, _ = frame.shape
-            imgRGB = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(imgRGB)
-
-            feedback_text = ""
-            if results.pose_landmarks:
-                landmarks_px = [(int(p.x * w), int(p.y * h)) for p in results.pose_landmarks.landmark]
-                ex = self.exercise_var.get()
-                if ex == "bicep_curl":
-                    ok, msg, angle = rule_bicep_elbow_angle(landmarks_px, side="left")
-                elif ex == "tricep_curl":
-                    ok, msg, angle = rule_tricep_extension(landmarks_px, side="left")
-                else:
-                    ok, msg, angle = False, "Exercise not implemented", 0
-
-                feedback_text = msg
-                self.current_angle = angle
-
-                if ex in ["bicep_curl", "tricep_curl"]:
-                    if angle < 40 and self.direction == 0:
-                        self.direction = 1
-                    if angle > 160 and self.direction == 1:
-                        self.direction = 0
-                        self.reps += 1
-                        self.reps_var.set(f"Reps: {self.reps}")
-
-                self.mp_draw.draw_landmarks(frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
-                cv2.putText(frame, f"{int(angle)}°", (50,50), cv2.FONT_HERSHEY_SIMPLEX, 1.2,
-                            (0,255,0) if ok else (0,0,255), 3)
-
-            self.feedback_var.set(feedback_text)
-            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(img)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.canvas.create_image(0,0,anchor=tk.NW, image=imgtk)
-            self.canvas.image = imgtk
-
-        if self.cap:
-            self.cap.release()
-        cv2.destroyAllWindows()
-        self.running = False
-
-    def video_loop(self):
-        last_video_path = None
-        while True:
-            if self.current_video_path != last_video_path:
-                if self.video_cap:
-                    self.video_cap.release()
-                self.video_cap = cv2.VideoCapture(self.current_video_path)
-                last_video_path = self.current_video_path
-
-            if self.video_cap and self.video_cap.isOpened():
-                ret, frame = self.video_cap.read()
-                if not ret:
-                    self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-
-                frame = cv2.resize(frame, (320, 240))
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.video_canvas.create_image(0, 0, anchor=tk.NW, image=imgtk)
-                self.video_canvas.image = imgtk
-
-            cv2.waitKey(30)
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = ExerciseApp(root)
-    root.mainloop()
+# src/exercise_gui.py
+import os
+import queue
+import cv2
+import mediapipe as mp
+import tkinter as tk
+from tkinter import ttk, messagebox
+import time
+from threading import Thread
+from PIL import Image, ImageTk
+from rule_spec import load_exercises
+from form_rules import FormScorer
+from rep_analytics import JsonLinesSink
+from pose_detector import landmarks_to_array
+from auto_quality import QualityController
+from motion_gate import MotionGate
+from reference_motion import TemplateStore, ReferenceMatcher
+from tutorial_cache import TutorialClipCache
+from pipeline import LatestFrame
+from telemetry import Telemetry
+from frame_buffers import FramePool, rgb_view
+
+# Map exercise to tutorial video path
+EXERCISE_VIDEOS = {
+    "bicep_curl": "D:/exercise-form-detection/videos/bicep_curl.mp4",
+    "tricep_curl": "D:/exercise-form-detection/videos/tricep curl.mp4"
+}
+
+# Max frames between pose inferences in slow phases (1 = every frame)
+MAX_STRIDE = 3
+
+# Pose model / input size / stride are scaled to hold this rate (None: the
+# camera's fps); the chosen mode is shown under the feedback
+TARGET_FPS = None
+
+# Skip inference while the camera image is static or nobody is in view
+# (see motion_gate)
+USE_MOTION_GATE = True
+
+# How often the Tk main thread polls for new frames to draw
+RENDER_INTERVAL_MS = 15
+
+# Camera frames handed to the Tk thread are recycled after this many more
+# frames (one being drawn, one waiting in camera_slot, one being filled)
+DISPLAY_BUFFERS = 4
+
+# Opt-in stage timings: overlay on the camera feed + a JSON log line every 10 s
+ENABLE_TELEMETRY = False
+
+# Per-rep metrics (ROM, tempo, time under tension, rule failures), one
+# JSON line per completed rep (None: off). Same policy as the live script:
+# the file is appended to, every line carries its exercise and the start
+# time of the camera session it belongs to (rep numbers restart per session)
+REPS_OUT = os.path.join("output", "gui_reps.jsonl")
+
+
+class ExerciseApp:
+    def __init__(self, master):
+        self.master = master
+        self.master.title("Exercise Form Corrector")
+        self.master.geometry("1200x600")
+        self.running = False
+        self.cap = None
+        self.tutorial_cache = TutorialClipCache(size=(320, 240))
+        # Rules, steps and rep thresholds per exercise (exercises.json)
+        self.exercises = load_exercises()
+        self.mp_pose = mp.solutions.pose
+        self.mp_draw = mp.solutions.drawing_utils
+        # Annotations are drawn on the RGB frame: MediaPipe's default red as RGB
+        self.landmark_style = self.mp_draw.DrawingSpec(color=(255, 0, 0))
+
+        # --- Left frame: Camera feed ---
+        self.left_frame = tk.Frame(master)
+        self.left_frame.pack(side=tk.LEFT, padx=10)
+
+        self.canvas = tk.Canvas(self.left_frame, width=640, height=480)
+        self.canvas.pack()
+        self.canvas_item = self.canvas.create_image(0, 0, anchor=tk.NW)
+
+        # --- Middle frame: Steps & Feedback ---
+        self.middle_frame = tk.Frame(master)
+        self.middle_frame.pack(side=tk.LEFT, fill=tk.Y, padx=10)
+
+        tk.Label(self.middle_frame, text="Select Exercise:").pack(pady=5)
+        self.exercise_var = tk.StringVar(value="bicep_curl")
+        self.dropdown = ttk.Combobox(self.middle_frame, textvariable=self.exercise_var)
+        self.dropdown['values'] = list(self.exercises)
+        self.dropdown.pack(pady=5)
+        self.dropdown.bind("<<ComboboxSelected>>", self.change_exercise)
+
+        self.start_btn = tk.Button(self.middle_frame, text="Start Camera", command=self.start_camera)
+        self.start_btn.pack(pady=5)
+
+        self.stop_btn = tk.Button(self.middle_frame, text="Stop Camera", command=self.stop_camera)
+        self.stop_btn.pack(pady=5)
+
+        self.reset_btn = tk.Button(self.middle_frame, text="Reset Reps", command=self.reset_reps)
+        self.reset_btn.pack(pady=5)
+
+        # Feedback
+        self.feedback_var = tk.StringVar(value="Feedback will appear here")
+        self.feedback_label = tk.Label(self.middle_frame, textvariable=self.feedback_var, fg="blue")
+        self.feedback_label.pack(pady=10)
+
+        # Rep counter
+        self.reps_var = tk.StringVar(value="Reps L: 0  R: 0")
+        self.reps_label = tk.Label(self.middle_frame, textvariable=self.reps_var, fg="green", font=("Arial", 14))
+        self.reps_label.pack(pady=10)
+
+        # Exercise steps
+        self.steps_text = tk.Text(self.middle_frame, height=20, width=30)
+        self.steps_text.pack(pady=10)
+        self.update_exercise_steps()
+
+        # --- Right frame: Video playback ---
+        self.right_frame = tk.Frame(master)
+        self.right_frame.pack(side=tk.LEFT, padx=10)
+
+        tk.Label(self.right_frame, text="Tutorial Video:").pack(pady=5)
+        self.video_canvas = tk.Canvas(self.right_frame, width=320, height=240, bg="black")
+        self.video_canvas.pack()
+        self.video_canvas_item = self.video_canvas.create_image(0, 0, anchor=tk.NW)
+
+        # Internal variables
+        self.current_angle = 0
+        self.fps = 30
+        # Rules, reps and per-rep analytics: the same FormScorer as the
+        # live script and the server (offline smoothing + hysteresis)
+        self.scorer = FormScorer(self.exercises[self.exercise_var.get()], self.fps)
+        # Reps are also scored against the tutorial clip's motion (see
+        # reference_motion); templates are built in the background
+        self.templates = TemplateStore()
+        self.matcher = None
+        self.match_text = ""
+        self._template = None
+        # Exercise changes and rep resets from the Tk thread; the camera
+        # thread applies them between frames (scorer / matcher are its own)
+        self._requests = queue.SimpleQueue()
+
+        # Worker threads only fill these; all Tk calls happen in render()
+        self.camera_slot = LatestFrame()
+        self.video_slot = LatestFrame()
+
+        self.current_video_path = EXERCISE_VIDEOS[self.exercise_var.get()]
+        Thread(target=self.video_loop, daemon=True).start()
+        self.master.after(RENDER_INTERVAL_MS, self.render)
+
+    def update_exercise_steps(self):
+        ex = self.exercises.get(self.exercise_var.get())
+        self.steps_text.delete("1.0", tk.END)
+        if ex is not None and ex.steps:
+            steps = f"{ex.title} Steps:\n" + "\n".join(f"{i}. {step}" for i, step in enumerate(ex.steps, 1))
+        else:
+            steps = "No steps available"
+        self.steps_text.insert(tk.END, steps)
+
+    def change_exercise(self, event):
+        ex = self.exercise_var.get()
+        self.update_exercise_steps()
+        # Rules and rep thresholds differ per exercise: start counting afresh
+        self._requests.put(("exercise", ex))
+        self.reps_var.set("Reps L: 0  R: 0")
+        if ex in EXERCISE_VIDEOS:
+            self.current_video_path = EXERCISE_VIDEOS[ex]
+        self.load_reference()
+
+    def load_reference(self):
+        """
+        Builds (or loads the cached) reference-motion template of the
+        selected exercise's tutorial clip on a worker thread; the camera
+        loop picks it up.
+        """
+        ex = self.exercises[self.exercise_var.get()]
+        path = EXERCISE_VIDEOS.get(ex.name)
+        if path is None or not os.path.exists(path):
+            return
+
+        def build():
+            try:
+                self._template = self.templates.get(path, ex)
+            except (RuntimeError, ValueError) as e:
+                print(f"No reference motion for {ex.name}: {e}")
+        Thread(target=build, daemon=True).start()
+
+    def start_camera(self):
+        if not self.running:
+            self.running = True
+            self.cap = cv2.VideoCapture(0)
+            Thread(target=self.camera_loop, daemon=True).start()
+        else:
+            messagebox.showinfo("Info", "Camera already running")
+
+    def stop_camera(self):
+        self.running = False
+        if self.cap:
+            self.cap.release()
+        cv2.destroyAllWindows()
+        self.feedback_var.set("Camera stopped")
+        self.reps_var.set(self.reps_text())
+
+    def reps_text(self):
+        reps = self.scorer.reps
+        return f"Reps L: {reps['left']}  R: {reps['right']}"
+
+    def reset_reps(self):
+        self._requests.put(("reset", None))
+        self.reps_var.set("Reps L: 0  R: 0")
+
+    def apply_requests(self, fps):
+        """
+        Camera thread, between frames: exercise changes and rep resets queued
+        by the Tk thread, so they never land in the middle of score() / push().
+        """
+        while True:
+            try:
+                kind, ex = self._requests.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "exercise":
+                self.scorer = FormScorer(self.exercises[ex], fps)
+                self.matcher = None
+                self.match_text = ""
+            else:
+                self.scorer.reset()
+                if self.matcher is not None:
+                    self.matcher.reset(first_frame=self.scorer.analytics.frames)
+
+    def camera_loop(self):
+        frame_idx = 0
+        results = None
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.fps = fps
+        self.scorer = FormScorer(self.exercises[self.exercise_var.get()], fps)
+        quality = QualityController(TARGET_FPS or fps, max_stride=MAX_STRIDE,
+                                    settings={"min_detection_confidence": 0.5,
+                                              "min_tracking_confidence": 0.5},
+                                    exercise=self.scorer.exercise)
+        gate = MotionGate(fps) if USE_MOTION_GATE else None
+        rep_sink = None
+        if REPS_OUT:
+            os.makedirs(os.path.dirname(REPS_OUT), exist_ok=True)
+            rep_sink = JsonLinesSink(REPS_OUT, append=True, session=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        self.telemetry = telemetry = Telemetry(enabled=ENABLE_TELEMETRY, expected_fps=fps)
+        slot_dropped = self.camera_slot.dropped
+        self.matcher = None
+        self.match_text = ""
+        self.load_reference()
+        # Capture, flip and one in-place RGB conversion into reused buffers;
+        # inference, annotation and display all share that RGB frame
+        capture = FramePool()
+        display = FramePool(DISPLAY_BUFFERS)
+        while self.running and self.cap.isOpened():
+            t = telemetry.clock()
+            ret, captured = capture.read(self.cap)
+            if not ret:
+                break
+            t = telemetry.lap("capture", t)
+
+            frame = cv2.flip(captured, 1, dst=display.take(captured.shape))
+            frame, frame_ro = rgb_view(frame, dst=frame)
+            t = telemetry.lap("color_convert", t)
+            h, w, _ = frame.shape
+            self.apply_requests(fps)
+            scorer = self.scorer
+            if quality.exercise is not scorer.exercise:
+                # Exercise changed: the stride follows the new rep rule
+                quality.set_exercise(scorer.exercise)
+            inferred = None
+            if gate is None or gate.due(frame):
+                inferred = quality.process(frame_idx, frame, rgb=frame_ro)
+            if inferred is not None:
+                results = inferred
+                if gate is not None:
+                    gate.observe(results.pose_landmarks is not None)
+                t = telemetry.lap("inference", t)
+            frame_idx += 1
+
+            ex = scorer.exercise
+            row = landmarks_to_array(results)
+            template, self._template = self._template, None
+            if template is not None and template.exercise == ex.name:
+                # Numbered like the scorer's frames
+                self.matcher = ReferenceMatcher(template, ex, fps, first_frame=scorer.analytics.frames)
+
+            # Rules + rep logic (missing poses go in as NaN, like the offline series)
+            scorer.score(row, w, h)
+            if self.matcher is not None:
+                self.matcher.push(row, w, h, scorer.angles)
+            for record in scorer.rep_records:
+                if self.matcher is not None:
+                    record["reference"] = match = self.matcher.match(record)
+                    if match is not None:
+                        self.match_text = (f"Last rep vs tutorial ({record['side']}): "
+                                           f"{int(100 * match['similarity'])}% "
+                                           f"(worst: {match['worst_phase']}, {match['worst_joint']})")
+                if rep_sink is not None:
+                    rep_sink(dict(record, exercise=ex.name))
+
+            feedback_text = ""
+            if results.pose_landmarks:
+                # First rule's message; the angle shown is the left side of the rep rule
+                feedback_text = (scorer.feedback or [""])[0]
+                self.current_angle = scorer.angles["left"]
+                ok = scorer.verdicts.get(ex.keys[0], False)
+                t = telemetry.lap("rules", t)
+
+                self.mp_draw.draw_landmarks(frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS,
+                                            landmark_drawing_spec=self.landmark_style)
+                if self.current_angle == self.current_angle:
+                    cv2.putText(frame, f"{int(self.current_angle)}°", (50,50), cv2.FONT_HERSHEY_SIMPLEX, 1.2,
+                                (0,255,0) if ok else (255,0,0), 3)
+
+            # Frames the render loop never picked up count as dropped
+            telemetry.drop(self.camera_slot.dropped - slot_dropped)
+            slot_dropped = self.camera_slot.dropped
+            telemetry.draw(frame)
+            self.camera_slot.put((frame, f"{feedback_text}\n{self.match_text}\n[{quality.label}]", self.reps_text()))
+            telemetry.lap("draw", t)
+            telemetry.frame_done()
+
+        if self.cap:
+            self.cap.release()
+        cv2.destroyAllWindows()
+        self.running = False
+        quality.close()
+        if rep_sink is not None:
+            rep_sink.close()
+        print("Pose quality:", quality.report())
+        if ENABLE_TELEMETRY:
+            print("Telemetry:", telemetry.summary())
+
+    def video_loop(self):
+        while True:
+            path = self.current_video_path
+            clip = self.tutorial_cache.get(path)  # decoded once, then reused
+            if clip is None:
+                time.sleep(0.1)
+                continue
+
+            # Loop over the pre-decoded frames at the clip's native fps
+            interval = 1.0 / clip.fps
+            next_t = time.perf_counter()
+            i = 0
+            while self.current_video_path == path:
+                self.video_slot.put(clip.frames[i])
+                i = (i + 1) % len(clip)
+                next_t += interval
+                delay = next_t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_t = time.perf_counter()  # fell behind: skip ahead, don't burst
+
+    def render(self):
+        """
+        Runs on the Tk main thread every RENDER_INTERVAL_MS: draws the newest
+        camera / tutorial frame (if any) into the existing canvas items.
+        """
+        state = self.camera_slot.get()
+        if state is not None:
+            frame_rgb, feedback_text, reps = state
+            self.show_frame(self.canvas, self.canvas_item, frame_rgb)
+            self.feedback_var.set(feedback_text)
+            self.reps_var.set(reps)
+
+        frame_rgb = self.video_slot.get()
+        if frame_rgb is not None:
+            self.show_frame(self.video_canvas, self.video_canvas_item, frame_rgb)
+
+        self.master.after(RENDER_INTERVAL_MS, self.render)
+
+    def show_frame(self, canvas, item, frame_rgb):
+        img = Image.fromarray(frame_rgb)
+        photo = getattr(canvas, "image", None)
+        if photo is not None and (photo.width(), photo.height()) == img.size:
+            # Same size: update the existing Tk image in place
+            photo.paste(img)
+        else:
+            canvas.image = ImageTk.PhotoImage(image=img)
+            canvas.itemconfig(item, image=canvas.image)
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = ExerciseApp(root)
+    root.mainloop()
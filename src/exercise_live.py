@@ -1,104 +1,150 @@
-# src/live_exercise.py
-import cv2
-import os
-import numpy as np
-from pose_detector import PoseDetector
-from form_rules import rule_bicep_elbow_angle, rule_wrist_shoulder_alignment, rule_back_symmetry
-
-# Initialize webcam
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    raise RuntimeError("Cannot open webcam")
-
-# Pose detector
-detector = PoseDetector()
-
-# Rep counting state
-left_angle_series = []
-right_angle_series = []
-fps = 30
-
-# Rep counters
-reps_left = 0
-reps_right = 0
-
-# Direction flags
-dir_left = 0
-dir_right = 0
-
-def reset_reps():
-    global reps_left, reps_right, dir_left, dir_right
-    reps_left = 0
-    reps_right = 0
-    dir_left = 0
-    dir_right = 0
-    print("Reps have been reset!")
-
-print("Press 'r' to reset reps, 'q' to quit.")
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    h, w, _ = frame.shape
-    results = detector.detect(frame)
-
-    feedback_msgs = []
-
-    if results.pose_landmarks:
-        lm = results.pose_landmarks.landmark
-        landmarks_px = [(int(p.x * w), int(p.y * h)) for p in lm]
-
-        # Bicep curl angles
-        ok_l, msg_l, angle_l = rule_bicep_elbow_angle(landmarks_px, side="left")
-        ok_r, msg_r, angle_r = rule_bicep_elbow_angle(landmarks_px, side="right")
-        feedback_msgs.append(msg_l)
-        feedback_msgs.append(msg_r)
-
-        # LEFT rep logic
-        if angle_l > 160:
-            dir_left = 0
-        if angle_l < 40 and dir_left == 0:
-            reps_left += 1
-            dir_left = 1
-            feedback_msgs.append("Left arm: GOOD REP!")
-
-        # RIGHT rep logic
-        if angle_r > 160:
-            dir_right = 0
-        if angle_r < 40 and dir_right == 0:
-            reps_right += 1
-            dir_right = 1
-            feedback_msgs.append("Right arm: GOOD REP!")
-
-        # Other rules
-        ok_ws_l, ws_msg_l, _ = rule_wrist_shoulder_alignment(landmarks_px, side="left")
-        ok_bs, bs_msg, _ = rule_back_symmetry(landmarks_px)
-        feedback_msgs.append(ws_msg_l)
-        feedback_msgs.append(bs_msg)
-
-        # Draw pose
-        cv2.putText(frame, f"L:{int(angle_l)}° R:{int(angle_r)}°", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        cv2.putText(frame, f"Reps L:{reps_left} R:{reps_right}", (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
-
-        for i, msg in enumerate(feedback_msgs):
-            cv2.putText(frame, msg, (20, 120 + i*30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 140, 255), 2)
-
-        import mediapipe as mp
-        mp.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
-
-    else:
-        cv2.putText(frame, "No pose detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,0,255), 2)
-
-    cv2.imshow("Live Exercise Form Detection", frame)
-
-    key = cv2.waitKey(1)
-    if key == ord('q') or cv2.getWindowProperty("Live Exercise Form Detection", cv2.WND_PROP_VISIBLE) < 1:
-        break
-    elif key == ord('r'):
-        reset_reps()  # Reset reps on pressing 'r'
-
-cap.release()
-cv2.destroyAllWindows()
-detector.close()
+# src/live_exercise.py
+import cv2
+import os
+import time
+from pose_detector import landmarks_to_array
+from auto_quality import QualityController
+from motion_gate import MotionGate
+from telemetry import Telemetry
+from form_rules import FormScorer
+from rule_spec import load_exercises
+from rep_analytics import JsonLinesSink
+from reference_motion import TemplateStore, ReferenceMatcher
+
+# Initialize webcam
+cap = cv2.VideoCapture(0)
+if not cap.isOpened():
+    raise RuntimeError("Cannot open webcam")
+
+# Pose detector; ROI mode crops inference to the tracked person, which
+# pays off on high-resolution cameras
+USE_ROI = False
+
+# Adaptive-stride inference: slow phases reuse the last pose for up to
+# MAX_STRIDE - 1 frames (set to 1 to run MediaPipe on every frame)
+MAX_STRIDE = 3
+frame_idx = 0
+results = None
+
+# Pose model / input size / stride are scaled to hold this rate (None: the
+# camera's fps); the chosen mode is drawn under the feedback
+TARGET_FPS = None
+
+# Exercise rules + rep counting (see exercises.json): same smoothing +
+# hysteresis as the offline scorer in main.py, fed one frame at a time
+EXERCISE = "bicep_curl"
+fps = cap.get(cv2.CAP_PROP_FPS) or 30
+# Per-rep metrics (ROM, tempo, time under tension, rule failures), one
+# JSON line per completed rep (None: off). Same policy as the GUI: the file
+# is appended to, every line carries its exercise and the start time of the
+# session it belongs to (rep numbers restart per session)
+REPS_OUT = os.path.join("output", "live_reps.jsonl")
+rep_sink = None
+if REPS_OUT:
+    os.makedirs(os.path.dirname(REPS_OUT), exist_ok=True)
+    rep_sink = JsonLinesSink(REPS_OUT, append=True, session=time.strftime("%Y-%m-%dT%H:%M:%S"))
+exercise = load_exercises()[EXERCISE]
+scorer = FormScorer(exercise, fps)
+
+# Score every rep against a tutorial clip's motion (None: off); the
+# template is built on the first run and cached (see reference_motion)
+REFERENCE_VIDEO = os.path.join("videos", "bicep_curl.mp4")
+matcher = None
+last_match = None
+if REFERENCE_VIDEO and os.path.exists(REFERENCE_VIDEO):
+    matcher = ReferenceMatcher(TemplateStore().get(REFERENCE_VIDEO, exercise), exercise, fps)
+quality = QualityController(TARGET_FPS or fps, settings={"roi": USE_ROI}, max_stride=MAX_STRIDE,
+                            exercise=exercise)
+
+# Skip inference while the picture is static or nobody is in view (slow
+# check cadence until someone shows up); see motion_gate
+USE_MOTION_GATE = True
+gate = MotionGate(fps) if USE_MOTION_GATE else None
+
+# Opt-in stage timings: on-screen overlay + a JSON log line every 10 s
+ENABLE_TELEMETRY = False
+telemetry = Telemetry(enabled=ENABLE_TELEMETRY, expected_fps=fps)
+
+def reset_reps():
+    scorer.reset()
+    if matcher is not None:
+        matcher.reset(first_frame=scorer.analytics.frames)
+    print("Reps have been reset!")
+
+print("Press 'r' to reset reps, 'q' to quit.")
+
+while True:
+    t = telemetry.clock()
+    ret, frame = cap.read()
+    if not ret:
+        break
+    t = telemetry.lap("capture", t)
+
+    h, w, _ = frame.shape
+    inferred = None
+    if gate is None or gate.due(frame):
+        inferred = quality.process(frame_idx, frame, telemetry=telemetry if ENABLE_TELEMETRY else None)
+    if inferred is not None:
+        results = inferred
+        if gate is not None:
+            gate.observe(results.pose_landmarks is not None)
+    frame_idx += 1
+    t = telemetry.clock()
+
+    # Rules + rep logic (missing poses go in as NaN, like the offline series)
+    row = landmarks_to_array(results)
+    scorer.score(row, w, h)
+    if matcher is not None:
+        matcher.push(row, w, h, scorer.angles)
+    for record in scorer.rep_records:
+        if matcher is not None:
+            record["reference"] = last_match = matcher.match(record)
+        if rep_sink is not None:
+            rep_sink(dict(record, exercise=EXERCISE))
+    feedback_msgs = scorer.feedback
+    angle_l, angle_r = scorer.angles["left"], scorer.angles["right"]
+    reps_left, reps_right = scorer.reps["left"], scorer.reps["right"]
+
+    if results.pose_landmarks:
+        t = telemetry.lap("rules", t)
+
+        # Draw pose
+        cv2.putText(frame, f"L:{int(angle_l)}° R:{int(angle_r)}°", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        cv2.putText(frame, f"Reps L:{reps_left} R:{reps_right}", (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
+
+        for i, msg in enumerate(feedback_msgs):
+            cv2.putText(frame, msg, (20, 120 + i*30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 140, 255), 2)
+        if last_match is not None:
+            cv2.putText(frame, f"Last rep vs tutorial: {int(100 * last_match['similarity'])}% "
+                               f"(worst: {last_match['worst_phase']}, {last_match['worst_joint']})",
+                        (20, h - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+        import mediapipe as mp
+        mp.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
+
+    else:
+        cv2.putText(frame, "No pose detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,0,255), 2)
+    cv2.putText(frame, quality.label, (max(20, w - 380), 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
+
+    t = telemetry.lap("draw", t)
+    telemetry.draw(frame)
+    cv2.imshow("Live Exercise Form Detection", frame)
+
+    key = cv2.waitKey(1)
+    telemetry.lap("display", t)
+    telemetry.frame_done()
+    if key == ord('q') or cv2.getWindowProperty("Live Exercise Form Detection", cv2.WND_PROP_VISIBLE) < 1:
+        break
+    elif key == ord('r'):
+        reset_reps()  # Reset reps on pressing 'r'
+
+cap.release()
+cv2.destroyAllWindows()
+quality.close()
+if rep_sink is not None:
+    rep_sink.close()
+print("Pose quality:", quality.report())
+if gate is not None:
+    print("Motion gate:", gate.report())
+if ENABLE_TELEMETRY:
+    print("Telemetry:", telemetry.summary())
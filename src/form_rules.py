@@ -1,75 +1,78 @@
-# src/form_rules.py
-from utils import calculate_angle, dist
-
-# Landmark indices (MediaPipe)
-LM = {
-    "LEFT_SHOULDER": 11, "RIGHT_SHOULDER": 12,
-    "LEFT_ELBOW": 13, "RIGHT_ELBOW": 14,
-    "LEFT_WRIST": 15, "RIGHT_WRIST": 16,
-    "LEFT_HIP": 23, "RIGHT_HIP": 24,
-    "NOSE": 0
-}
-
-# --- BICEP CURL RULE ---
-def rule_bicep_elbow_angle(landmarks_px, side="left", top_thresh=50, bottom_thresh=150):
-    if side == "left":
-        sh = landmarks_px[LM["LEFT_SHOULDER"]]
-        el = landmarks_px[LM["LEFT_ELBOW"]]
-        wr = landmarks_px[LM["LEFT_WRIST"]]
-    else:
-        sh = landmarks_px[LM["RIGHT_SHOULDER"]]
-        el = landmarks_px[LM["RIGHT_ELBOW"]]
-        wr = landmarks_px[LM["RIGHT_WRIST"]]
-
-    angle = calculate_angle(sh, el, wr)
-    msg = ""
-    if angle <= top_thresh:
-        ok = True
-        msg = f"{side} elbow: good top ({int(angle)}°)"
-    elif angle >= bottom_thresh:
-        ok = True
-        msg = f"{side} elbow: good bottom ({int(angle)}°)"
-    else:
-        ok = False
-        msg = f"{side} elbow: incomplete curl ({int(angle)}°)"
-    return ok, msg, angle
-
-# --- WRIST-SHOULDER ALIGNMENT ---
-def rule_wrist_shoulder_alignment(landmarks_px, side="left", pixel_tol=25):
-    if side == "left":
-        sh = landmarks_px[LM["LEFT_SHOULDER"]]
-        wr = landmarks_px[LM["LEFT_WRIST"]]
-    else:
-        sh = landmarks_px[LM["RIGHT_SHOULDER"]]
-        wr = landmarks_px[LM["RIGHT_WRIST"]]
-
-    dy = abs(sh[1] - wr[1])
-    ok = dy <= pixel_tol
-    msg = f"{side} wrist-shldr dy={dy}px"
-    return ok, ("Aligned" if ok else "Not aligned"), dy
-
-# --- BACK SYMMETRY ---
-def rule_back_symmetry(landmarks_px, tol_pixels=30):
-    l_sh = landmarks_px[LM["LEFT_SHOULDER"]]
-    r_sh = landmarks_px[LM["RIGHT_SHOULDER"]]
-    dy = abs(l_sh[1] - r_sh[1])
-    ok = dy <= tol_pixels
-    msg = f"Shoulder symmetry dy={dy}px"
-    return ok, ("Symmetric" if ok else "Tilted"), dy
-
-# --- TRICEP CURL RULE ---
-def rule_tricep_extension(landmarks_px, side="left"):
-    if side == "left":
-        shoulder = landmarks_px[LM["LEFT_SHOULDER"]]
-        elbow = landmarks_px[LM["LEFT_ELBOW"]]
-        wrist = landmarks_px[LM["LEFT_WRIST"]]
-    else:
-        shoulder = landmarks_px[LM["RIGHT_SHOULDER"]]
-        elbow = landmarks_px[LM["RIGHT_ELBOW"]]
-        wrist = landmarks_px[LM["RIGHT_WRIST"]]
-
-    angle = calculate_angle(shoulder, elbow, wrist)
-    if angle > 160:
-        return True, f"Good extension ({int(angle)}°)", angle
-    else:
-        return False, f"Extend your arm more ({int(angle)}°)", angle
+# src/form_rules.py
+import numpy as np
+from rep_analytics import RepAnalytics
+
+# Landmark indices (MediaPipe)
+LM = {
+    "LEFT_SHOULDER": 11, "RIGHT_SHOULDER": 12,
+    "LEFT_ELBOW": 13, "RIGHT_ELBOW": 14,
+    "LEFT_WRIST": 15, "RIGHT_WRIST": 16,
+    "LEFT_HIP": 23, "RIGHT_HIP": 24,
+    "LEFT_KNEE": 25, "RIGHT_KNEE": 26,
+    "LEFT_ANKLE": 27, "RIGHT_ANKLE": 28,
+    "LEFT_EAR": 7, "RIGHT_EAR": 8,
+    "NOSE": 0
+}
+
+# The form rules themselves are declared in exercises.json and compiled by
+# rule_spec; evaluate_rules_batch runs them over a whole clip, FormScorer on
+# a live stream.
+
+
+def evaluate_rules_batch(landmarks, exercise="bicep_curl"):
+    """
+    Every rule of a compiled exercise (rule_spec.Exercise, or its name in
+    exercises.json) over all frames of a (N, 33, 2) pixel-coordinate array
+    in one vectorized pass. Returns {"<rule>_<side>" or "<rule>": (ok, value)}.
+    """
+    if isinstance(exercise, str):
+        from rule_spec import load_exercises  # rule_spec imports LM from here
+        exercise = load_exercises()[exercise]
+    return exercise.verdicts(np.asarray(landmarks, dtype=np.float32))
+
+class FormScorer:
+    """
+    Per-person streaming state: runs a compiled exercise (rule_spec.Exercise)
+    on one frame of landmarks at a time and counts reps from the per-side
+    values of its rep rule (same smoothing and hysteresis as the offline
+    scorer). After score(), feedback / verdicts ({rule key: ok}, skipped
+    rules left out) / angles / reps describe that frame, and rep_records
+    the reps it closed (see rep_analytics; on_rep also gets each one).
+    normalized=True scores resolution-independently (see
+    Exercise.evaluate_landmarks).
+    """
+    def __init__(self, exercise, fps=30.0, normalized=False, on_rep=None):
+        self.exercise = exercise
+        self.normalized = normalized
+        self.feedback = []
+        self.verdicts = {}
+        self.angles = {"left": np.nan, "right": np.nan}
+        self.rep_records = []
+        self.analytics = RepAnalytics(exercise, fps, on_rep)
+
+    @property
+    def reps(self):
+        return self.analytics.reps
+
+    def reset(self):
+        self.analytics.reset()
+
+    def score(self, landmarks, w, h, world=None):
+        """
+        landmarks: (33, 4) normalized row (all NaN = no pose, which still
+        advances the rep counters). w, h: frame size in pixels. world: the
+        matching world landmarks row (normalized mode only).
+        """
+        self.feedback = []
+        self.verdicts = {}
+        self.angles = {"left": np.nan, "right": np.nan}
+        if not np.isnan(landmarks[0, 0]):
+            values, ok, check = self.exercise.evaluate_landmarks(landmarks, w, h, self.normalized, world)
+            self.feedback = self.exercise.messages(values, check)
+            self.verdicts = {k: o for k, o, c in zip(self.exercise.keys, ok.tolist(), check.tolist()) if c >= 0}
+            self.angles = {side: float(v) for side, v in self.exercise.rep_values(values).items()}
+            self.rep_records = self.analytics.push(values, ok, check)
+        else:
+            self.rep_records = self.analytics.push()
+        for record in self.rep_records:
+            self.feedback.append(f"{record['side'].capitalize()} arm: GOOD REP!")
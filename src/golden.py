@@ -0,0 +1,372 @@
+# src/golden.py
+"""
+Golden-output regression harness for the scoring pipeline.
+
+Records what the pipeline produces for a fixed set of cases and diffs
+later runs against it, so an optimization of process_video,
+smooth_series, the rule engine or the rep logic can be shown not to
+change any result:
+
+  - per-frame rep angles (raw and smoothed), rule values, verdicts
+    (1 ok / 0 failed / -1 skipped) and the matched check of every rule
+  - rep events and per-rep records (rep_analytics)
+  - the summary dict, and the replay / score_series views of the same data
+
+Cases:
+  - the bundled videos through process_video. Their landmarks are
+    recorded with the goldens (golden/<case>.landmarks.npy) and fed back
+    through a LandmarkCache, so runs are deterministic on any machine;
+    --inference runs MediaPipe instead and also diffs the landmarks;
+  - synthetic landmark streams (synthetic.synthetic_curl_landmarks) with
+    NaN gaps (no pose, at the ends and longer than the smoothing window),
+    zero-length limb vectors and low-visibility joints (normalized mode),
+    and an overhead tricep extension stream;
+  - a table of calculate_angle / calculate_angle_batch edge cases.
+
+Integers, booleans, strings, NaN positions and list lengths must match
+exactly. Floats may differ by an absolute tolerance per group
+(TOLERANCES, overridable with --tol GROUP=ATOL) plus RTOL times the
+golden value.
+
+usage: python src/golden.py [--record] [--case NAME ...] [--tol GROUP=ATOL ...] [--inference]
+       python src/benchmark.py --golden   (timings and this check in one run)
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from form_rules import LM
+from landmark_cache import LandmarkCache, load_or_extract_landmarks, extract_landmarks, CACHE_DIR
+from main import process_video, score_landmarks, EXERCISES
+from pose_detector import PoseDetector
+from rep_analytics import rep_records
+from replay import Replay
+from scoring import score_series
+from session_store import SessionReader
+from synthetic import synthetic_curl_landmarks
+from utils import calculate_angle, calculate_angle_batch
+
+GOLDEN_DIR = "golden"
+
+# The tricep clip is filmed from the front, so its 2D elbow angle only
+# spans about 51-111 deg and never reaches the rep's "down" (150): the case
+# pins angles and rule outputs but has no rep events. synthetic_tricep
+# covers tricep rep counting and analytics.
+VIDEO_CASES = {
+    "bicep_curl": {"video": "videos/bicep_curl.mp4", "exercise": "bicep_curl"},
+    "tricep_curl": {"video": "videos/tricep curl.mp4", "exercise": "tricep_curl"}
+}
+
+SYNTHETIC_FRAMES = 600
+SYNTHETIC_FPS = 30.0
+SYNTHETIC_SIZE = (1280, 720)
+# Frame ranges [start, stop) to blank out / collapse / hide
+SYNTHETIC_CASES = {
+    "synthetic_curl": {"exercise": "bicep_curl"},
+    "synthetic_nan_gaps": {"exercise": "bicep_curl",
+                           "nan_gaps": [(0, 4), (100, 101), (250, 256), (400, 460), (590, 600)]},
+    "synthetic_zero_length": {"exercise": "bicep_curl",
+                              "wrist_on_elbow": [(120, 135)], "arm_collapsed": [(300, 306)]},
+    "synthetic_normalized": {"exercise": "bicep_curl", "normalized": True,
+                             "low_visibility": [(200, 240)], "nan_gaps": [(330, 333)]},
+    "synthetic_tricep": {"exercise": "tricep_curl", "overhead": True, "nan_gaps": [(250, 256)]}
+}
+
+# (a, b, c) points: right angle, straight, folded, zero-length vectors,
+# near-collinear, 3D, NaN and large coordinates
+ANGLE_CASES = [
+    ((1, 0), (0, 0), (0, 1)),
+    ((1, 0), (0, 0), (-1, 0)),
+    ((1, 0), (0, 0), (2, 0)),
+    ((0, 0), (0, 0), (1, 0)),
+    ((1, 0), (0, 0), (0, 0)),
+    ((0, 0), (0, 0), (0, 0)),
+    ((5, 5), (5, 5), (5, 5)),
+    ((1, 1e-9), (0, 0), (-1, 0)),
+    ((1, 0, 0), (0, 0, 0), (0, 1, 1)),
+    ((np.nan, 0), (0, 0), (1, 0)),
+    ((1e6, 1), (0, 0), (1e6, -1)),
+    ((640, 200), (600, 320), (598, 460))
+]
+
+# Absolute float tolerance per output group
+TOLERANCES = {
+    "angles": 1e-6,
+    "values": 1e-6,
+    "summary": 1e-6,
+    "reps": 1e-6,
+    "replay": 1e-6,
+    "score_series": 1e-6,
+    "calculate_angle": 1e-9,
+    "landmarks": 0.0
+}
+RTOL = 1e-9
+MAX_REPORTED = 5  # differing elements listed per field
+
+
+def _clean(x):
+    """
+    JSON-ready copy: numpy scalars / arrays to Python, NaN to None.
+    """
+    if isinstance(x, dict):
+        return {str(k): _clean(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple, np.ndarray)):
+        return [_clean(v) for v in (x.tolist() if isinstance(x, np.ndarray) else x)]
+    if isinstance(x, (bool, np.bool_)):
+        return bool(x)
+    if isinstance(x, (int, np.integer)):
+        return int(x)
+    if isinstance(x, (float, np.floating)):
+        return None if np.isnan(x) else float(x)
+    return x
+
+
+def _rule_outputs(keys, values, ok, check):
+    return {
+        "values": dict(zip(keys, np.asarray(values, dtype=float).T)),
+        "verdicts": dict(zip(keys, np.where(check >= 0, ok.astype(int), -1).T)),
+        "checks": dict(zip(keys, np.asarray(check, dtype=int).T))
+    }
+
+
+def _replay_outputs(replay):
+    return {"summary": replay.summary(), "rep_events": replay.rep_events(), "reps": replay.rep_records()}
+
+
+def synthetic_landmarks(spec, n_frames=SYNTHETIC_FRAMES):
+    """
+    The (N, 33, 4) landmarks of a SYNTHETIC_CASES entry.
+    """
+    lm = synthetic_curl_landmarks(n_frames, fps=SYNTHETIC_FPS, frame_size=SYNTHETIC_SIZE,
+                                  overhead=spec.get("overhead", False))
+    for a, b in spec.get("wrist_on_elbow", []):
+        lm[a:b, LM["LEFT_WRIST"]] = lm[a:b, LM["LEFT_ELBOW"]]
+    for a, b in spec.get("arm_collapsed", []):
+        for joint in ("RIGHT_SHOULDER", "RIGHT_WRIST"):
+            lm[a:b, LM[joint]] = lm[a:b, LM["RIGHT_ELBOW"]]
+    for a, b in spec.get("low_visibility", []):
+        lm[a:b, LM["LEFT_WRIST"], 3] = 0.1
+    for a, b in spec.get("nan_gaps", []):
+        lm[a:b] = np.nan
+    return lm
+
+
+def run_synthetic(spec):
+    ex = EXERCISES[spec["exercise"]]
+    normalized = spec.get("normalized", False)
+    lm = synthetic_landmarks(spec)
+    w, h = SYNTHETIC_SIZE
+    meta = {"fps": SYNTHETIC_FPS, "width": w, "height": h, "exercise": spec["exercise"]}
+    values, ok, check = ex.evaluate_landmarks(lm, w, h, normalized)
+    df, summary = score_landmarks(lm, meta, spec["exercise"], normalized=normalized)
+    reps = rep_records(values, ok, check, ex, SYNTHETIC_FPS)
+    series_summary, series_events = score_series(lm, w, h, SYNTHETIC_FPS, ex, normalized)
+    return {
+        "summary": summary,
+        "angles": {col: df[col].to_numpy() for col in df.columns if col != "frame"},
+        **_rule_outputs(ex.keys, values, ok, check),
+        "rep_events": {side: [r["end"] for r in reps if r["side"] == side] for side in ("left", "right")},
+        "reps": reps,
+        "replay": _replay_outputs(Replay((lm, meta), ex, normalized=normalized)),
+        "score_series": {"summary": series_summary, "rep_events": series_events}
+    }
+
+
+def run_video(spec, landmarks, meta):
+    """
+    process_video on the case's video with `landmarks` standing in for
+    inference (through a throwaway LandmarkCache).
+    """
+    ex = EXERCISES[spec["exercise"]]
+    settings = PoseDetector.resolve_settings(None)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = LandmarkCache(os.path.join(tmp, "cache"))
+        cache.save(spec["video"], settings, landmarks, meta)
+        session_path = os.path.join(tmp, "session")
+        reps_path = os.path.join(tmp, "reps.jsonl")
+        csv_path = os.path.join(tmp, "angles.csv")
+        _, summary = process_video(spec["video"], os.path.join(tmp, "out.mp4"), csv_path,
+                                   exercise=spec["exercise"], cache=cache,
+                                   session_path=session_path, reps_path=reps_path)
+        df = pd.read_csv(csv_path, float_precision="round_trip")
+        reader = SessionReader(session_path)
+        rows = reader.read(0, None, ("values", "ok", "check"))
+        with open(reps_path) as f:
+            reps = [{k: v for k, v in json.loads(line).items() if k not in ("video", "exercise")} for line in f]
+        events = reader.events_between(kind="rep")
+        return {
+            "summary": summary,
+            "angles": {col: df[col].to_numpy() for col in df.columns if col != "frame"},
+            **_rule_outputs(ex.keys, rows["values"], rows["ok"], rows["check"]),
+            "rep_events": {side: [e["frame"] for e in events if e["side"] == side] for side in ("left", "right")},
+            "reps": reps,
+            "replay": _replay_outputs(Replay(session_path, ex))
+        }
+
+
+def run_angles():
+    scalar = [calculate_angle(a, b, c) for a, b, c in ANGLE_CASES]
+    batch = [float(calculate_angle_batch(a, b, c)) for a, b, c in ANGLE_CASES]
+    return {"calculate_angle": {"scalar": scalar, "batch": batch}}
+
+
+def case_names():
+    return list(VIDEO_CASES) + list(SYNTHETIC_CASES) + ["calculate_angle"]
+
+
+def run_case(name, golden_dir=GOLDEN_DIR, record=False, inference=False):
+    """
+    Outputs of one case (JSON-ready) and, for video cases, the landmarks
+    used. Recording takes them from the LandmarkCache (inference on a
+    miss); checking replays the recorded ones unless inference=True.
+    """
+    if name in VIDEO_CASES:
+        spec = VIDEO_CASES[name]
+        lm_path = os.path.join(golden_dir, f"{name}.landmarks.npy")
+        if record:
+            landmarks, meta = load_or_extract_landmarks(spec["video"], LandmarkCache(CACHE_DIR))
+        elif inference:
+            landmarks, meta = extract_landmarks(spec["video"], PoseDetector.resolve_settings(None))
+        else:
+            landmarks = np.load(lm_path)
+            with open(os.path.join(golden_dir, f"{name}.json")) as f:
+                meta = json.load(f)["meta"]
+        meta = {k: meta[k] for k in ("fps", "width", "height")}
+        out = _clean(run_video(spec, landmarks, meta))
+        out["meta"] = meta
+        return out, np.asarray(landmarks, dtype=np.float32)
+    if name in SYNTHETIC_CASES:
+        return _clean(run_synthetic(SYNTHETIC_CASES[name])), None
+    if name == "calculate_angle":
+        return _clean(run_angles()), None
+    raise KeyError(f"unknown case: {name}")
+
+
+def diff(golden, new, tolerances=None, path=""):
+    """
+    Differences between a golden output and a new one, as readable lines.
+    The tolerance of a float is that of its top-level group.
+    """
+    tol = {**TOLERANCES, **(tolerances or {})}
+    out = []
+    _diff(golden, new, tol, path, out)
+    return out
+
+
+def _diff(old, new, tol, path, out):
+    group = path.split(".")[0].split("[")[0]
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k in sorted(set(old) | set(new)):
+            sub = f"{path}.{k}" if path else k
+            if k not in new:
+                out.append(f"{sub}: missing")
+            elif k not in old:
+                out.append(f"{sub}: not in golden")
+            else:
+                _diff(old[k], new[k], tol, sub, out)
+    elif isinstance(old, list) and isinstance(new, list):
+        if len(old) != len(new):
+            out.append(f"{path}: length {len(new)} != golden {len(old)}")
+        elif old and all(isinstance(v, (float, int, type(None))) and not isinstance(v, bool) for v in old + new):
+            _diff_numbers(old, new, tol.get(group, 0.0), path, out)
+        else:
+            for i, (a, b) in enumerate(zip(old, new)):
+                _diff(a, b, tol, f"{path}[{i}]", out)
+    elif isinstance(old, float) or isinstance(new, float):
+        _diff_numbers([old], [new], tol.get(group, 0.0), path, out)
+    elif old != new:
+        out.append(f"{path}: {new!r} != golden {old!r}")
+
+
+def _diff_numbers(old, new, atol, path, out):
+    a = np.array([np.nan if v is None else v for v in old], dtype=float)
+    b = np.array([np.nan if v is None else v for v in new], dtype=float)
+    both_nan = np.isnan(a) & np.isnan(b)
+    with np.errstate(invalid="ignore"):
+        close = np.abs(b - a) <= atol + RTOL * np.abs(a)
+    integral = [isinstance(v, int) for v in old]
+    if any(integral):
+        # Counts, frame indices, flags: exact
+        close &= ~np.array(integral) | (a == b)
+    bad = np.flatnonzero(~(close | both_nan))
+    limit = "exact" if all(integral) else f"atol {atol}"
+    if len(bad) == 1 and len(a) == 1:
+        out.append(f"{path}: {new[0]!r} != golden {old[0]!r} ({limit})")
+    elif len(bad):
+        shown = ", ".join(f"[{i}] {new[i]!r} vs {old[i]!r}" for i in bad[:MAX_REPORTED])
+        out.append(f"{path}: {len(bad)}/{len(a)} differ ({limit}): {shown}")
+
+
+def record(cases=None, golden_dir=GOLDEN_DIR):
+    os.makedirs(golden_dir, exist_ok=True)
+    for name in cases or case_names():
+        out, landmarks = run_case(name, golden_dir, record=True)
+        if landmarks is not None:
+            np.save(os.path.join(golden_dir, f"{name}.landmarks.npy"), landmarks)
+        with open(os.path.join(golden_dir, f"{name}.json"), "w") as f:
+            json.dump(out, f, indent=1)
+            f.write("\n")
+        print(f"recorded {name}")
+
+
+def check(cases=None, golden_dir=GOLDEN_DIR, tolerances=None, inference=False):
+    """
+    Runs every case and diffs it against its golden output. Returns
+    {case: {"ok", "wall_s", "differences"}}.
+    """
+    report = {}
+    for name in cases or case_names():
+        path = os.path.join(golden_dir, f"{name}.json")
+        if not os.path.exists(path):
+            report[name] = {"ok": False, "wall_s": 0.0, "differences": [f"no golden output ({path}); run --record"]}
+            continue
+        with open(path) as f:
+            golden = json.load(f)
+        t0 = time.perf_counter()
+        new, landmarks = run_case(name, golden_dir, inference=inference)
+        wall = time.perf_counter() - t0
+        differences = diff(golden, new, tolerances)
+        if inference and landmarks is not None:
+            recorded = np.load(os.path.join(golden_dir, f"{name}.landmarks.npy"))
+            differences = diff({"landmarks": recorded.ravel().tolist()},
+                               {"landmarks": _clean(landmarks.ravel())}, tolerances) + differences
+        report[name] = {"ok": not differences, "wall_s": round(wall, 3), "differences": differences}
+    return report
+
+
+def print_report(report):
+    for name, res in report.items():
+        print(f"{'ok' if res['ok'] else 'FAIL':>4}  {name:<24} {res['wall_s']:7.2f} s")
+        for line in res["differences"]:
+            print(f"      {line}")
+
+
+def parse_tolerances(items):
+    tol = {}
+    for item in items or []:
+        group, _, value = item.partition("=")
+        tol[group] = float(value)
+    return tol
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record / check golden outputs of the scoring pipeline")
+    parser.add_argument("--record", action="store_true", help="(re)write the golden outputs")
+    parser.add_argument("--case", action="append", choices=case_names(), help="only this case (repeatable)")
+    parser.add_argument("--dir", default=GOLDEN_DIR, help="golden output directory")
+    parser.add_argument("--tol", action="append", metavar="GROUP=ATOL",
+                        help=f"float tolerance of a group ({', '.join(TOLERANCES)})")
+    parser.add_argument("--inference", action="store_true",
+                        help="video cases: run MediaPipe instead of the recorded landmarks")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.case, args.dir)
+        sys.exit(0)
+    report = check(args.case, args.dir, parse_tolerances(args.tol), args.inference)
+    print_report(report)
+    sys.exit(0 if all(r["ok"] for r in report.values()) else 1)
@@ -0,0 +1,131 @@
+# src/landmark_cache.py
+import hashlib
+import json
+import os
+import cv2
+import numpy as np
+from pose_detector import PoseDetector, landmarks_to_array, NUM_LANDMARKS
+from session_store import SessionReader
+
+CACHE_DIR = os.path.join("output", "landmark_cache")
+
+
+def video_hash(path, chunk_size=1 << 20):
+    """
+    SHA-1 of the video file contents (not its name or mtime).
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class LandmarkCache:
+    """
+    Per-video landmark store keyed by content hash + detector settings.
+
+    Each entry is a float32 .npy of shape (frames, 33, 4) holding normalized
+    x, y, z, visibility (NaN rows = no pose), plus a small JSON sidecar with
+    fps / frame size. Arrays are loaded memory-mapped.
+    """
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, video_path, settings):
+        settings_str = json.dumps(settings, sort_keys=True)
+        return hashlib.sha1((video_hash(video_path) + settings_str).encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".npy", base + ".json"
+
+    def load(self, video_path, settings, key=None):
+        """
+        Returns (landmarks, meta) or None on a cache miss.
+        """
+        key = key or self.key(video_path, settings)
+        npy_path, meta_path = self._paths(key)
+        if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return np.load(npy_path, mmap_mode="r"), meta
+
+    def save(self, video_path, settings, landmarks, meta, key=None):
+        landmarks = np.asarray(landmarks, dtype=np.float32)
+        return self._write(video_path, settings, meta, key, len(landmarks),
+                           lambda path: np.save(path, landmarks))
+
+    def save_session(self, video_path, settings, session_path, meta, key=None):
+        """
+        save() with the landmarks of a session_store session, copied one row
+        group at a time into the memory-mapped entry (bounded memory).
+        """
+        reader = SessionReader(session_path)
+
+        def write(path):
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                            shape=(len(reader), NUM_LANDMARKS, 4))
+            for g in reader.groups:
+                out[g["start"]:g["start"] + g["rows"]] = reader.read(
+                    g["start"], g["start"] + g["rows"], ("landmarks",))["landmarks"]
+            out.flush()
+            del out
+
+        return self._write(video_path, settings, meta, key, len(reader), write)
+
+    def _write(self, video_path, settings, meta, key, frames, write_npy):
+        key = key or self.key(video_path, settings)
+        npy_path, meta_path = self._paths(key)
+        meta = dict(meta, settings=settings, video=os.path.basename(video_path), frames=int(frames))
+        # Write to temp files first so a crash never leaves a half-written entry
+        tmp_npy = npy_path + ".tmp.npy"
+        write_npy(tmp_npy)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_npy, npy_path)
+        os.replace(meta_path + ".tmp", meta_path)
+        return key
+
+
+def extract_landmarks(video_path, settings=None):
+    """
+    Run PoseDetector over every frame. Returns (landmarks, meta).
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {video_path}")
+    meta = {
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 25.0,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    }
+    detector = PoseDetector(**(settings or {}))
+    rows = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        rows.append(landmarks_to_array(detector.detect(frame)))
+    cap.release()
+    detector.close()
+    landmarks = np.stack(rows) if rows else np.empty((0, 33, 4), dtype=np.float32)
+    return landmarks, meta
+
+
+def load_or_extract_landmarks(video_path, cache=None, settings=None):
+    """
+    Cached landmarks for `video_path`, running inference only on a miss.
+    """
+    settings = PoseDetector.resolve_settings(settings)
+    if cache is None:
+        return extract_landmarks(video_path, settings)
+    key = cache.key(video_path, settings)
+    hit = cache.load(video_path, settings, key=key)
+    if hit is not None:
+        return hit
+    landmarks, meta = extract_landmarks(video_path, settings)
+    cache.save(video_path, settings, landmarks, meta, key=key)
+    return cache.load(video_path, settings, key=key)
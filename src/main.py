@@ -1,147 +1,399 @@
-# src/main.py
-import cv2
-import os
-import numpy as np
-import pandas as pd
-from pose_detector import PoseDetector
-from form_rules import (
-    rule_bicep_elbow_angle,
-    rule_wrist_shoulder_alignment,
-    rule_back_symmetry,
-    rule_no_shoulder_shrug
-)
-from utils import smooth_series, detect_reps_from_angle_series
-
-# Optional MLflow logging toggle
-USE_MLFLOW = False
-if USE_MLFLOW:
-    import mlflow
-
-# --- CONFIG --- #
-VIDEO_IN = "videos/bicep_curl.mp4"  # Change this to your video
-OUTPUT_DIR = "output"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-VIDEO_OUT = os.path.join(OUTPUT_DIR, "annotated_bicep.mp4")
-CSV_OUT = os.path.join(OUTPUT_DIR, "angles.csv")
-
-# Map exercises to rules
-EXERCISES = {
-    "bicep_curl": [rule_bicep_elbow_angle, rule_back_symmetry, rule_no_shoulder_shrug],
-    "lateral_raise": [rule_wrist_shoulder_alignment, rule_back_symmetry, rule_no_shoulder_shrug],
-    "push_up": [rule_back_symmetry, rule_no_shoulder_shrug]  # example
-}
-
-
-def process_video(input_path, output_path, csv_path, exercise="bicep_curl", use_mlflow=False):
-    cap = cv2.VideoCapture(input_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"Cannot open video: {input_path}")
-
-    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    writer = cv2.VideoWriter(output_path, fourcc, fps, (w, h))
-
-    detector = PoseDetector()
-    records = []
-    angle_history = {"left": [], "right": []}
-    frame_idx = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        results = detector.detect(frame)
-        rec = {"frame": frame_idx}
-        feedbacks = []
-
-        if results.pose_landmarks:
-            lm = results.pose_landmarks.landmark
-            landmarks_px = [(int(p.x * w), int(p.y * h)) for p in lm]
-
-            # Apply rules
-            for rule in EXERCISES[exercise]:
-                # Rules that need 'side'
-                if rule.__name__ in [
-                    "rule_bicep_elbow_angle",
-                    "rule_wrist_shoulder_alignment",
-                    "rule_no_shoulder_shrug"
-                ]:
-                    for side in ["left", "right"]:
-                        ok, msg, val = rule(landmarks_px, side=side)
-                        feedbacks.append(msg)
-                        if rule.__name__ == "rule_bicep_elbow_angle":
-                            angle_history[side].append(val)
-                # Rules that do NOT need 'side'
-                else:
-                    ok, msg, val = rule(landmarks_px)
-                    feedbacks.append(msg)
-
-            # Overlay feedback
-            for i, fb in enumerate(feedbacks[:6]):  # limit number of lines
-                cv2.putText(frame, fb, (20, 40 + i*30), cv2.FONT_HERSHEY_SIMPLEX,
-                            0.7, (0, 255, 0), 2)
-
-            rec.update({
-                "left_elbow_angle": angle_history["left"][-1] if angle_history["left"] else np.nan,
-                "right_elbow_angle": angle_history["right"][-1] if angle_history["right"] else np.nan
-            })
-        else:
-            rec.update({"left_elbow_angle": np.nan, "right_elbow_angle": np.nan})
-            cv2.putText(frame, "No pose detected", (20, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-
-        records.append(rec)
-        writer.write(frame)
-        frame_idx += 1
-
-    cap.release()
-    writer.release()
-    detector.close()
-
-    # Save data
-    df = pd.DataFrame(records)
-
-    # Smooth angles
-    for col in ["left_elbow_angle", "right_elbow_angle"]:
-        if col in df.columns:
-            sm = smooth_series(df[col].to_numpy(), method="savgol", window=11, poly=2)
-            df[col + "_smoothed"] = sm
-
-    df.to_csv(csv_path, index=False)
-
-    # Detect reps on smoothed angles
-    left_series = df["left_elbow_angle_smoothed"].fillna(method="bfill").fillna(method="ffill").to_numpy()
-    right_series = df["right_elbow_angle_smoothed"].fillna(method="bfill").fillna(method="ffill").to_numpy()
-
-    reps_left, events_left = detect_reps_from_angle_series(left_series, up_thresh=60, down_thresh=150, min_gap=int(fps*0.3))
-    reps_right, events_right = detect_reps_from_angle_series(right_series, up_thresh=60, down_thresh=150, min_gap=int(fps*0.3))
-
-    summary = {
-        "frames": len(df),
-        "reps_left": reps_left,
-        "reps_right": reps_right,
-        "left_mean_angle": float(np.nanmean(left_series)),
-        "right_mean_angle": float(np.nanmean(right_series))
-    }
-
-    # Optional MLflow logging
-    if use_mlflow:
-        mlflow.set_experiment("form_eval")
-        with mlflow.start_run():
-            mlflow.log_params({"input_video": input_path})
-            for k, v in summary.items():
-                mlflow.log_metric(k, v)
-            mlflow.log_artifact(output_path, artifact_path="annotated_videos")
-            mlflow.log_artifact(csv_path, artifact_path="csvs")
-
-    return df, summary
-
-
-if __name__ == "__main__":
-    df, summary = process_video(VIDEO_IN, VIDEO_OUT, CSV_OUT, exercise="bicep_curl", use_mlflow=USE_MLFLOW)
-    print("Summary:", summary)
-    print("Saved:", VIDEO_OUT, CSV_OUT)
+# src/main.py
+import cv2
+import csv
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+from pose_detector import PoseDetector, landmarks_to_array
+from rule_spec import load_exercises
+from utils import (
+    smooth_series,
+    detect_reps_from_angle_series,
+    REP_MIN_GAP_S, SMOOTH_WINDOW, SMOOTH_POLY
+)
+from landmark_cache import LandmarkCache
+from pipeline import StagedPipeline
+from adaptive_stride import StridedInference
+from telemetry import Telemetry
+from session_store import SessionWriter
+from frame_buffers import FramePool
+from motion_gate import MotionGate
+from rep_analytics import RepAnalytics, JsonLinesSink
+from reference_motion import ReferenceMatcher
+
+# Optional MLflow logging toggle
+USE_MLFLOW = False
+if USE_MLFLOW:
+    import mlflow
+
+# --- CONFIG --- #
+VIDEO_IN = "videos/bicep_curl.mp4"  # Change this to your video
+OUTPUT_DIR = "output"
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+VIDEO_OUT = os.path.join(OUTPUT_DIR, "annotated_bicep.mp4")
+CSV_OUT = os.path.join(OUTPUT_DIR, "angles.csv")
+SESSION_OUT = os.path.join(OUTPUT_DIR, "session")
+REPS_OUT = os.path.join(OUTPUT_DIR, "reps.jsonl")
+CACHE_DIR = os.path.join(OUTPUT_DIR, "landmark_cache")
+
+# Exercises, their rules and rep thresholds (see exercises.json / rule_spec)
+EXERCISES = load_exercises()
+
+
+def process_video(input_path, output_path, csv_path, exercise="bicep_curl", use_mlflow=False,
+                  cache=None, detector_settings=None, detector=None,
+                  queue_size=8, stage_stats=None, max_stride=1, telemetry=None, session_path=None,
+                  normalized=False, reps_path=None, motion_gate=False, reference=None):
+    """
+    Annotate a video and score it. With a LandmarkCache, landmarks from a
+    previous run with the same video content and detector settings are
+    reused and MediaPipe inference is skipped entirely.
+    A caller-owned `detector` (e.g. one per batch worker) is reset and reused
+    instead of building a new graph; its settings override detector_settings.
+
+    Decode, inference and annotate/encode run as separate threads joined by
+    queues of `queue_size` frames (see pipeline.StagedPipeline); frame order
+    is preserved. Pass a dict as `stage_stats` to get per-stage throughput.
+
+    max_stride > 1 enables adaptive-stride inference (see adaptive_stride):
+    slow phases only run MediaPipe every few frames and interpolate landmarks
+    in between, fast motion and crossings of the exercise's rep thresholds run
+    at full rate.
+    detector_settings={"roi": True} crops inference to the tracked person
+    (see PoseDetector); landmarks still come back in full-frame coordinates.
+    motion_gate=True (full-rate path only, i.e. max_stride=1) skips
+    inference on frames with no motion since the last inferred one, or
+    checks only every so often while nobody is in view, and reuses the last
+    landmarks (see motion_gate). Landmarks from strided or gated runs are
+    not cached.
+
+    The rules and rep counting come from EXERCISES[exercise]; the CSV holds
+    the per-side value of the exercise's rep rule (e.g. left/right_elbow_angle).
+    normalized=True evaluates them resolution-independently (distances in
+    torso lengths, low-visibility joints skipped), so verdicts hold on
+    downscaled inputs.
+
+    With a session_path, every frame's landmarks, rule values / verdicts and
+    the rep events are streamed to a columnar session (see session_store)
+    in fixed-size row groups and nothing per frame is kept in memory: the
+    summary comes from streaming accumulators, the CSV (if csv_path) is
+    written as rows complete, a cache entry is written from the session
+    afterwards, and the returned df is None (read the session instead).
+    Without one, only what the return value and cache need is kept: the
+    df rows (five numbers per frame) and, on a cache miss, the landmarks
+    (33 x 4 float32 per frame); use a session_path for hour-long inputs.
+
+    Per-rep metrics (range of motion, concentric / eccentric time, time
+    under tension, peak velocity, per-rule failure fraction; see
+    rep_analytics) are computed as each rep closes: they go into the
+    session's rep events, are appended to `reps_path` as JSON lines if
+    given, and their per-side means into the summary. With a `reference`
+    (reference_motion.MotionTemplate, e.g. TemplateStore().get(tutorial,
+    exercise)) each rep is also aligned to the tutorial's motion and its
+    record gets a "reference" match (similarity, worst phase / joint).
+
+    With a Telemetry, per-frame decode / color_convert / inference / rules /
+    draw / encode timings are collected and their percentiles merged into
+    the summary as telemetry_* keys.
+    """
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {input_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    writer = cv2.VideoWriter(output_path, fourcc, fps, (w, h))
+
+    own_detector = detector is None
+    settings = detector.settings if detector else PoseDetector.resolve_settings(detector_settings)
+    cached = None
+    if cache is not None:
+        cache_key = cache.key(input_path, settings)
+        hit = cache.load(input_path, settings, key=cache_key)
+        if hit is not None:
+            cached = hit[0]
+    if cached is not None:
+        detector = None
+    elif own_detector:
+        detector = PoseDetector(**settings)
+    else:
+        detector.reset()
+    ex = EXERCISES[exercise]
+    extracted = []
+    tel = telemetry or Telemetry(enabled=False)
+    session = None
+    if session_path:
+        session = SessionWriter(session_path, ex.keys, {
+            "video": os.path.abspath(input_path), "exercise": exercise, "fps": fps,
+            "width": w, "height": h, "rep_column": ex.rep_column})
+    table = FrameTable(ex.rep_column, csv_path, keep=session is None)
+    sink = JsonLinesSink(reps_path, video=os.path.basename(input_path), exercise=exercise) if reps_path else None
+    rep_records = []
+    matcher = ReferenceMatcher(reference, ex, fps) if reference is not None else None
+
+    def on_rep(record):
+        if matcher is not None:
+            record["reference"] = matcher.match(record)
+        rep_records.append(record)
+        if session is not None:
+            session.add_event(record["end"], "rep", **{k: v for k, v in record.items() if k != "end"})
+        if sink is not None:
+            sink(record)
+
+    # Rep events as they happen: same smoothing + hysteresis as the summary
+    analytics = RepAnalytics(ex, fps, on_rep, on_value=table.smoothed)
+
+    # Decoded frames are recycled once every frame that can still be in
+    # flight has passed: one per stage thread, two full queues and up to
+    # max_stride frames held back by StridedInference
+    frames = FramePool(2 * queue_size + max(max_stride, 1) + 2)
+
+    # --- Pipeline stages: decode -> infer -> annotate/encode (own thread each) ---
+    def decode():
+        frame_idx = 0
+        while True:
+            t = tel.clock()
+            ret, frame = frames.read(cap)
+            if not ret:
+                return
+            tel.lap("decode", t)
+            yield frame_idx, frame
+            frame_idx += 1
+
+    gate = MotionGate(fps) if motion_gate and cached is None and max_stride <= 1 else None
+    last_row = None
+
+    def infer(item):
+        nonlocal last_row
+        frame_idx, frame = item
+        if cached is not None:
+            lm_row = cached[frame_idx]
+        elif gate is not None and not gate.due(frame):
+            lm_row = last_row
+        else:
+            lm_row = landmarks_to_array(detector.detect(frame, telemetry))
+            if session is None and cache is not None:
+                extracted.append(lm_row)
+            if gate is not None:
+                gate.observe(not np.isnan(lm_row[0, 0]))
+                last_row = lm_row
+        return frame_idx, frame, lm_row
+
+    infer_stage = ("infer", infer)
+    strided = None
+    if cached is None and max_stride > 1:
+        # Keyframes only; in-between landmarks are interpolated (never cached)
+        strided = StridedInference(detector, (w, h), max_stride=max_stride, telemetry=telemetry,
+                                   exercise=ex)
+        infer_stage = ("infer", lambda item: strided.process(*item), strided.flush)
+
+    def annotate_and_encode(item):
+        frame_idx, frame, lm_row = item
+        t = tel.clock()
+
+        if not np.isnan(lm_row[0, 0]):
+            # Apply rules (one vectorized pass over the compiled exercise)
+            values, ok, check = ex.evaluate_landmarks(lm_row, w, h, normalized)
+            feedbacks = ex.messages(values, check)
+            rep_values = ex.rep_values(values)
+            t = tel.lap("rules", t)
+
+            # Overlay feedback
+            for i, fb in enumerate(feedbacks[:6]):  # limit number of lines
+                cv2.putText(frame, fb, (20, 40 + i*30), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.7, (0, 255, 0), 2)
+
+            table.add(frame_idx, rep_values)
+            if matcher is not None:
+                matcher.push(lm_row, w, h, rep_values)
+            analytics.push(values, ok, check)
+            if session is not None:
+                session.append(frame_idx, lm_row, values, ok, check)
+        else:
+            table.add(frame_idx)
+            cv2.putText(frame, "No pose detected", (20, 40),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+            if matcher is not None:
+                matcher.push(lm_row, w, h)
+            analytics.push()
+            if session is not None:
+                session.append(frame_idx, lm_row)
+
+        t = tel.lap("draw", t)
+
+        writer.write(frame)
+        tel.lap("encode", t)
+        tel.frame_done()
+
+    pipeline = StagedPipeline(decode(), [infer_stage, ("annotate_encode", annotate_and_encode)],
+                              source_name="decode", queue_size=queue_size)
+    try:
+        report = pipeline.run()
+    finally:
+        cap.release()
+        writer.release()
+        if own_detector and detector is not None:
+            detector.close()
+    if stage_stats is not None:
+        stage_stats.update(report)
+        if strided is not None:
+            stage_stats["infer"]["inferred"] = strided.inferred
+        if gate is not None:
+            stage_stats["infer"]["inferred"] = gate.inferred
+
+    analytics.flush()
+    table.close()
+    if sink is not None:
+        sink.close()
+    summary = analytics.summary()
+    summary.update(rep_means(rep_records))
+    summary.update(tel.summary())
+    if session is not None:
+        session.close(summary=summary)
+
+    if detector is not None and cache is not None and strided is None and gate is None and summary["frames"]:
+        meta = {"fps": fps, "width": w, "height": h}
+        if session is not None:
+            cache.save_session(input_path, settings, session_path, meta, key=cache_key)
+        else:
+            cache.save(input_path, settings, np.stack(extracted), meta, key=cache_key)
+
+    df = pd.DataFrame(table.rows, columns=table.columns) if session is None else None
+
+    # Optional MLflow logging
+    if use_mlflow:
+        mlflow.set_experiment("form_eval")
+        with mlflow.start_run():
+            mlflow.log_params({"input_video": input_path})
+            for k, v in summary.items():
+                mlflow.log_metric(k, v)
+            mlflow.log_artifact(output_path, artifact_path="annotated_videos")
+            if csv_path:
+                mlflow.log_artifact(csv_path, artifact_path="csvs")
+
+    return df, summary
+
+
+def score_landmarks(landmarks, meta, exercise="bicep_curl", csv_path=None, normalized=False):
+    """
+    Rule-only re-evaluation over stored landmarks (see LandmarkCache):
+    no decoding, no inference, no annotated video. Returns (df, summary)
+    like process_video.
+    """
+    ex = EXERCISES[exercise]
+    values, _, _ = ex.evaluate_landmarks(landmarks, meta["width"], meta["height"], normalized)
+    df = pd.DataFrame({"frame": np.arange(len(landmarks))})
+    for side, v in ex.rep_values(values).items():
+        df[f"{side}_{ex.rep_column}"] = v
+    summary = _smooth_and_count(df, meta["fps"], ex)
+    if csv_path:
+        df.to_csv(csv_path, index=False)
+    return df, summary
+
+
+def rep_means(records):
+    """
+    Per-side mean range of motion and time under tension of rep records
+    (see rep_analytics); NaN for a side without reps.
+    """
+    out = {}
+    for side in ("left", "right"):
+        reps = [r for r in records if r["side"] == side]
+        out[f"{side}_mean_rom"] = float(np.mean([r["rom"] for r in reps])) if reps else float("nan")
+        out[f"{side}_mean_tut_s"] = float(np.mean([r["tut_s"] for r in reps])) if reps else float("nan")
+    return out
+
+
+class FrameTable:
+    """
+    The per-frame rep values of process_video and their smoothed series
+    (the angles CSV / df columns). add() each frame's raw values, then
+    smoothed(side, frame, value) as RepAnalytics finalizes them; a row is
+    written to the CSV (and with keep=True kept for the df) as soon as both
+    sides are smoothed, so only the smoothing lag, or a pose gap still
+    waiting for its interpolation, is held in memory.
+    """
+    def __init__(self, rep_column, csv_path=None, keep=False):
+        self.columns = ["frame"] + [f"{side}_{rep_column}" for side in ("left", "right")]
+        self.columns += [col + "_smoothed" for col in self.columns[1:]]
+        self.rows = [] if keep else None
+        self._pending = deque()
+        self._first = 0
+        self._f = self._csv = None
+        if csv_path:
+            self._f = open(csv_path, "w", newline="")
+            self._csv = csv.writer(self._f)
+            self._csv.writerow(self.columns)
+
+    def add(self, frame, rep_values=None):
+        rep_values = rep_values or {}
+        self._pending.append([frame, float(rep_values.get("left", np.nan)),
+                              float(rep_values.get("right", np.nan)), None, None])
+
+    def smoothed(self, side, frame, value):
+        self._pending[frame - self._first][3 if side == "left" else 4] = float(value)
+        while self._pending and self._pending[0][3] is not None and self._pending[0][4] is not None:
+            self._emit(self._pending.popleft())
+            self._first += 1
+
+    def _emit(self, row):
+        if self.rows is not None:
+            self.rows.append(row)
+        if self._csv is not None:
+            # Same text as DataFrame.to_csv: repr floats, NaN as an empty field
+            self._csv.writerow([row[0]] + ["" if v != v else repr(v) for v in row[1:]])
+
+    def close(self):
+        for row in self._pending:
+            self._emit([row[0], row[1], row[2]] + [np.nan if v is None else v for v in row[3:]])
+        self._pending.clear()
+        if self._f is not None:
+            self._f.close()
+
+
+def _smooth_and_count(df, fps, ex):
+    """
+    Adds *_smoothed columns for the rep values of exercise `ex` to df in
+    place and returns the rep summary.
+    """
+    left_col, right_col = f"left_{ex.rep_column}", f"right_{ex.rep_column}"
+    # Smooth angles
+    for col in [left_col, right_col]:
+        if col in df.columns:
+            sm = smooth_series(df[col].to_numpy(), method="savgol", window=SMOOTH_WINDOW, poly=SMOOTH_POLY)
+            df[col + "_smoothed"] = sm
+
+    # Detect reps on smoothed angles
+    left_series = df[left_col + "_smoothed"].bfill().ffill().to_numpy()
+    right_series = df[right_col + "_smoothed"].bfill().ffill().to_numpy()
+
+    min_gap = int(fps * REP_MIN_GAP_S)
+    reps_left, events_left = detect_reps_from_angle_series(left_series, up_thresh=ex.rep_up,
+                                                           down_thresh=ex.rep_down, min_gap=min_gap)
+    reps_right, events_right = detect_reps_from_angle_series(right_series, up_thresh=ex.rep_up,
+                                                             down_thresh=ex.rep_down, min_gap=min_gap)
+
+    summary = {
+        "frames": len(df),
+        "reps_left": reps_left,
+        "reps_right": reps_right,
+        "left_mean_angle": float(np.nanmean(left_series)),
+        "right_mean_angle": float(np.nanmean(right_series))
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    stage_stats = {}
+    df, summary = process_video(VIDEO_IN, VIDEO_OUT, CSV_OUT, exercise="bicep_curl", use_mlflow=USE_MLFLOW,
+                                cache=LandmarkCache(CACHE_DIR), stage_stats=stage_stats,
+                                session_path=SESSION_OUT, reps_path=REPS_OUT)
+    print("Summary:", summary)
+    for stage, st in stage_stats.items():
+        print(f"  {stage:>16}: {st['items']} frames, {st['fps']:.1f} fps "
+              f"(busy {st['busy_fps']:.1f} fps, blocked downstream {st['wait_out_s']:.2f}s)")
+    print("Saved:", VIDEO_OUT, CSV_OUT, SESSION_OUT, REPS_OUT)
@@ -0,0 +1,113 @@
+# src/motion_gate.py
+"""
+Motion-gated pose inference: skips MediaPipe on frames where nothing moved
+or nobody is in view.
+
+Each frame is reduced to a small grayscale thumbnail (GATE_WIDTH pixels
+wide: a bilinear subsample to 4x that size, then an area average, ~0.4 ms
+even for 4K input) and compared with the thumbnail of the last inferred
+frame. Motion is the fraction of thumbnail pixels that changed by more
+than PIXEL_DELTA grey levels. Then:
+  - person in view: inference only when motion >= MOTION_THRESH, or
+    STATIC_REFRESH_S after the last inference; frames in between reuse
+    the last landmarks (the person holds still, so they are still valid);
+  - nobody in view: a slow check every ABSENT_INTERVAL_S, or after
+    ABSENT_MOTION_S when something moves (someone walking in).
+Comparing against the last inferred frame, not the previous one, means
+slow drift still adds up to a new inference.
+"""
+import cv2
+import numpy as np
+from frame_buffers import FramePool
+
+GATE_WIDTH = 96
+PIXEL_DELTA = 15
+MOTION_THRESH = 0.003
+STATIC_REFRESH_S = 2.0
+ABSENT_INTERVAL_S = 1.0
+ABSENT_MOTION_S = 0.25
+
+
+class MotionGate:
+    """
+    Call due(frame) once per frame; when it returns True run inference and
+    report whether it found a pose with observe(present). Frames the gate
+    skips keep the previous results.
+
+    fps converts the *_s intervals to frames. frame: BGR or RGB (only
+    differences between frames matter, so the channel order doesn't).
+    """
+    def __init__(self, fps=30.0, width=GATE_WIDTH, pixel_delta=PIXEL_DELTA,
+                 motion_thresh=MOTION_THRESH, static_refresh_s=STATIC_REFRESH_S,
+                 absent_interval_s=ABSENT_INTERVAL_S, absent_motion_s=ABSENT_MOTION_S):
+        self.width = width
+        self.pixel_delta = pixel_delta
+        self.motion_thresh = motion_thresh
+        self.static_refresh = max(1, round(static_refresh_s * fps))
+        self.absent_interval = max(1, round(absent_interval_s * fps))
+        self.absent_motion = max(1, round(absent_motion_s * fps))
+        self._mid = FramePool()
+        self._mid_gray = FramePool()
+        self._slots = [None, None]
+        self.reset()
+
+    def reset(self):
+        self.present = False
+        self.motion = 0.0
+        self.frames = 0
+        self.inferred = 0
+        self.skipped_static = 0
+        self.skipped_absent = 0
+        self._ref = None
+        self._current = None
+        self._last = None
+
+    def due(self, frame):
+        """
+        True if this frame needs pose inference.
+        """
+        idx = self.frames
+        self.frames += 1
+        self._current = small = self._thumbnail(frame)
+        if self._ref is None or self._ref.shape != small.shape:
+            return True
+        self.motion = float(np.count_nonzero(cv2.absdiff(small, self._ref) > self.pixel_delta)) / small.size
+        moved = self.motion >= self.motion_thresh
+        since = idx - self._last
+        if self.present:
+            if moved or since >= self.static_refresh:
+                return True
+            self.skipped_static += 1
+        else:
+            if since >= self.absent_interval or (moved and since >= self.absent_motion):
+                return True
+            self.skipped_absent += 1
+        return False
+
+    def observe(self, present):
+        """
+        After inference on the frame last passed to due(): present = a
+        pose was found.
+        """
+        self.present = bool(present)
+        self.inferred += 1
+        self._last = self.frames - 1
+        self._ref = self._current
+
+    def report(self):
+        return {"frames": self.frames, "inferred": self.inferred,
+                "skipped_static": self.skipped_static, "skipped_absent": self.skipped_absent}
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        sw = min(self.width, w)
+        sh = max(1, round(h * sw / w))
+        mw, mh = min(4 * sw, w), min(4 * sh, h)
+        mid = cv2.resize(frame, (mw, mh), dst=self._mid.take((mh, mw, 3)), interpolation=cv2.INTER_LINEAR)
+        gray = cv2.cvtColor(mid, cv2.COLOR_BGR2GRAY, dst=self._mid_gray.take((mh, mw)))
+        # Two thumbnails: the reference stays intact however many frames pass
+        i = 1 if self._slots[0] is self._ref else 0
+        if self._slots[i] is None or self._slots[i].shape != (sh, sw):
+            self._slots[i] = np.empty((sh, sw), dtype=np.uint8)
+        cv2.resize(gray, (sw, sh), dst=self._slots[i], interpolation=cv2.INTER_AREA)
+        return self._slots[i]
@@ -0,0 +1,274 @@
+# src/multi_person.py
+"""
+Multi-person pose tracking for group classes filmed by one camera.
+
+MediaPipe Pose finds one person per call, so people are found by a
+full-frame search with everyone already tracked masked out (one pass per
+new person), and each track then follows its person with its own ROI-mode
+PoseDetector on a crop around the previous landmarks. Inference cost grows
+with the number of people, not the frame size. Searches only run every
+search_every frames (or while nobody is tracked); their detections are
+matched to existing tracks with a Hungarian assignment on IoU / centroid
+distance so track IDs stay stable. Every track keeps its own rule feedback,
+smoother and rep counters.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import mediapipe as mp
+from scipy.optimize import linear_sum_assignment
+from pose_detector import PoseDetector, landmarks_to_array, NUM_LANDMARKS
+from form_rules import FormScorer
+from rule_spec import load_exercises
+
+DEFAULT_EXERCISE = "bicep_curl"
+POSE_CONNECTIONS = mp.solutions.pose.POSE_CONNECTIONS
+
+
+def landmark_box(row, w, h, min_visibility=0.5):
+    """
+    Tight (x0, y0, x1, y1) pixel box around the visible landmarks of a
+    (33, 4) row, or None if fewer than 4 are visible / no pose.
+    """
+    vis = row[:, 3] >= min_visibility
+    if np.count_nonzero(vis) < 4:
+        return None
+    xs, ys = row[vis, 0] * w, row[vis, 1] * h
+    return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+
+
+def iou_matrix(a, b):
+    """
+    Pairwise IoU of (N, 4) and (M, 4) x0, y0, x1, y1 boxes -> (N, M).
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ix = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = ix * iy
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def associate(track_boxes, det_boxes, iou_thresh=0.3, max_center_dist=0.5):
+    """
+    Hungarian matching of tracks to detections. Cost is 1 - IoU; pairs that
+    don't overlap fall back to centroid distance (in units of the boxes'
+    mean diagonal) so a fast mover can still be matched. A pair is accepted
+    if IoU >= iou_thresh or the centroids are within max_center_dist.
+    Returns (matches [(track_i, det_j)], unmatched track indices,
+    unmatched detection indices).
+    """
+    n, m = len(track_boxes), len(det_boxes)
+    if n == 0 or m == 0:
+        return [], list(range(n)), list(range(m))
+    a = np.asarray(track_boxes, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(det_boxes, dtype=np.float64).reshape(-1, 4)
+    iou = iou_matrix(a, b)
+    ca = (a[:, :2] + a[:, 2:]) / 2
+    cb = (b[:, :2] + b[:, 2:]) / 2
+    diag = (np.hypot(a[:, 2] - a[:, 0], a[:, 3] - a[:, 1])[:, None]
+            + np.hypot(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1])[None, :]) / 2
+    center = np.linalg.norm(ca[:, None] - cb[None, :], axis=2) / np.maximum(diag, 1.0)
+    cost = np.where(iou > 0, 1 - iou, 1 + center)
+
+    rows, cols = linear_sum_assignment(cost)
+    matches = [(i, j) for i, j in zip(rows, cols)
+               if iou[i, j] >= iou_thresh or center[i, j] <= max_center_dist]
+    matched_t = {i for i, _ in matches}
+    matched_d = {j for _, j in matches}
+    return (matches, [i for i in range(n) if i not in matched_t],
+            [j for j in range(m) if j not in matched_d])
+
+
+class PersonTrack(FormScorer):
+    """
+    One tracked person: its own detector (MediaPipe keeps temporal state per
+    graph), last landmarks and box, plus its FormScorer rule / rep state.
+    """
+    def __init__(self, track_id, detector, exercise, fps):
+        super().__init__(exercise, fps)
+        self.id = track_id
+        self.detector = detector
+        self.landmarks = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+        self.person_box = None
+        self.crop_box = None
+        self.misses = 0
+        self.age = 0
+
+    @property
+    def visible(self):
+        return not np.isnan(self.landmarks[0, 0])
+
+    def seed(self, row, person_box, w, h):
+        self.landmarks = row
+        self.person_box = person_box
+        self.detector.roi.seed(person_box, w, h)
+        self.crop_box = self.detector.roi.box
+        self.misses = 0
+
+    def observe(self, results, w, h):
+        self.age += 1
+        row = landmarks_to_array(results)
+        box = landmark_box(row, w, h, self.detector.roi.min_visibility)
+        if box is None:
+            self.landmarks = np.full_like(self.landmarks, np.nan)
+            self.misses += 1
+            return
+        self.landmarks = row
+        self.person_box = box
+        self.crop_box = self.detector.roi.box or self.crop_box
+        self.misses = 0
+
+
+class MultiPersonTracker:
+    """
+    Call update(frame) once per BGR frame; returns the active PersonTracks
+    (scored for that frame). Tracks are dropped after max_misses frames
+    without a pose, or when they collapse onto the same person as an older
+    track. workers > 1 runs the per-track inferences concurrently (each
+    track has its own graph). exercise is a compiled rule_spec.Exercise
+    (bicep curls by default).
+    """
+    def __init__(self, max_people=4, search_every=15, max_misses=10, fps=30.0, exercise=None,
+                 workers=None, detector_settings=None, iou_thresh=0.3, duplicate_iou=0.5):
+        self.max_people = max_people
+        self.search_every = search_every
+        self.max_misses = max_misses
+        self.fps = fps
+        self.exercise = load_exercises()[DEFAULT_EXERCISE] if exercise is None else exercise
+        self.iou_thresh = iou_thresh
+        self.duplicate_iou = duplicate_iou
+        self.detector_settings = {**(detector_settings or {}), "roi": True, "roi_square": True,
+                                  "static_image_mode": False}
+        self.searcher = PoseDetector(**{**self.detector_settings, "roi_square": False,
+                                        "static_image_mode": True})
+        self.tracks = []
+        self.frame_idx = 0
+        self._next_id = 1
+        self._spare = []
+        workers = max_people if workers is None else workers
+        self._pool = ThreadPoolExecutor(workers) if workers > 1 else None
+
+    def update(self, frame):
+        h, w = frame.shape[:2]
+        # Existing tracks follow their person inside their own crop
+        for tr, res in zip(self.tracks, self._map(lambda tr: tr.detector.detect_box(frame, tr.crop_box),
+                                                  self.tracks)):
+            tr.observe(res, w, h)
+        self._prune()
+
+        visible = sum(tr.visible for tr in self.tracks)
+        if visible < self.max_people and (not self.tracks or self.frame_idx % self.search_every == 0):
+            self._add_people(frame)
+        self.frame_idx += 1
+
+        for tr in self.tracks:
+            tr.score(tr.landmarks, w, h)
+        return self.tracks
+
+    def _map(self, fn, items):
+        if self._pool is None or len(items) < 2:
+            return [fn(it) for it in items]
+        return list(self._pool.map(fn, items))
+
+    def _prune(self):
+        keep = []
+        for tr in sorted(self.tracks, key=lambda t: t.id):
+            dup = tr.visible and any(
+                k.visible and iou_matrix(tr.person_box, k.person_box)[0, 0] > self.duplicate_iou for k in keep)
+            if tr.misses > self.max_misses or dup:
+                self._release(tr.detector)
+            else:
+                keep.append(tr)
+        self.tracks = keep
+
+    def _search(self, frame, max_found):
+        """
+        Full-frame passes with every visible person blanked out; each pass
+        finds at most one new person. Lost tracks stay unmasked, so a person
+        reappearing where one was last seen can re-seed it. Returns
+        [(row, person_box)].
+        """
+        h, w = frame.shape[:2]
+        size = self.searcher.roi.input_size(w, h)
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR) if size != (w, h) else frame.copy()
+        sx, sy = size[0] / w, size[1] / h
+        full = (0, 0, size[0], size[1])
+
+        def blank(box):
+            x0, y0, x1, y1 = box
+            m = 0.1 * max(x1 - x0, y1 - y0)
+            small[max(0, int((y0 - m) * sy)):int((y1 + m) * sy) + 1,
+                  max(0, int((x0 - m) * sx)):int((x1 + m) * sx) + 1] = 0
+
+        for tr in self.tracks:
+            if tr.visible and tr.person_box is not None:
+                blank(tr.person_box)
+        found = []
+        for _ in range(max_found):
+            # static_image_mode: every pass is an independent detection
+            row = landmarks_to_array(self.searcher.detect_box(small, full))
+            box = landmark_box(row, w, h, self.searcher.roi.min_visibility)
+            if box is None:
+                break
+            found.append((row, box))
+            blank(box)
+        return found
+
+    def _add_people(self, frame):
+        h, w = frame.shape[:2]
+        found = self._search(frame, self.max_people - sum(tr.visible for tr in self.tracks))
+        known = [tr.person_box for tr in self.tracks if tr.person_box is not None]
+        known_tracks = [tr for tr in self.tracks if tr.person_box is not None]
+        matches, _, new = associate(known, [box for _, box in found], self.iou_thresh)
+        for i, j in matches:
+            # Re-found a track that lost its person: restart it on the new box
+            if not known_tracks[i].visible:
+                known_tracks[i].seed(*found[j], w, h)
+        for j in new:
+            if len(self.tracks) >= self.max_people:
+                break
+            tr = PersonTrack(self._next_id, self._acquire(), self.exercise, self.fps)
+            self._next_id += 1
+            tr.seed(*found[j], w, h)
+            self.tracks.append(tr)
+
+    def _acquire(self):
+        # Building a MediaPipe graph is slow; reuse detectors of dropped tracks
+        return self._spare.pop() if self._spare else PoseDetector(**self.detector_settings)
+
+    def _release(self, detector):
+        detector.reset()
+        self._spare.append(detector)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        for d in [tr.detector for tr in self.tracks] + self._spare + [self.searcher]:
+            d.close()
+        self.tracks, self._spare = [], []
+
+
+def draw_tracks(frame, tracks):
+    """
+    Skeleton, box, ID, reps and first feedback line for every visible track.
+    """
+    h, w = frame.shape[:2]
+    for tr in tracks:
+        if not tr.visible:
+            continue
+        color = ((53 * tr.id) % 256, (97 * tr.id + 80) % 256, (151 * tr.id + 160) % 256)
+        pts = [(int(x * w), int(y * h)) for x, y in tr.landmarks[:, :2].tolist()]
+        for a, b in POSE_CONNECTIONS:
+            cv2.line(frame, pts[a], pts[b], color, 2)
+        x0, y0, x1, y1 = (int(v) for v in tr.person_box)
+        cv2.rectangle(frame, (x0, y0), (x1, y1), color, 2)
+        reps = tr.reps
+        cv2.putText(frame, f"#{tr.id} L:{reps['left']} R:{reps['right']}", (x0, max(20, y0 - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        if tr.feedback:
+            cv2.putText(frame, tr.feedback[0], (x0, min(h - 10, y1 + 25)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
@@ -0,0 +1,158 @@
+# src/pipeline.py
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class StagedPipeline:
+    """
+    source -> stage 1 -> ... -> stage N, each running in its own thread and
+    connected by bounded queues. A full queue blocks the stage feeding it,
+    which is the only backpressure. Every stage is a single FIFO worker, so
+    items come out in the order the source produced them.
+
+    stages: list of (name, fn); fn(item) returns the item for the next stage
+    (the last stage's return value is dropped). A stage given as
+    (name, fn, flush) may hold items back: fn returns a list of zero or more
+    items, and flush() returns whatever is left once the input is exhausted.
+    """
+    def __init__(self, source, stages, source_name="source", queue_size=8):
+        self.source = source
+        self.source_name = source_name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {}
+        self._stop = threading.Event()
+        self._error = None
+
+    def run(self):
+        """
+        Blocks until every item went through all stages. Re-raises the first
+        exception from any stage. Returns per-stage stats (see report()).
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        it = iter(self.source)
+        threads = [threading.Thread(target=self._worker, daemon=True,
+                                    args=(self.source_name, None, None, queues[0], it))]
+        for i, (name, fn, *flush) in enumerate(self.stages):
+            q_out = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self._worker, daemon=True,
+                                            args=(name, fn, queues[i], q_out, None, *flush)))
+
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wall_s = time.perf_counter() - t0
+
+        if self._error is not None:
+            raise self._error
+        return self.report()
+
+    def report(self):
+        """
+        {stage: {items, busy_s, wait_in_s, wait_out_s, fps, busy_fps}}.
+        busy_fps is the rate the stage could sustain alone; wait_out_s is
+        time spent blocked on a full downstream queue.
+        """
+        out = {}
+        for name, st in self.stats.items():
+            out[name] = dict(st,
+                             fps=st["items"] / self.wall_s if self.wall_s else 0.0,
+                             busy_fps=st["items"] / st["busy_s"] if st["busy_s"] else 0.0)
+        return out
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _worker(self, name, fn, q_in, q_out, source_iter, flush=None):
+        st = {"items": 0, "busy_s": 0.0, "wait_in_s": 0.0, "wait_out_s": 0.0}
+        self.stats[name] = st
+        try:
+            while True:
+                t0 = time.perf_counter()
+                if source_iter is not None:
+                    item = next(source_iter, _DONE)
+                    st["busy_s"] += time.perf_counter() - t0
+                else:
+                    item = self._get(q_in)
+                    st["wait_in_s"] += time.perf_counter() - t0
+                if item is _DONE:
+                    break
+
+                if fn is not None:
+                    t0 = time.perf_counter()
+                    item = fn(item)
+                    st["busy_s"] += time.perf_counter() - t0
+                st["items"] += 1
+
+                if not self._emit(q_out, item if flush else [item], st):
+                    return
+            if flush:
+                t0 = time.perf_counter()
+                rest = flush()
+                st["busy_s"] += time.perf_counter() - t0
+                if not self._emit(q_out, rest, st):
+                    return
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+            return
+        if q_out is not None:
+            self._put(q_out, _DONE)
+
+    def _emit(self, q_out, items, st):
+        if q_out is None:
+            return True
+        t0 = time.perf_counter()
+        for item in items:
+            if not self._put(q_out, item):
+                return False
+        st["wait_out_s"] += time.perf_counter() - t0
+        return True
+
+
+class LatestFrame:
+    """
+    Single-slot buffer between a producer thread and a consumer (the Tk
+    main thread, a server worker, ...). put() overwrites whatever is waiting (stale frames are dropped), get()
+    returns the newest item once, or None if nothing new arrived.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self._seq = 0
+        self._read_seq = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self._lock:
+            if self._seq != self._read_seq:
+                self.dropped += 1
+            self._item = item
+            self._seq += 1
+
+    def get(self):
+        with self._lock:
+            if self._seq == self._read_seq:
+                return None
+            self._read_seq = self._seq
+            return self._item
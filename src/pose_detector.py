@@ -1,30 +1,262 @@
-# src/pose_detector.py
-import mediapipe as mp
-import cv2
-
-class PoseDetector:
-    def __init__(self,
-                 static_image_mode=False,
-                 model_complexity=1,
-                 min_detection_confidence=0.5,
-                 min_tracking_confidence=0.5):
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=static_image_mode,
-            model_complexity=model_complexity,
-            enable_segmentation=False,
-            min_detection_confidence=min_detection_confidence,
-            min_tracking_confidence=min_tracking_confidence
-        )
-
-    def detect(self, frame_bgr):
-        """
-        Input: BGR frame (numpy array).
-        Output: Mediapipe results object (has .pose_landmarks)
-        """
-        img_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        results = self.pose.process(img_rgb)
-        return results
-
-    def close(self):
-        self.pose.close()
+# src/pose_detector.py
+import cv2
+import numpy as np
+from frame_buffers import FramePool, readonly
+
+NUM_LANDMARKS = 33
+
+class PoseDetector:
+    DEFAULT_SETTINGS = {
+        "static_image_mode": False,
+        "model_complexity": 1,
+        "min_detection_confidence": 0.5,
+        "min_tracking_confidence": 0.5,
+        "roi": False,
+        "roi_max_side": 640,
+        "roi_square": False
+    }
+
+    def __init__(self,
+                 static_image_mode=False,
+                 model_complexity=1,
+                 min_detection_confidence=0.5,
+                 min_tracking_confidence=0.5,
+                 roi=False,
+                 roi_max_side=640,
+                 roi_square=False):
+        """
+        roi=True crops each frame to the person's padded bounding box from
+        the previous frame (full frame while searching) and downscales it so
+        its longer side is at most roi_max_side before colour conversion and
+        inference. Landmarks are mapped back to full-frame coordinates, so
+        callers see the same results object either way. roi_square=True uses
+        square crops instead of frame-shaped ones, which fit one person in a
+        wide frame better (see multi_person).
+        """
+        # Everything that changes the landmarks produced (used as a cache key)
+        self.settings = {
+            "static_image_mode": static_image_mode,
+            "model_complexity": model_complexity,
+            "min_detection_confidence": min_detection_confidence,
+            "min_tracking_confidence": min_tracking_confidence,
+            "roi": roi,
+            "roi_max_side": roi_max_side,
+            "roi_square": roi_square
+        }
+        self.roi = RoiTracker(max_side=roi_max_side, square=roi_square) if roi else None
+        self._last_box = None
+        # Reused colour conversion / ROI resize targets (see frame_buffers)
+        self._rgb = FramePool()
+        self._crop = FramePool()
+        # Imported here, not at module load: mediapipe takes ~0.7 s to import
+        import mediapipe as mp
+        self.mp_pose = mp.solutions.pose
+        self.pose = self.mp_pose.Pose(
+            static_image_mode=static_image_mode,
+            model_complexity=model_complexity,
+            enable_segmentation=False,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
+        )
+
+    def detect(self, frame_bgr, telemetry=None, rgb=None):
+        """
+        Input: BGR frame (numpy array).
+        Output: Mediapipe results object (has .pose_landmarks)
+        rgb: the same frame already converted (frame_buffers.rgb_view, e.g.
+        shared with the display); the conversion is skipped then.
+        With a Telemetry, times "color_convert" and "inference" separately.
+        """
+        if self.roi is not None:
+            return self._detect_roi(frame_bgr, telemetry, rgb)
+        t = telemetry.clock() if telemetry is not None else 0.0
+        if rgb is None:
+            rgb = readonly(cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=self._rgb.take(frame_bgr.shape)))
+            if telemetry is not None:
+                t = telemetry.lap("color_convert", t)
+        results = self.pose.process(rgb)
+        if telemetry is not None:
+            telemetry.lap("inference", t)
+        return results
+
+    def _detect_roi(self, frame_bgr, telemetry, rgb):
+        h, w = frame_bgr.shape[:2]
+        tracking = self.roi.box is not None
+        results = self.detect_box(frame_bgr, self.roi.box or (0, 0, w, h), telemetry, rgb)
+        if not results.pose_landmarks and tracking:
+            # Lost the person: search the whole frame again right away
+            self.roi.box = None
+            results = self.detect_box(frame_bgr, (0, 0, w, h), telemetry, rgb)
+        return results
+
+    def detect_box(self, frame_bgr, box, telemetry=None, rgb=None):
+        """
+        ROI-mode inference on the crop box = (x0, y0, x1, y1) only, with no
+        full-frame fallback. Landmarks come back in full-frame coordinates
+        and roi.box follows the person found. rgb: as in detect().
+        """
+        h, w = frame_bgr.shape[:2]
+        size = self.roi.input_size(w, h)
+        src = frame_bgr if rgb is None else rgb
+        t = telemetry.clock() if telemetry is not None else 0.0
+        results = self._process_crop(src, rgb is not None, box, size, telemetry, t)
+        if not results.pose_landmarks and box != self._last_box:
+            # MediaPipe tracks in input-image coordinates, so a moved crop
+            # usually loses it for one call; it re-detects on the next one
+            results = self._process_crop(src, rgb is not None, box, size, telemetry,
+                                         telemetry.clock() if telemetry is not None else 0.0)
+        self._last_box = box
+        if results.pose_landmarks:
+            x0, y0, x1, y1 = box
+            cw, ch = x1 - x0, y1 - y0
+            for p in results.pose_landmarks.landmark:
+                p.x = (x0 + p.x * cw) / w
+                p.y = (y0 + p.y * ch) / h
+                p.z = p.z * cw / w  # z shares the x scale
+            self.roi.update(results.pose_landmarks.landmark, w, h)
+        return results
+
+    def _process_crop(self, frame, is_rgb, box, size, telemetry, t):
+        x0, y0, x1, y1 = box
+        crop = frame[y0:y1, x0:x1]  # view, no copy
+        resized = (x1 - x0, y1 - y0) != size
+        if resized:
+            crop = cv2.resize(crop, size, dst=self._crop.take((size[1], size[0], 3)),
+                              interpolation=cv2.INTER_LINEAR)
+        if telemetry is not None:
+            t = telemetry.lap("roi_crop", t)
+        if not is_rgb:
+            # Resized crops are ours: convert in place
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB,
+                                dst=crop if resized else self._rgb.take(crop.shape))
+            if telemetry is not None:
+                t = telemetry.lap("color_convert", t)
+        elif not crop.flags.c_contiguous:
+            # MediaPipe's reference mode needs a contiguous array
+            contiguous = self._crop.take(crop.shape)
+            np.copyto(contiguous, crop)
+            crop = contiguous
+        results = self.pose.process(readonly(crop))
+        if telemetry is not None:
+            telemetry.lap("inference", t)
+        return results
+
+    def reset(self):
+        """
+        Drop tracking state so the detector can be reused for another video.
+        """
+        self.pose.reset()
+        self._last_box = None
+        if self.roi is not None:
+            self.roi.box = None
+
+    def close(self):
+        self.pose.close()
+
+    @classmethod
+    def resolve_settings(cls, settings=None):
+        """
+        Fill a partial settings dict with constructor defaults.
+        """
+        return {**cls.DEFAULT_SETTINGS, **(settings or {})}
+
+
+class RoiTracker:
+    """
+    Person bounding box for PoseDetector's ROI mode, in full-frame pixels
+    (x0, y0, x1, y1), or None while searching the full frame.
+
+    The box is the visible landmarks' extent padded by `padding` times its
+    longer side, widened to the frame's aspect ratio (or a square with
+    square=True) and never smaller than the inference input, so every crop
+    resizes to the same input_size (MediaPipe stalls for ~100 ms whenever
+    its input resolution changes).
+    It only moves when the person leaves the inner part of the current box
+    or shrinks well inside it, so the crop stays put for most frames.
+    """
+    def __init__(self, max_side=640, padding=0.3, min_visibility=0.5, max_area_ratio=2.5, square=False):
+        self.max_side = max_side
+        self.square = square
+        self.padding = padding
+        self.min_visibility = min_visibility
+        self.max_area_ratio = max_area_ratio
+        self.box = None
+
+    def input_size(self, w, h):
+        if self.square:
+            side = min(self.max_side, w, h)
+            return side, side
+        scale = min(1.0, self.max_side / max(w, h))
+        return max(1, round(w * scale)), max(1, round(h * scale))
+
+    def _fit(self, bx0, by0, bx1, by1, w, h):
+        if self.square:
+            # Any square fits in the frame; small ones are upscaled to input_size
+            side = round(min(max(bx1 - bx0, by1 - by0, 32), w, h))
+            x0 = int(min(max(0.0, (bx0 + bx1 - side) / 2), w - side))
+            y0 = int(min(max(0.0, (by0 + by1 - side) / 2), h - side))
+            return x0, y0, x0 + side, y0 + side
+        in_w, _ = self.input_size(w, h)
+        bw = max(bx1 - bx0, (by1 - by0) * w / h, in_w)
+        if bw >= w:
+            return 0, 0, w, h
+        bh = bw * h / w
+        x0 = min(max(0.0, (bx0 + bx1 - bw) / 2), w - bw)
+        y0 = min(max(0.0, (by0 + by1 - bh) / 2), h - bh)
+        return int(x0), int(y0), int(x0) + round(bw), int(y0) + round(bh)
+
+    def update(self, landmarks, w, h):
+        """
+        Updates the box from full-frame normalized landmarks; returns True
+        while tracking (False and box=None if too few points are visible).
+        """
+        pts = [(p.x * w, p.y * h) for p in landmarks if p.visibility >= self.min_visibility]
+        if len(pts) < 4:
+            self.box = None
+            return False
+        xs, ys = zip(*pts)
+        bx0, by0, bx1, by1 = min(xs), min(ys), max(xs), max(ys)
+        side = max(bx1 - bx0, by1 - by0)
+        if self.box is not None:
+            # Keep the box if the half-padded person still fits and fills enough of it
+            m = 0.5 * self.padding * side
+            need = self._fit(bx0 - m, by0 - m, bx1 + m, by1 + m, w, h)
+            x0, y0, x1, y1 = self.box
+            # (clamped at the frame border: a box touching the edge can't grow past it)
+            inside = (x0 <= max(0, bx0 - m) and y0 <= max(0, by0 - m)
+                      and min(w, bx1 + m) <= x1 and min(h, by1 + m) <= y1)
+            need_area = (need[2] - need[0]) * (need[3] - need[1])
+            if inside and (x1 - x0) * (y1 - y0) <= self.max_area_ratio * need_area:
+                return True
+        self.seed((bx0, by0, bx1, by1), w, h)
+        return True
+
+    def seed(self, person_box, w, h):
+        """
+        Starts tracking from a tight person box (x0, y0, x1, y1) in pixels.
+        """
+        bx0, by0, bx1, by1 = person_box
+        pad = self.padding * max(bx1 - bx0, by1 - by0)
+        self.box = self._fit(bx0 - pad, by0 - pad, bx1 + pad, by1 + pad, w, h)
+
+
+def landmarks_to_array(results):
+    """
+    Mediapipe results -> (33, 4) float32 array of normalized x, y, z, visibility.
+    All NaN when no pose was detected.
+    """
+    if not results.pose_landmarks:
+        return np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    return np.array([(p.x, p.y, p.z, p.visibility) for p in results.pose_landmarks.landmark],
+                    dtype=np.float32)
+
+
+def world_landmarks_to_array(results):
+    """
+    Mediapipe results -> (33, 4) float32 array of the 3D world landmarks
+    (meters, origin between the hips) plus visibility. All NaN when no pose.
+    """
+    if not getattr(results, "pose_world_landmarks", None):
+        return np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    return np.array([(p.x, p.y, p.z, p.visibility) for p in results.pose_world_landmarks.landmark],
+                    dtype=np.float32)
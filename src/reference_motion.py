@@ -0,0 +1,379 @@
+# src/reference_motion.py
+"""
+Reference-motion matching: scores each rep against the motion of a
+tutorial clip.
+
+A template is built once per (tutorial video, exercise): its landmarks
+(through LandmarkCache) give per-side joint-angle trajectories (elbow,
+shoulder, hip and knee angles in frame pixels, JOINT_ANGLES); reps are cut
+at the exercise's rep events, each is smoothed and resampled to RESAMPLE
+samples, and the medoid rep (smallest total DTW distance to the others)
+becomes the template. Joints the clip rarely shows (median visibility
+below MIN_VISIBILITY) are left out. Templates are cached as .npz in
+TEMPLATE_DIR.
+
+A user's rep goes through the same steps and is aligned to the template
+with dynamic time warping restricted to a Sakoe-Chiba band (|i - j| <=
+BAND * RESAMPLE). Each band row is computed with a handful of numpy
+operations: the dependency on the cell to the left is a running minimum,
+D[i, j] = S[j] + min_{k <= j}(T[k] - S[k]), with S the row's cumulative
+cost and T the best of the cells above / diagonally above. A 64-sample rep
+takes about a millisecond, so reps are scored inside the live loop.
+
+The result per rep:
+    similarity     exp(-distance_deg / SIMILARITY_SCALE_DEG), 1 = identical
+    distance_deg   mean joint-angle deviation along the alignment (degrees)
+    worst_phase    "concentric" or "eccentric": the template phase (split
+                   at its turning point) with the largest mean deviation
+    worst_joint    the joint deviating most within that phase
+    phase_deviation_deg  {phase: mean deviation}
+
+Both sides trim a rep to start where the rep value last left the "down"
+threshold, so a hold before the movement doesn't count as part of it.
+
+usage: python src/reference_motion.py TUTORIAL_VIDEO [--exercise NAME] [--video VIDEO]
+"""
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+from form_rules import LM
+from landmark_cache import CACHE_DIR, LandmarkCache, load_or_extract_landmarks, video_hash
+from pose_detector import PoseDetector
+from rule_spec import load_exercises
+from utils import (
+    calculate_angle_batch, smooth_series, detect_reps_from_angle_series,
+    REP_MIN_GAP_S, SMOOTH_WINDOW, SMOOTH_POLY
+)
+
+TEMPLATE_DIR = os.path.join("output", "templates")
+TEMPLATE_VERSION = 1
+RESAMPLE = 64
+BAND = 0.15
+SIMILARITY_SCALE_DEG = 25.0
+MIN_VISIBILITY = 0.5
+# Longest rep the live matcher keeps landmarks for
+MAX_REP_S = 10.0
+
+# Joint angles compared per side: (first, vertex, last) joint names
+JOINT_ANGLES = {
+    "elbow": ("SHOULDER", "ELBOW", "WRIST"),
+    "shoulder": ("HIP", "SHOULDER", "ELBOW"),
+    "hip": ("SHOULDER", "HIP", "KNEE"),
+    "knee": ("HIP", "KNEE", "ANKLE")
+}
+SIDES = ("left", "right")
+_TRIPLETS = {side: np.array([[LM[f"{side.upper()}_{j}"] for j in joints] for joints in JOINT_ANGLES.values()])
+             for side in SIDES}
+
+
+def joint_angles(landmarks, w, h, side):
+    """
+    Normalized (N, 33, 4) landmarks (or one (33, 4) row) -> JOINT_ANGLES of
+    one side in degrees (..., K), NaN without a pose, and each angle's
+    visibility (the lowest of its three joints).
+    """
+    lm = np.asarray(landmarks, dtype=float)
+    idx = _TRIPLETS[side]
+    pts = lm[..., idx, :2] * (w, h)
+    angles = calculate_angle_batch(pts[..., 0, :], pts[..., 1, :], pts[..., 2, :])
+    return angles, lm[..., idx, 3].min(axis=-1)
+
+
+def rep_start(rep_values, start, end, down):
+    """
+    First frame of the movement of the rep ending at `end` (window starts
+    at `start`): right after the rep value was last >= down before its
+    turning point.
+    """
+    v = np.asarray(rep_values[start:end + 1], dtype=float)
+    if not len(v) or np.isnan(v).all():
+        return start
+    turn = int(np.nanargmin(v))
+    above = np.flatnonzero(v[:turn] >= down)
+    return start + (int(above[-1]) + 1 if len(above) else 0)
+
+
+def prepare(angles, length=RESAMPLE):
+    """
+    (n, K) joint angles of one rep -> (length, K): NaN gaps filled, each
+    channel smoothed like the rep values and resampled to a fixed length.
+    Channels without any value stay NaN.
+    """
+    a = np.column_stack([smooth_series(col, "savgol", SMOOTH_WINDOW, SMOOTH_POLY) for col in angles.T])
+    x = np.linspace(0, len(a) - 1, length)
+    i0 = np.floor(x).astype(int)
+    i1 = np.minimum(i0 + 1, len(a) - 1)
+    t = (x - i0)[:, None]
+    return a[i0] * (1 - t) + a[i1] * t
+
+
+def dtw(a, b, band=BAND):
+    """
+    Banded DTW of trajectories a (n, K) and b (m, K); the local cost is the
+    mean absolute difference over the K channels. Cells further than
+    band * max(n, m) from the (rescaled) diagonal are excluded.
+    Returns (mean cost along the path, path rows, path columns).
+    """
+    n, m = len(a), len(b)
+    cost = np.abs(a[:, None, :] - b[None, :, :]).mean(axis=2)
+    r = max(1, int(np.ceil(band * max(n, m))))
+    centre = np.arange(n) * (m - 1) / max(n - 1, 1)
+    lo = np.clip(np.floor(centre - r).astype(int), 0, m - 1)
+    hi = np.clip(np.ceil(centre + r).astype(int) + 1, 1, m)
+    D = np.full((n, m), np.inf)
+    D[0, lo[0]:hi[0]] = np.cumsum(cost[0, lo[0]:hi[0]])
+    for i in range(1, n):
+        a0, a1 = lo[i], hi[i]
+        up = D[i - 1, a0:a1]
+        diag = D[i - 1, a0 - 1:a1 - 1] if a0 > 0 else np.concatenate(([np.inf], D[i - 1, a0:a1 - 1]))
+        c = cost[i, a0:a1]
+        s = np.cumsum(c)
+        best = c + np.minimum(up, diag)
+        D[i, a0:a1] = s + np.minimum.accumulate(best - s)
+    # Backtrack (n + m steps at most) on Python floats
+    acc = D.tolist()
+    i, j = n - 1, m - 1
+    rows, cols = [i], [j]
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            diag, up, left = acc[i - 1][j - 1], acc[i - 1][j], acc[i][j - 1]
+            if diag <= up and diag <= left:
+                i, j = i - 1, j - 1
+            elif up <= left:
+                i -= 1
+            else:
+                j -= 1
+        rows.append(i)
+        cols.append(j)
+    rows, cols = np.array(rows[::-1]), np.array(cols[::-1])
+    return float(cost[rows, cols].mean()), rows, cols
+
+
+class MotionTemplate:
+    """
+    Per-side reference trajectories of one exercise: trajectory (RESAMPLE,
+    K) joint angles, mask (K,) joints used, turn (index of the turning
+    point: the phases before / after it are phases[0] / phases[1]).
+    """
+    def __init__(self, exercise, sides, phases, meta=None):
+        self.exercise = exercise
+        self.sides = sides
+        self.phases = tuple(phases)
+        self.meta = meta or {}
+
+    def match(self, side, angles):
+        """
+        Scores one rep's (n, K) joint angles of `side` against the template.
+        """
+        ref = self.sides[side]
+        rep = prepare(angles, len(ref["trajectory"]))
+        mask = ref["mask"] & ~np.isnan(rep).any(axis=0)
+        if not mask.any():
+            return None
+        distance, rows, cols = dtw(rep[:, mask], ref["trajectory"][:, mask])
+        dev = np.abs(rep[rows][:, mask] - ref["trajectory"][cols][:, mask])
+        first = cols < ref["turn"]
+        phase_dev = {}
+        for phase, sel in zip(self.phases, (first, ~first)):
+            if sel.any():
+                phase_dev[phase] = float(dev[sel].mean())
+        worst = max(phase_dev, key=phase_dev.get)
+        sel = first if worst == self.phases[0] else ~first
+        joints = [f"{side}_{name}" for name, used in zip(JOINT_ANGLES, mask) if used]
+        return {
+            "similarity": round(float(np.exp(-distance / SIMILARITY_SCALE_DEG)), 3),
+            "distance_deg": round(distance, 1),
+            "worst_phase": worst,
+            "worst_joint": joints[int(np.argmax(dev[sel].mean(axis=0)))],
+            "phase_deviation_deg": {k: round(v, 1) for k, v in phase_dev.items()}
+        }
+
+    def save(self, path):
+        arrays = {}
+        for side, ref in self.sides.items():
+            arrays.update({f"{side}_trajectory": ref["trajectory"], f"{side}_mask": ref["mask"],
+                           f"{side}_turn": ref["turn"]})
+        info = {"exercise": self.exercise, "sides": list(self.sides), "phases": self.phases, "meta": self.meta}
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, info=json.dumps(info), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            info = json.loads(str(z["info"]))
+            sides = {side: {"trajectory": z[f"{side}_trajectory"], "mask": z[f"{side}_mask"],
+                            "turn": int(z[f"{side}_turn"])} for side in info["sides"]}
+        return cls(info["exercise"], sides, info["phases"], info["meta"])
+
+
+def rep_windows(rep_values, fps, exercise):
+    """
+    (start, end) frames of every rep in a raw per-frame rep value series,
+    counted like the offline scorer and trimmed with rep_start.
+    """
+    series = smooth_series(rep_values, "savgol", SMOOTH_WINDOW, SMOOTH_POLY)
+    _, events = detect_reps_from_angle_series(series, exercise.rep_up, exercise.rep_down,
+                                              int(fps * REP_MIN_GAP_S))
+    starts = [0] + [e + 1 for e in events[:-1]]
+    return [(rep_start(series, s, e, exercise.rep_down), e) for s, e in zip(starts, events)]
+
+
+def build_template(landmarks, meta, exercise):
+    """
+    MotionTemplate from a tutorial clip's (N, 33, 4) landmarks and their
+    meta (fps, width, height). Sides without reps are left out.
+    """
+    w, h, fps = meta["width"], meta["height"], meta["fps"]
+    values, _, _ = exercise.evaluate_landmarks(landmarks, w, h)
+    sides = {}
+    for side, v in exercise.rep_values(values).items():
+        windows = rep_windows(v, fps, exercise)
+        if not windows:
+            continue
+        angles, vis = joint_angles(landmarks, w, h, side)
+        reps = [prepare(angles[s:e + 1]) for s, e in windows]
+        mask = np.nanmedian(vis, axis=0) >= MIN_VISIBILITY
+        mask &= ~np.isnan(np.stack(reps)).any(axis=(0, 1))
+        if not mask.any():
+            continue
+        totals = [sum(dtw(a[:, mask], b[:, mask])[0] for b in reps) for a in reps]
+        best = int(np.argmin(totals))
+        s, e = windows[best]
+        # Turning point on the same resampled time axis
+        rep_v = prepare(np.asarray(v[s:e + 1], dtype=float)[:, None])[:, 0]
+        sides[side] = {"trajectory": reps[best], "mask": mask, "turn": int(np.nanargmin(rep_v))}
+    if not sides:
+        raise ValueError(f"no reps of {exercise.name} found in the reference clip")
+    phases = ("concentric", "eccentric") if exercise.rep_concentric == "decreasing" else ("eccentric", "concentric")
+    return MotionTemplate(exercise.name, sides, phases,
+                          {"reps": {side: len(rep_windows(v, fps, exercise))
+                                    for side, v in exercise.rep_values(values).items()}})
+
+
+class TemplateStore:
+    """
+    Builds each (tutorial video, exercise) template once: landmarks come
+    from the LandmarkCache, templates are kept in template_dir (keyed by
+    the video's content, the detector settings and the exercise's rep
+    definition) and in memory.
+    """
+    def __init__(self, template_dir=TEMPLATE_DIR, cache=None, settings=None):
+        self.template_dir = template_dir
+        self.cache = cache if cache is not None else LandmarkCache(CACHE_DIR)
+        self.settings = PoseDetector.resolve_settings(settings)
+        self._templates = {}
+        os.makedirs(template_dir, exist_ok=True)
+
+    def get(self, video_path, exercise):
+        if isinstance(exercise, str):
+            exercise = load_exercises()[exercise]
+        rep = [exercise.name, exercise.rep_rule, exercise.rep_up, exercise.rep_down, exercise.rep_concentric]
+        key = hashlib.sha1((video_hash(video_path) + json.dumps([self.settings, rep, TEMPLATE_VERSION],
+                                                                 sort_keys=True)).encode()).hexdigest()
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+        path = os.path.join(self.template_dir, key + ".npz")
+        if os.path.exists(path):
+            template = MotionTemplate.load(path)
+        else:
+            landmarks, meta = load_or_extract_landmarks(video_path, self.cache, self.settings)
+            template = build_template(landmarks, meta, exercise)
+            template.meta["video"] = os.path.basename(video_path)
+            template.save(path)
+        self._templates[key] = template
+        return template
+
+
+class ReferenceMatcher:
+    """
+    Live side: keeps the joint angles and rep values of the last MAX_REP_S
+    seconds of frames. push() every frame (in the order the rep counter
+    sees them); match(record) scores a rep record from rep_analytics (its
+    start / end are frame indices of the pushes). first_frame: index of
+    the first push, for a matcher attached to a running counter; reset()
+    clears the buffered frames and restarts the numbering there (pass the
+    counter's frame index if the counter was not reset with it).
+    """
+    def __init__(self, template, exercise, fps=30.0, max_rep_s=MAX_REP_S, first_frame=0):
+        self.template = template
+        self.exercise = exercise
+        self.capacity = int(fps * max_rep_s) + SMOOTH_WINDOW
+        k = len(JOINT_ANGLES)
+        self._angles = np.full((self.capacity, len(SIDES), k), np.nan)
+        self._rep = np.full((self.capacity, len(SIDES)), np.nan)
+        self.reset(first_frame)
+
+    def reset(self, first_frame=0):
+        self._angles[:] = np.nan
+        self._rep[:] = np.nan
+        self.first_frame = first_frame
+        self.frames = first_frame
+
+    def push(self, landmarks, w, h, rep_values=None):
+        """
+        landmarks: (33, 4) normalized row (all NaN = no pose); rep_values:
+        {side: this frame's rep value} (see Exercise.rep_values).
+        """
+        i = self.frames % self.capacity
+        self.frames += 1
+        for s, side in enumerate(SIDES):
+            self._angles[i, s] = joint_angles(landmarks, w, h, side)[0]
+            self._rep[i, s] = np.nan if rep_values is None else rep_values[side]
+
+    def match(self, record):
+        side = record["side"]
+        if side not in self.template.sides:
+            return None
+        end = record["end"]
+        start = max(record["start"], self.frames - self.capacity)
+        if end < start or end >= self.frames:
+            return None
+        idx = np.arange(start, end + 1) % self.capacity
+        s = SIDES.index(side)
+        rep_v = smooth_series(self._rep[idx, s], "savgol", SMOOTH_WINDOW, SMOOTH_POLY)
+        first = rep_start(rep_v, 0, len(idx) - 1, self.exercise.rep_down)
+        return self.template.match(side, self._angles[idx[first:], s])
+
+
+def match_reps(template, landmarks, meta, exercise):
+    """
+    Scores every rep of stored (N, 33, 4) landmarks (e.g. a LandmarkCache
+    entry). Returns [(side, start, end, match)].
+    """
+    w, h = meta["width"], meta["height"]
+    values, _, _ = exercise.evaluate_landmarks(landmarks, w, h)
+    out = []
+    for side, v in exercise.rep_values(values).items():
+        if side not in template.sides:
+            continue
+        angles, _ = joint_angles(landmarks, w, h, side)
+        for s, e in rep_windows(v, meta["fps"], exercise):
+            out.append((side, s, e, template.match(side, angles[s:e + 1])))
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a reference-motion template and score reps against it")
+    parser.add_argument("tutorial", help="tutorial / reference video")
+    parser.add_argument("--exercise", default="bicep_curl", choices=list(load_exercises()))
+    parser.add_argument("--video", default=None, help="video whose reps to score (default: the tutorial itself)")
+    args = parser.parse_args()
+
+    exercise = load_exercises()[args.exercise]
+    store = TemplateStore()
+    template = store.get(args.tutorial, exercise)
+    print(f"Template: {args.tutorial} ({template.meta['reps']} reps, sides {list(template.sides)})")
+    landmarks, meta = load_or_extract_landmarks(args.video or args.tutorial, store.cache, store.settings)
+    matches = match_reps(template, landmarks, meta, exercise)
+    for side, start, end, result in matches:
+        print(f"  {side:>5} rep {start}-{end}: {result}")
+    if not matches:
+        print("  no reps found")
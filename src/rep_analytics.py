@@ -0,0 +1,239 @@
+# src/rep_analytics.py
+"""
+Per-rep quality metrics, computed incrementally as each rep closes.
+
+A rep runs from the previous rep event of the hysteresis counter (or the
+start of the stream) to its own event, on the smoothed per-side value of
+the exercise's rep rule. Its record holds:
+
+    rom            max - min of the value within the rep (degrees)
+    concentric_s   duration of the concentric phase, eccentric_s likewise:
+                   the rep is split at its turning point (the minimum of
+                   the value); the decreasing part runs from the maximum
+                   before it, the increasing part up to the rep event, and
+                   the exercise's rep "concentric" direction says which is
+                   which
+    tut_s          time under tension, concentric_s + eccentric_s
+    peak_velocity  max |d value / dt| (degrees / s)
+    fail           {rule key: fraction of the rep's frames where that check
+                   was evaluated and failed}, for the rep's own side's
+                   rules and the unsided ones
+
+Each side keeps a fixed set of running accumulators (O(1) memory per rep,
+O(R) for the R rule checks), so nothing is buffered per session: records
+go to on_rep as they close, e.g. a JsonLinesSink feeding a dashboard.
+"""
+import json
+from collections import deque
+import numpy as np
+from utils import RepCounter, StreamingSmoother, REP_MIN_GAP_S, SMOOTH_WINDOW, SMOOTH_POLY
+
+SIDES = ("left", "right")
+
+
+class RepAccumulator:
+    """
+    Running metrics of the open rep on one side. add() every smoothed
+    value in frame order; close() at the rep event returns the record and
+    starts the next rep. sides: the side of each rule key (None: unsided);
+    the record's fail dict leaves out the other side's rules.
+    """
+    def __init__(self, side, keys, fps, concentric="decreasing", sides=None):
+        self.side = side
+        self.keys = list(keys)
+        self.own = [s is None or s == side for s in (sides or [None] * len(self.keys))]
+        self.fps = fps
+        self.concentric = concentric
+        self.count = 0
+        self.prev = np.nan
+        self.start = 0
+        self._reset()
+
+    def _reset(self):
+        self.lo = self.hi = np.nan
+        self.lo_frame = self.hi_frame = self.turn_start = None
+        self.peak_velocity = 0.0
+
+    def add(self, frame, value):
+        if value != value:
+            return
+        if self.prev == self.prev:
+            self.peak_velocity = max(self.peak_velocity, abs(value - self.prev) * self.fps)
+        self.prev = value
+        if not value <= self.hi:
+            self.hi, self.hi_frame = value, frame
+        if not value >= self.lo:
+            # New turning point: its decreasing phase starts at the highest
+            # value seen before it
+            self.lo, self.lo_frame, self.turn_start = value, frame, self.hi_frame
+
+    def close(self, end, failed, seen):
+        """
+        Record of the rep ending at frame `end`. failed / seen: per-check
+        counts of failed / evaluated frames within the rep.
+        """
+        self.count += 1
+        decreasing = (self.lo_frame - self.turn_start) / self.fps if self.lo_frame is not None else 0.0
+        increasing = (end - self.lo_frame) / self.fps if self.lo_frame is not None else 0.0
+        concentric, eccentric = ((decreasing, increasing) if self.concentric == "decreasing"
+                                 else (increasing, decreasing))
+        record = {
+            "side": self.side, "rep": self.count, "start": self.start, "end": int(end),
+            "rom": round(float(self.hi - self.lo), 1),
+            "concentric_s": round(concentric, 3), "eccentric_s": round(eccentric, 3),
+            "tut_s": round(concentric + eccentric, 3),
+            "peak_velocity": round(self.peak_velocity, 1),
+            "fail": {k: round(f / s, 3) for k, own, f, s in zip(self.keys, self.own, failed.tolist(), seen.tolist())
+                     if own and s}
+        }
+        self.start = int(end) + 1
+        self._reset()
+        return record
+
+
+class RepAnalytics:
+    """
+    Streaming per-rep analytics for one person. push() each frame's
+    evaluate() result (or nothing for a frame without a pose): the per-side
+    rep values are smoothed and counted exactly like the offline scorer,
+    and every rep that closes is returned (and passed to on_rep).
+
+    Smoothing lags the frames pushed, so per-check failure counts are kept
+    as cumulative snapshots and looked up at the rep's end frame; only the
+    snapshots inside the smoothing lag are kept. on_value(side, frame,
+    value) receives every smoothed value as it becomes final, and summary()
+    gives the per-side rep counts and mean smoothed values of the stream.
+    """
+    def __init__(self, exercise, fps=30.0, on_rep=None, smoothing="savgol",
+                 window=SMOOTH_WINDOW, poly=SMOOTH_POLY, min_gap_s=REP_MIN_GAP_S, on_value=None):
+        self.exercise = exercise
+        self.fps = fps
+        self.on_rep = on_rep
+        self.on_value = on_value
+        self.smoothing, self.window, self.poly = smoothing, window, poly
+        self.min_gap_s = min_gap_s
+        self._clear()
+
+    def _clear(self):
+        exercise, fps = self.exercise, self.fps
+        r = len(exercise.keys)
+        self.smoothers = {side: StreamingSmoother(self.smoothing, self.window, self.poly) for side in SIDES}
+        self.counters = {side: RepCounter(exercise.rep_up, exercise.rep_down, int(fps * self.min_gap_s))
+                         for side in SIDES}
+        self.acc = {side: RepAccumulator(side, exercise.keys, fps, exercise.rep_concentric, exercise.sides)
+                    for side in SIDES}
+        self.frames = 0
+        self._sums = {side: [0.0, 0] for side in SIDES}
+        self._failed = np.zeros(r, dtype=np.int64)
+        self._seen = np.zeros(r, dtype=np.int64)
+        self._snapshots = deque([(-1, self._failed.copy(), self._seen.copy())])
+        self._start_counts = {side: self._snapshots[0] for side in SIDES}
+
+    @property
+    def reps(self):
+        return {side: c.count for side, c in self.counters.items()}
+
+    def reset(self):
+        self._clear()
+
+    def summary(self):
+        """
+        Frames, reps and mean smoothed rep value per side so far (after
+        flush(): the offline summary of main.process_video).
+        """
+        out = {"frames": self.frames}
+        out.update({f"reps_{side}": c.count for side, c in self.counters.items()})
+        for side, (total, n) in self._sums.items():
+            out[f"{side}_mean_angle"] = float(total / n) if n else float("nan")
+        return out
+
+    def push(self, values=None, ok=None, check=None):
+        frame = self.frames
+        self.frames += 1
+        if values is None:
+            rep = {side: np.nan for side in SIDES}
+        else:
+            evaluated = check >= 0
+            if evaluated.any():
+                self._seen += evaluated
+                self._failed += evaluated & ~ok
+                self._snapshots.append((frame, self._failed.copy(), self._seen.copy()))
+            rep = {side: float(v) for side, v in self.exercise.rep_values(values).items()}
+        out = []
+        for side in SIDES:
+            out += self._feed(side, self.smoothers[side].push(rep[side]))
+        self._prune()
+        return out
+
+    def flush(self):
+        """
+        End of stream: emits the smoothers' lagged tail (reps it closes).
+        """
+        out = []
+        for side in SIDES:
+            out += self._feed(side, self.smoothers[side].flush())
+        return out
+
+    def _feed(self, side, smoothed):
+        counter, acc, sums = self.counters[side], self.acc[side], self._sums[side]
+        out = []
+        for value in smoothed:
+            if value == value:
+                sums[0] += value
+                sums[1] += 1
+            if self.on_value is not None:
+                self.on_value(side, counter.frame + 1, value)
+            acc.add(counter.frame + 1, value)
+            if counter.update(value):
+                end = self._counts_at(counter.frame)
+                _, failed0, seen0 = self._start_counts[side]
+                record = acc.close(counter.frame, end[1] - failed0, end[2] - seen0)
+                self._start_counts[side] = end
+                out.append(record)
+                if self.on_rep is not None:
+                    self.on_rep(record)
+        return out
+
+    def _counts_at(self, frame):
+        # Latest snapshot at or before frame
+        for snap in reversed(self._snapshots):
+            if snap[0] <= frame:
+                return snap
+        return self._snapshots[0]
+
+    def _prune(self):
+        # Keep the newest snapshot every side's smoothed stream has reached
+        done = min(c.frame for c in self.counters.values())
+        while len(self._snapshots) > 1 and self._snapshots[1][0] <= done:
+            self._snapshots.popleft()
+
+
+class JsonLinesSink:
+    """
+    on_rep callback writing each record as one JSON line (flushed, so a
+    dashboard tailing the file sees reps as they close). fields are added
+    to every line (e.g. video=..., person=...).
+    """
+    def __init__(self, path, append=False, **fields):
+        self.fields = fields
+        self._f = open(path, "a" if append else "w", encoding="utf-8")
+
+    def __call__(self, record):
+        self._f.write(json.dumps(dict(self.fields, **record), separators=(",", ":")) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def rep_records(values, ok, check, exercise, fps, **kwargs):
+    """
+    All rep records of a stored (N, R) evaluate() result, e.g. from
+    SessionReader; rows whose values are all NaN count as frames without
+    a pose.
+    """
+    analytics = RepAnalytics(exercise, fps, **kwargs)
+    out = []
+    for v, o, c in zip(values, ok, check):
+        out += analytics.push(None if np.isnan(v).all() else v, o, c)
+    return out + analytics.flush()
@@ -0,0 +1,383 @@
+# src/replay.py
+"""
+Session replay and what-if re-scoring over stored landmarks.
+
+Replay re-runs any exercise rule set, smoothing option and rep-counter
+setting over a landmark stream already on disk (a session_store session,
+or a LandmarkCache entry / extract_landmarks result) with no decoding or
+inference, so changing a rule no longer means re-running process_video:
+
+    base = Replay("output/session")
+    print(base.summary())
+    softer = base.what_if(up=70, smoothing="ema")
+    print(softer.summary(), softer.rep_events())
+
+Work is done lazily in blocks of BLOCK frames:
+  - frames(start, stop) evaluates the rules for that range only (reading
+    just the row groups / memory-mapped rows it covers), cached per block;
+  - rep counting is stateful, so smoothing + counting advance block by
+    block only as far as the furthest frame asked for and keep what they
+    computed (each block is smoothed from a segment just wide enough to
+    give the same values as smoothing the whole series).
+Seeking around an hour-long session therefore costs the blocks between the
+furthest point reached so far and the new one, never the whole session.
+render() re-draws an annotated video (for a frame range), only when asked.
+"""
+import argparse
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+from session_store import SessionReader
+from rule_spec import load_exercises, SPEC_PATH
+from utils import smooth_series, RepCounter, REP_MIN_GAP_S, SMOOTH_WINDOW, SMOOTH_POLY
+from rep_analytics import RepAccumulator
+
+BLOCK = 1024
+CACHED_BLOCKS = 32
+SIDES = ("left", "right")
+EMA_ALPHA = 0.2  # as in smooth_series
+
+
+class LandmarkSource:
+    """
+    Frame-range access to a stored landmark stream plus its fps / frame
+    size: a session directory or SessionReader, or a (landmarks, meta) pair.
+    Blocks read are kept in a small LRU shared by every Replay of the source.
+    """
+    def __init__(self, source):
+        if isinstance(source, str):
+            source = SessionReader(source)
+        if isinstance(source, SessionReader):
+            self.reader, self.meta = source, source.meta
+            self._array = None
+            self.frames = len(source)
+        else:
+            self._array, self.meta = source
+            self.reader = None
+            self.frames = len(self._array)
+        self.fps = float(self.meta.get("fps") or 30.0)
+        self.width, self.height = int(self.meta["width"]), int(self.meta["height"])
+        self._blocks = OrderedDict()
+
+    def __len__(self):
+        return self.frames
+
+    def block(self, b):
+        """
+        (n, 33, 4) landmarks of frames [b * BLOCK, (b + 1) * BLOCK).
+        """
+        rows = self._blocks.get(b)
+        if rows is None:
+            start, stop = b * BLOCK, min((b + 1) * BLOCK, self.frames)
+            if self.reader is not None:
+                rows = self.reader.read(start, stop, ("landmarks",))["landmarks"]
+            else:
+                rows = np.asarray(self._array[start:stop], dtype=np.float32)
+            self._blocks[b] = rows
+            if len(self._blocks) > CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(b)
+        return rows
+
+
+class Replay:
+    """
+    One scoring configuration over a LandmarkSource (or anything it
+    accepts). exercise: a name from `spec` (a spec path or a loaded spec
+    dict; default exercises.json) or a compiled Exercise; defaults to the
+    session's exercise. smoothing / window / poly: as in smooth_series;
+    up / down: rep thresholds (default: the exercise's); min_gap_s: as
+    REP_MIN_GAP_S.
+    """
+    def __init__(self, source, exercise=None, spec=SPEC_PATH, normalized=False,
+                 smoothing="savgol", window=SMOOTH_WINDOW, poly=SMOOTH_POLY,
+                 up=None, down=None, min_gap_s=REP_MIN_GAP_S):
+        self.source = source if isinstance(source, LandmarkSource) else LandmarkSource(source)
+        self.params = {"exercise": exercise, "spec": spec, "normalized": normalized,
+                       "smoothing": smoothing, "window": window, "poly": poly,
+                       "up": up, "down": down, "min_gap_s": min_gap_s}
+        if exercise is None or isinstance(exercise, str):
+            exercises = load_exercises(spec) if isinstance(spec, str) else load_exercises(spec=spec)
+            exercise = exercises[exercise or self.source.meta.get("exercise", "bicep_curl")]
+        self.exercise = exercise
+        self.up = exercise.rep_up if up is None else up
+        self.down = exercise.rep_down if down is None else down
+        self.min_gap = int(self.source.fps * min_gap_s)
+        self._rules = OrderedDict()
+        self._counters = {side: RepCounter(self.up, self.down, self.min_gap) for side in SIDES}
+        self._smoothed = {side: [] for side in SIDES}  # one array per scanned block
+        self._events = {side: [] for side in SIDES}
+        self._acc = {side: RepAccumulator(side, exercise.keys, self.source.fps, exercise.rep_concentric,
+                                          exercise.sides)
+                     for side in SIDES}
+        self._records = []
+        r = len(exercise.keys)
+        self._counts = (np.zeros(r, dtype=np.int64), np.zeros(r, dtype=np.int64))  # failed, seen
+        self._rep_start = {side: self._counts for side in SIDES}
+        self._ema = {}
+        self._scanned = 0  # blocks smoothed and rep-counted so far
+
+    def __len__(self):
+        return len(self.source)
+
+    def what_if(self, **changes):
+        """
+        The same landmarks under changed settings (any __init__ argument).
+        """
+        return Replay(self.source, **{**self.params, **changes})
+
+    def frames(self, start=0, stop=None):
+        """
+        Per-frame results for [start, stop): frame, values / ok / check
+        (n, R) in exercise.keys order, and the raw and smoothed rep values
+        per side.
+        """
+        start, stop = self._range(start, stop)
+        if stop > start:
+            first = start // BLOCK
+            parts = [self._block_rules(b) for b in range(first, -(-stop // BLOCK))]
+            cut = slice(start - first * BLOCK, stop - first * BLOCK)
+            values, ok, check = (np.concatenate([p[k] for p in parts])[cut] for k in range(3))
+        else:
+            values = np.empty((0, len(self.exercise.keys)))
+            ok, check = values.astype(bool), values.astype(np.int8)
+        self._advance(stop)
+        return {
+            "frame": np.arange(start, stop),
+            "values": values, "ok": ok, "check": check,
+            "rep_values": self._rep_values(values),
+            "smoothed": {side: self._smoothed_range(side, start, stop) for side in SIDES}
+        }
+
+    def feedback(self, frame_idx):
+        """
+        The feedback messages process_video would overlay on that frame.
+        """
+        r = self.frames(frame_idx, frame_idx + 1)
+        return self.exercise.messages(r["values"][0], r["check"][0])
+
+    def rep_events(self, start=0, stop=None):
+        """
+        {side: [frame of each completed rep]} within [start, stop).
+        """
+        start, stop = self._range(start, stop)
+        self._advance(stop)
+        return {side: [f for f in self._events[side] if start <= f < stop] for side in SIDES}
+
+    def rep_records(self, start=0, stop=None):
+        """
+        Per-rep metrics (see rep_analytics) of the reps completed within
+        [start, stop), in completion order.
+        """
+        start, stop = self._range(start, stop)
+        self._advance(stop)
+        return [r for r in self._records if start <= r["end"] < stop]
+
+    def reps_at(self, frame_idx):
+        """
+        Rep counts per side as of (and including) frame_idx.
+        """
+        return {side: len(e) for side, e in self.rep_events(0, frame_idx + 1).items()}
+
+    def summary(self):
+        """
+        Whole-session summary with the keys of main.process_video's.
+        """
+        n = len(self)
+        self._advance(n)
+        out = {"frames": n}
+        for side in SIDES:
+            smoothed = self._smoothed_range(side, 0, n)
+            out[f"reps_{side}"] = len(self._events[side])
+            out[f"{side}_mean_angle"] = float(np.nanmean(smoothed)) if n else float("nan")
+            reps = [r for r in self._records if r["side"] == side]
+            out[f"{side}_mean_rom"] = float(np.mean([r["rom"] for r in reps])) if reps else float("nan")
+            out[f"{side}_mean_tut_s"] = float(np.mean([r["tut_s"] for r in reps])) if reps else float("nan")
+        return out
+
+    def render(self, output_path, video_path=None, start=0, stop=None):
+        """
+        Re-draws the annotated video for [start, stop) from the original
+        video (default: the absolute path process_video stored in the
+        source's meta) with this replay's feedback and rep counts. Decoding
+        only; no inference.
+        """
+        video_path = video_path or self.source.meta.get("video")
+        if not video_path or not os.path.isfile(video_path):
+            raise FileNotFoundError(f"Source video not found: {video_path!r} "
+                                    "(pass video_path / --video)")
+        start, stop = self._range(start, stop)
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open video: {video_path}")
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), self.source.fps,
+                                 (self.source.width, self.source.height))
+        events = self.rep_events(0, stop)
+        reps = {side: sum(f < start for f in events[side]) for side in SIDES}
+        try:
+            for b0 in range(start, stop, BLOCK):
+                r = self.frames(b0, min(b0 + BLOCK, stop))
+                for i, frame_idx in enumerate(r["frame"].tolist()):
+                    ret, frame = cap.read()
+                    if not ret:
+                        return
+                    for side in SIDES:
+                        reps[side] += frame_idx in events[side]
+                    if np.isnan(r["values"][i]).all():
+                        cv2.putText(frame, "No pose detected", (20, 40),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+                    else:
+                        for k, fb in enumerate(self.exercise.messages(r["values"][i], r["check"][i])[:6]):
+                            cv2.putText(frame, fb, (20, 40 + k*30), cv2.FONT_HERSHEY_SIMPLEX,
+                                        0.7, (0, 255, 0), 2)
+                    cv2.putText(frame, f"Reps L:{reps['left']} R:{reps['right']}",
+                                (20, self.source.height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
+                    writer.write(frame)
+        finally:
+            cap.release()
+            writer.release()
+
+    def _range(self, start, stop):
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        return max(0, min(start, stop)), stop
+
+    def _block_rules(self, b):
+        rules = self._rules.get(b)
+        if rules is None:
+            src = self.source
+            rules = self.exercise.evaluate_landmarks(src.block(b), src.width, src.height,
+                                                     self.params["normalized"])
+            self._rules[b] = rules
+            if len(self._rules) > CACHED_BLOCKS:
+                self._rules.popitem(last=False)
+        else:
+            self._rules.move_to_end(b)
+        return rules
+
+    def _rep_values(self, values):
+        n = len(values)
+        return {side: np.broadcast_to(v, (n,)) for side, v in self.exercise.rep_values(values).items()}
+
+    def _rep_block(self, side, b):
+        return self._rep_values(self._block_rules(b)[0])[side]
+
+    def _raw(self, side, lo, hi):
+        first = lo // BLOCK
+        v = np.concatenate([self._rep_block(side, b) for b in range(first, -(-hi // BLOCK))])
+        return v[lo - first * BLOCK:hi - first * BLOCK]
+
+    def _valid_edge(self, side, i, step):
+        """
+        Index of the nearest non-NaN rep value at or before (step -1) /
+        after (step 1) frame i, else the series end in that direction.
+        """
+        n = len(self)
+        b = i // BLOCK
+        while 0 <= b * BLOCK < n:
+            idx = np.flatnonzero(~np.isnan(self._rep_block(side, b))) + b * BLOCK
+            idx = idx[idx <= i] if step < 0 else idx[idx >= i]
+            if len(idx):
+                return int(idx[-1] if step < 0 else idx[0])
+            b += step
+        return 0 if step < 0 else n - 1
+
+    def _smooth_block(self, side, a, b):
+        """
+        Smoothed rep values of frames [a, b), equal to smoothing the whole
+        series at once: the segment smoothed around them reaches the
+        nearest valid samples (so NaN gaps interpolate the same) and a full
+        savgol window past both ends (or the series ends). EMA carries its
+        state from the previous block instead.
+        """
+        p = self.params
+        n = len(self)
+        lo, hi = a, b
+        if p["smoothing"] == "savgol":
+            half = p["window"] // 2
+            lo, hi = max(0, a - half), min(n, b + half)
+            lo = max(0, min(lo, hi - p["window"]))
+            hi = min(n, max(hi, lo + p["window"]))
+        lo = self._valid_edge(side, lo, -1)
+        hi = self._valid_edge(side, hi - 1, 1) + 1
+        segment = self._raw(side, lo, hi)
+        if p["smoothing"] == "ema":
+            filled = smooth_series(segment, None)[a - lo:b - lo]
+            out = np.empty(len(filled))
+            prev = self._ema.get(side)
+            for i, x in enumerate(filled.tolist()):
+                prev = x if prev is None else EMA_ALPHA * x + (1 - EMA_ALPHA) * prev
+                out[i] = prev
+            self._ema[side] = prev
+            return out
+        return smooth_series(segment, p["smoothing"], p["window"], p["poly"])[a - lo:b - lo]
+
+    def _smoothed_range(self, side, start, stop):
+        blocks = self._smoothed[side][start // BLOCK:-(-stop // BLOCK)]
+        first = (start // BLOCK) * BLOCK
+        return np.concatenate(blocks)[start - first:stop - first] if blocks else np.empty(0)
+
+    def _advance(self, stop):
+        """
+        Smooths and counts reps block by block until [0, stop) is covered.
+        Per-check failure counts are cumulated over the block so each rep
+        record takes the difference between its end and start.
+        """
+        n = len(self)
+        while self._scanned * BLOCK < min(stop, n):
+            a = self._scanned * BLOCK
+            b = min(a + BLOCK, n)
+            _, ok, check = self._block_rules(self._scanned)
+            evaluated = check >= 0
+            failed = self._counts[0] + np.cumsum(evaluated & ~ok, axis=0)
+            seen = self._counts[1] + np.cumsum(evaluated, axis=0)
+            for side in SIDES:
+                smoothed = self._smooth_block(side, a, b)
+                counter, acc = self._counters[side], self._acc[side]
+                for i, y in enumerate(smoothed.tolist()):
+                    acc.add(a + i, y)
+                    if counter.update(y):
+                        end = (failed[i], seen[i])
+                        start = self._rep_start[side]
+                        self._records.append(acc.close(counter.frame, end[0] - start[0], end[1] - start[1]))
+                        self._rep_start[side] = end
+                        self._events[side].append(counter.frame)
+                self._smoothed[side].append(smoothed)
+            self._counts = (failed[-1], seen[-1])
+            self._scanned += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score a stored session with changed settings")
+    parser.add_argument("session", help="session directory written by main.py (see session_store)")
+    parser.add_argument("--exercise", default=None, help="default: the session's")
+    parser.add_argument("--spec", default=SPEC_PATH, help="exercise spec (e.g. an edited copy)")
+    parser.add_argument("--smoothing", default="savgol", choices=("savgol", "ema"))
+    parser.add_argument("--window", type=int, default=SMOOTH_WINDOW)
+    parser.add_argument("--up", type=float, default=None, help="rep top threshold")
+    parser.add_argument("--down", type=float, default=None, help="rep bottom threshold")
+    parser.add_argument("--min-gap", type=float, default=REP_MIN_GAP_S, help="seconds between reps")
+    parser.add_argument("--normalized", action="store_true", help="resolution-independent rules")
+    parser.add_argument("--render", default=None, help="also write an annotated mp4 here")
+    parser.add_argument("--video", default=None,
+                        help="source video for --render (default: the path stored in the session)")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--stop", type=int, default=None)
+    args = parser.parse_args()
+
+    replay = Replay(args.session, args.exercise, args.spec, args.normalized, args.smoothing,
+                    args.window, SMOOTH_POLY, args.up, args.down, args.min_gap)
+    print("Summary:", replay.summary())
+    print("Rep events:", replay.rep_events(args.start, args.stop))
+    for record in replay.rep_records(args.start, args.stop):
+        print(" ", record)
+    if args.render:
+        try:
+            replay.render(args.render, args.video, args.start, args.stop)
+        except FileNotFoundError as e:
+            parser.error(str(e))
+        print("Saved:", args.render)
@@ -0,0 +1,282 @@
+# src/rule_spec.py
+"""
+Declarative exercise rules (exercises.json) compiled into flat evaluation
+plans.
+
+A rule names a measure over landmark joints, the sides it applies to and
+an ordered list of threshold checks, each with its verdict and message:
+
+    "bicep_elbow_angle": {
+      "measure": "angle", "joints": ["SHOULDER", "ELBOW", "WRIST"],
+      "sides": ["left", "right"],
+      "checks": [{"le": 50, "ok": true, "msg": "{side} elbow: good top ({ivalue}°)"}, ...],
+      "otherwise": {"ok": false, "msg": "..."}
+    }
+
+Measures: angle (3 joints, degrees at the middle one), dy / abs_dy
+(y of first minus y of second, in pixels) and tilt (degrees of the
+first->second segment from vertical). Sided rules give joints without the
+LEFT_/RIGHT_ prefix. Checks use le / lt / ge / gt; the first that passes
+wins, otherwise applies when none does. Messages may use {side}, {value}
+and {ivalue} (value truncated to int).
+
+Distance thresholds are in pixels of the frame the rules see. With
+evaluate_landmarks(..., normalized=True) they hold at any resolution
+instead: coordinates stay float, dy / abs_dy are rescaled from the person's
+torso length (shoulder to hip midpoint) to the spec's reference_torso_px,
+3D world landmarks can replace the image ones, and joints below
+min_visibility are skipped (no verdict, no message) rather than measured.
+
+An exercise lists its rules and the rule whose per-side value drives the
+rep counter, plus the direction that value moves in the concentric
+(lifting) phase ("concentric": "decreasing" for curls, "increasing" for
+squats / raises; see rep_analytics). Each exercise is compiled once into index arrays, so a frame
+(or a whole (N, 33, 2) batch) is scored with one vectorized pass over every
+distinct measure and one over every check, with no per-rule Python.
+"""
+import json
+import os
+import numpy as np
+from form_rules import LM
+from utils import calculate_angle_batch, to_pixel_coords
+
+SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exercises.json")
+
+MEASURES = {"angle": 3, "dy": 2, "abs_dy": 2, "tilt": 2}
+OPS = ("le", "lt", "ge", "gt")
+REFERENCE_TORSO_PX = 400.0
+MIN_VISIBILITY = 0.5
+
+
+class Exercise:
+    """
+    Compiled plan for one exercise. keys[i] names rule instance i
+    ("<rule>_<side>" or "<rule>").
+
+    evaluate(pts) -> (values, ok, check) for pixel coords shaped
+    (..., 33, 2); each result is (..., R). A NaN value (no pose, hidden
+    joint) has check -1 and ok False. messages() turns one frame's
+    result into feedback strings. rep_values(values) gives the per-side
+    values of the rep rule.
+    """
+    def __init__(self, name, spec, rule_specs, reference_torso=REFERENCE_TORSO_PX):
+        self.name = name
+        self.reference_torso = reference_torso
+        self.title = spec.get("title", name)
+        self.steps = list(spec.get("steps", []))
+        rep = spec["rep"]
+        self.rep_rule = rep["rule"]
+        self.rep_column = rep.get("column", rep["rule"])
+        self.rep_up = rep["up"]
+        self.rep_down = rep["down"]
+        self.rep_concentric = rep.get("concentric", "decreasing")
+        if self.rep_concentric not in ("decreasing", "increasing"):
+            raise ValueError(f"{name}: rep concentric must be 'decreasing' or 'increasing'")
+
+        self.keys = []
+        self.sides = []
+        self.rule_names = []
+        measures = {}  # (kind, joint indices) -> measure slot
+        slots, thresholds, ops, oks, msgs = [], [], [], [], []
+        for rule_name in spec["rules"]:
+            if rule_name not in rule_specs:
+                raise ValueError(f"{name}: unknown rule '{rule_name}'")
+            rule = rule_specs[rule_name]
+            kind = rule["measure"]
+            if kind not in MEASURES:
+                raise ValueError(f"{rule_name}: unknown measure '{kind}'")
+            if len(rule["joints"]) != MEASURES[kind]:
+                raise ValueError(f"{rule_name}: '{kind}' takes {MEASURES[kind]} joints")
+            for side in rule.get("sides") or [None]:
+                prefix = f"{side.upper()}_" if side else ""
+                try:
+                    idx = tuple(LM[prefix + j] for j in rule["joints"])
+                except KeyError as e:
+                    raise ValueError(f"{rule_name}: unknown joint {e}") from None
+                slots.append(measures.setdefault((kind, idx), len(measures)))
+                checks = rule.get("checks", [])
+                thresholds.append([_threshold(c, rule_name) for c in checks])
+                ops.append([_op(c, rule_name) for c in checks])
+                otherwise = rule.get("otherwise", {"ok": False, "msg": ""})
+                oks.append([bool(c["ok"]) for c in checks] + [bool(otherwise["ok"])])
+                msgs.append([c.get("msg", "") for c in checks] + [otherwise.get("msg", "")])
+                self.keys.append(f"{rule_name}_{side}" if side else rule_name)
+                self.sides.append(side)
+                self.rule_names.append(rule_name)
+
+        # Measure plan: every measure as vectors v1 = P[a] - P[b] and
+        # v2 = P[c] - P[b] (c = b for two-joint measures), gathered in one go
+        self._measure_count = len(measures)
+        joints = np.zeros((len(measures), 3), dtype=np.intp)
+        kinds = [None] * len(measures)
+        for (kind, idx), slot in measures.items():
+            joints[slot] = idx if len(idx) == 3 else (idx[0], idx[1], idx[1])
+            kinds[slot] = kind
+        self._a, self._b, self._c = joints.T
+        self._kind_slots = [(kind, np.array([i for i, k in enumerate(kinds) if k == kind]))
+                            for kind in MEASURES if kind in kinds]
+
+        # Check plan: (R, C + 1) arrays, one row per rule instance
+        n_checks = max((len(t) for t in thresholds), default=0)
+        r = len(self.keys)
+        self._slot = np.array(slots, dtype=np.intp)
+        self._rows = np.arange(r)
+        # Every check becomes sign * value >= bound: le / lt flip the sign and
+        # strict ops step the bound to the next float, so lt / gt stay exact.
+        # Padding never passes; the last column is "otherwise"
+        self._sign = np.ones((r, n_checks + 1))
+        self._bound = np.full((r, n_checks + 1), np.inf)
+        self._ok = np.zeros((r, n_checks + 1), dtype=bool)
+        self._msgs = []
+        for i in range(r):
+            k = len(thresholds[i])
+            for j, (t, op) in enumerate(zip(thresholds[i], ops[i])):
+                sign = -1.0 if OPS[op] in ("le", "lt") else 1.0
+                bound = sign * t
+                self._sign[i, j] = sign
+                self._bound[i, j] = np.nextafter(bound, np.inf) if OPS[op] in ("lt", "gt") else bound
+            self._ok[i, :k] = oks[i][:-1]
+            self._ok[i, n_checks] = oks[i][-1]
+            self._msgs.append(msgs[i][:-1] + [""] * (n_checks - k) + [msgs[i][-1]])
+        self._n_checks = n_checks
+        self._rep_idx = {side: self.keys.index(f"{self.rep_rule}_{side}")
+                         for side in ("left", "right") if f"{self.rep_rule}_{side}" in self.keys}
+        if not self._rep_idx:
+            raise ValueError(f"{name}: rep rule '{self.rep_rule}' must be a sided rule of the exercise")
+        # Where the rep value changes meaning: the rep thresholds and the rep
+        # rule's own check thresholds (its verdict boundaries)
+        rep_checks = thresholds[next(iter(self._rep_idx.values()))]
+        self.rep_thresholds = tuple(sorted({float(self.rep_up), float(self.rep_down), *map(float, rep_checks)}))
+        # Landmark indices the rep value is measured on, per side
+        self.rep_joints = {}
+        for side, i in self._rep_idx.items():
+            slot = self._slot[i]
+            self.rep_joints[side] = tuple(dict.fromkeys(int(j) for j in (self._a[slot], self._b[slot], self._c[slot])))
+
+    def measure(self, pts, scale=None):
+        """
+        Every distinct measure of the plan over (..., 33, 2|3) coords;
+        dy / abs_dy are multiplied by scale (shape (...,)) if given.
+        """
+        pts = np.asarray(pts, dtype=np.float64)
+        pb = pts[..., self._b, :]
+        v1 = pts[..., self._a, :] - pb
+        out = np.empty(pts.shape[:-2] + (self._measure_count,))
+        for kind, slots in self._kind_slots:
+            if kind == "angle":
+                out[..., slots] = calculate_angle_batch(pts[..., self._a[slots], :], pb[..., slots, :],
+                                                        pts[..., self._c[slots], :])
+            elif kind == "dy":
+                out[..., slots] = v1[..., slots, 1] if scale is None else v1[..., slots, 1] * scale[..., None]
+            elif kind == "abs_dy":
+                dy = np.abs(v1[..., slots, 1])
+                out[..., slots] = dy if scale is None else dy * scale[..., None]
+            else:  # tilt of a->b from vertical
+                horiz = np.abs(v1[..., slots, 0]) if pts.shape[-1] == 2 else np.hypot(v1[..., slots, 0],
+                                                                                       v1[..., slots, 2])
+                out[..., slots] = np.degrees(np.arctan2(horiz, v1[..., slots, 1]))
+        return out
+
+    def evaluate(self, pts, scale=None):
+        values = self.measure(pts, scale)[..., self._slot]
+        hit = self._sign * values[..., None] >= self._bound
+        # First passing check wins
+        hit[..., -1] = True
+        check = hit.argmax(axis=-1)
+        ok = self._ok[self._rows, check]
+        skipped = np.isnan(values)
+        if skipped.any():
+            check = np.where(skipped, -1, check)
+            ok &= ~skipped
+        return values, ok, check
+
+    def evaluate_landmarks(self, landmarks, w, h, normalized=False, world=None,
+                           min_visibility=MIN_VISIBILITY):
+        """
+        evaluate() on normalized (..., 33, 4) landmark rows of a w x h frame.
+        Default: integer pixel coords, as the rules were written for.
+        normalized=True: resolution-independent (see the module docstring);
+        world is the matching pose_world_landmarks array, if wanted.
+        """
+        if not normalized:
+            return self.evaluate(to_pixel_coords(landmarks, w, h))
+        pts, torso = normalized_points(landmarks, w, h, world, min_visibility)
+        with np.errstate(divide="ignore"):
+            scale = np.where(torso > 0, self.reference_torso / torso, np.nan)
+        return self.evaluate(pts, scale)
+
+    def messages(self, values, check):
+        """
+        Feedback strings for one frame's evaluate() result (skipped rules
+        have none).
+        """
+        out = []
+        for i, (v, c) in enumerate(zip(values.tolist(), check.tolist())):
+            if c < 0:
+                continue
+            ivalue = int(v) if v == v else 0
+            out.append(self._msgs[i][c].format(side=self.sides[i], value=v, ivalue=ivalue))
+        return out
+
+    def verdicts(self, pts):
+        """
+        {key: (ok, value)} over a (N, 33, 2) batch, one entry per rule instance.
+        """
+        values, ok, _ = self.evaluate(pts)
+        return {k: (ok[..., i], values[..., i]) for i, k in enumerate(self.keys)}
+
+    def rep_values(self, values):
+        """
+        {"left": v, "right": v} of the rep rule (NaN for a missing side).
+        """
+        return {side: (values[..., self._rep_idx[side]] if side in self._rep_idx else np.nan)
+                for side in ("left", "right")}
+
+
+def normalized_points(landmarks, w, h, world=None, min_visibility=MIN_VISIBILITY):
+    """
+    (pts, torso) for normalized evaluation of (..., 33, 4) landmark rows:
+    float pixel coords (or the 3D world landmarks) with joints below
+    min_visibility set to NaN, and the shoulder-to-hip-midpoint length in
+    the same units (NaN when those joints are hidden).
+    """
+    lm = np.asarray(landmarks, dtype=np.float64)
+    if world is None:
+        pts = lm[..., :2] * np.array([w, h], dtype=np.float64)
+    else:
+        pts = np.array(world, dtype=np.float64)[..., :3]
+    if min_visibility is not None:
+        pts[lm[..., 3] < min_visibility] = np.nan
+    shoulders = (pts[..., LM["LEFT_SHOULDER"], :] + pts[..., LM["RIGHT_SHOULDER"], :]) / 2
+    hips = (pts[..., LM["LEFT_HIP"], :] + pts[..., LM["RIGHT_HIP"], :]) / 2
+    return pts, np.sqrt(((shoulders - hips) ** 2).sum(-1))
+
+
+def _op(check, rule_name):
+    ops = [op for op in OPS if op in check]
+    if len(ops) != 1:
+        raise ValueError(f"{rule_name}: each check needs exactly one of {', '.join(OPS)}")
+    return OPS.index(ops[0])
+
+
+def _threshold(check, rule_name):
+    return float(check[OPS[_op(check, rule_name)]])
+
+
+def load_spec(path=SPEC_PATH):
+    """
+    The raw spec dict ({"rules": ..., "exercises": ...}).
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_exercises(path=SPEC_PATH, spec=None):
+    """
+    Reads and compiles a spec file (or an already loaded spec dict)
+    -> {exercise name: Exercise}.
+    """
+    spec = load_spec(path) if spec is None else spec
+    rules = spec.get("rules", {})
+    reference_torso = float(spec.get("reference_torso_px", REFERENCE_TORSO_PX))
+    return {name: Exercise(name, ex, rules, reference_torso) for name, ex in spec.get("exercises", {}).items()}
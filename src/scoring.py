@@ -0,0 +1,157 @@
+# src/scoring.py
+"""
+Headless scoring API for workers (serverless functions, batch pools,
+servers): PoseDetector + compiled exercise rules + rep counting, with no
+GUI, pandas or video writing.
+
+Importing this module only loads numpy and OpenCV. mediapipe is imported
+when the first detector is built and scipy.signal when the first smoother
+is, so a worker that only scores stored landmarks never loads MediaPipe.
+Call prewarm() once per worker (e.g. in a Pool initializer or at
+serverless init) to pay the graph build and the first, much slower,
+inference before the first real frame arrives:
+
+    import scoring
+    scoring.prewarm("bicep_curl", model_complexity=0)
+    ...
+    result = scoring.get_scorer().score_frame(frame_bgr)
+"""
+import numpy as np
+from pose_detector import PoseDetector, landmarks_to_array, world_landmarks_to_array
+from form_rules import FormScorer
+from motion_gate import MotionGate
+from rule_spec import load_exercises
+from utils import (
+    smooth_series, detect_reps_from_angle_series,
+    REP_MIN_GAP_S, SMOOTH_WINDOW, SMOOTH_POLY
+)
+
+WARM_SIZE = (640, 480)
+
+_worker = {}
+
+
+class HeadlessScorer:
+    """
+    Streaming scorer for one person / stream. exercise is a name from
+    exercises.json or a compiled rule_spec.Exercise. The detector is only
+    built on the first score_frame() (or warm()). normalized=True scores
+    resolution-independently, with use_world=True on MediaPipe's 3D world
+    landmarks. motion_gate=True skips inference on static / empty frames
+    (see motion_gate) and rescores the last landmarks instead.
+    """
+    def __init__(self, exercise="bicep_curl", fps=30.0, detector_settings=None,
+                 normalized=False, use_world=False, motion_gate=False):
+        self.exercise = load_exercises()[exercise] if isinstance(exercise, str) else exercise
+        self.fps = fps
+        self.settings = PoseDetector.resolve_settings(detector_settings)
+        self.use_world = use_world
+        self.scorer = FormScorer(self.exercise, fps, normalized=normalized or use_world)
+        self.gate = MotionGate(fps) if motion_gate else None
+        self._detector = None
+        self._last = None
+
+    @property
+    def reps(self):
+        return self.scorer.reps
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._detector = PoseDetector(**self.settings)
+        return self._detector
+
+    def warm(self, size=WARM_SIZE):
+        """
+        Builds the graph and runs one blank frame of the expected (w, h)
+        through it (MediaPipe loads its model on the first inference).
+        """
+        self.detector.detect(np.zeros((size[1], size[0], 3), dtype=np.uint8))
+        return self
+
+    def score_frame(self, frame_bgr):
+        """
+        Result dict of score_landmarks() plus inferred (False when the
+        motion gate reused the last landmarks).
+        """
+        h, w = frame_bgr.shape[:2]
+        if self.gate is not None and not self.gate.due(frame_bgr):
+            row, world = self._last
+            inferred = False
+        else:
+            results = self.detector.detect(frame_bgr)
+            row = landmarks_to_array(results)
+            world = world_landmarks_to_array(results) if self.use_world else None
+            inferred = True
+            if self.gate is not None:
+                self.gate.observe(not np.isnan(row[0, 0]))
+                self._last = (row, world)
+        return dict(self.score_landmarks(row, w, h, world), inferred=inferred)
+
+    def score_landmarks(self, row, w, h, world=None):
+        """
+        (33, 4) normalized landmark row (all NaN = no pose) -> result dict
+        with pose, verdicts, angles, reps, feedback and the metrics of any
+        reps this frame completed (rep_records, see rep_analytics).
+        """
+        self.scorer.score(row, w, h, world)
+        return {
+            "pose": not np.isnan(row[0, 0]),
+            "verdicts": self.scorer.verdicts,
+            "angles": {k: (None if np.isnan(v) else float(v)) for k, v in self.scorer.angles.items()},
+            "reps": self.scorer.reps,
+            "feedback": self.scorer.feedback,
+            "rep_records": self.scorer.rep_records
+        }
+
+    def reset(self):
+        """
+        New stream / set: clears rep state and the detector's tracking.
+        """
+        self.scorer.reset()
+        if self.gate is not None:
+            self.gate.reset()
+        if self._detector is not None:
+            self._detector.reset()
+
+    def close(self):
+        if self._detector is not None:
+            self._detector.close()
+            self._detector = None
+
+
+def score_series(landmarks, width, height, fps, exercise="bicep_curl", normalized=False):
+    """
+    Offline summary of a stored (N, 33, 4) landmark array (LandmarkCache,
+    SessionReader) without pandas: same smoothing and rep counting as
+    main.score_landmarks. Returns the summary dict and the rep events.
+    """
+    ex = load_exercises()[exercise] if isinstance(exercise, str) else exercise
+    values, _, _ = ex.evaluate_landmarks(landmarks, width, height, normalized)
+    summary = {"frames": int(len(landmarks))}
+    events = {}
+    for side, v in ex.rep_values(values).items():
+        series = smooth_series(v, "savgol", SMOOTH_WINDOW, SMOOTH_POLY)
+        reps, events[side] = detect_reps_from_angle_series(series, ex.rep_up, ex.rep_down,
+                                                           int(fps * REP_MIN_GAP_S))
+        summary[f"reps_{side}"] = reps
+        summary[f"{side}_mean_angle"] = float(np.nanmean(series)) if len(series) else float("nan")
+    return summary, events
+
+
+def prewarm(exercise="bicep_curl", fps=30.0, size=WARM_SIZE, **detector_settings):
+    """
+    Builds and warms this worker's scorer; get_scorer() returns it afterwards.
+    """
+    scorer = _worker.get("scorer")
+    if scorer is not None:
+        scorer.close()
+    _worker["scorer"] = HeadlessScorer(exercise, fps, detector_settings).warm(size)
+    return _worker["scorer"]
+
+
+def get_scorer():
+    """
+    This worker's scorer (prewarmed with the defaults if prewarm() wasn't called).
+    """
+    return _worker.get("scorer") or prewarm()
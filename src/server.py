@@ -0,0 +1,249 @@
+# src/server.py
+"""
+Multi-camera server: one process serves many stations.
+
+Every source (device index, video file or RTSP URL) gets a capture thread
+that only keeps its newest frame (latest-frame-wins), its own PoseDetector
+graph (MediaPipe tracks over time, so graphs can't be shared between
+streams) and its own rule / rep state, via a scoring.HeadlessScorer that
+is warmed up before the capture starts. Inference runs on a
+bounded pool of `workers` threads: a station waits for a free worker on an
+asyncio.Semaphore (FIFO, so stations are served round-robin) and only then
+takes its latest frame, so a slow pool drops stale frames instead of
+queueing them. Total CPU is capped by the pool size, not the camera count.
+
+Results go to each station's feed (Station.subscribe()) and to on_result.
+With --motion-gate, stations skip inference while their camera sees no
+motion or nobody (see motion_gate), which frees the pool for busy ones.
+
+usage: python src/server.py SOURCE [SOURCE ...] [--workers N] [--exercise NAME] [--jsonl] [--motion-gate]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from scoring import HeadlessScorer
+from pipeline import LatestFrame
+from rule_spec import load_exercises
+
+FEED_SIZE = 64
+
+
+class Station:
+    """
+    One capture source. Files are paced at their native fps (like a camera)
+    unless realtime=False.
+    """
+    def __init__(self, name, source, exercise, detector_settings=None, realtime=True, motion_gate=False):
+        self.name = name
+        self.source = int(source) if str(source).isdigit() else source
+        self.exercise = exercise
+        self.detector_settings = detector_settings or {}
+        self.realtime = realtime
+        self.motion_gate = motion_gate
+        self.slot = LatestFrame()
+        self.scorer = None
+        self.fps = 30.0
+        self.captured = 0
+        self.processed = 0
+        self.eof = False
+        self.latest = None
+        self._subscribers = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def dropped(self):
+        return self.slot.dropped
+
+    def subscribe(self, maxsize=FEED_SIZE):
+        """
+        asyncio.Queue receiving this station's result dicts; when a consumer
+        falls behind the oldest results are discarded.
+        """
+        q = asyncio.Queue(maxsize)
+        self._subscribers.append(q)
+        return q
+
+    def start(self, loop, wake):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            raise RuntimeError(f"{self.name}: cannot open {self.source}")
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640, int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 480)
+        self.scorer = HeadlessScorer(self.exercise, self.fps, self.detector_settings,
+                                     motion_gate=self.motion_gate).warm(size)
+        self._thread = threading.Thread(target=self._capture, args=(cap, loop, wake), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _capture(self, cap, loop, wake):
+        pace = self.realtime and not isinstance(self.source, int)
+        next_t = time.perf_counter()
+        while not self._stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            self.slot.put((self.captured, time.perf_counter(), frame))
+            self.captured += 1
+            loop.call_soon_threadsafe(wake.set)
+            if pace:
+                next_t += 1.0 / self.fps
+                delay = next_t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_t = time.perf_counter()
+        cap.release()
+        self.eof = True
+        loop.call_soon_threadsafe(wake.set)
+
+    def process(self, item):
+        """
+        Runs on a pool worker: pose + rules + reps for one frame.
+        """
+        idx, t_captured, frame = item
+        result = self.scorer.score_frame(frame)
+        self.processed += 1
+        return {
+            "station": self.name,
+            "frame": idx,
+            "time": time.time(),
+            "latency_ms": (time.perf_counter() - t_captured) * 1000.0,
+            **result
+        }
+
+    def publish(self, result):
+        self.latest = result
+        for q in self._subscribers:
+            if q.full():
+                q.get_nowait()
+            q.put_nowait(result)
+
+    def stats(self):
+        out = {"captured": self.captured, "processed": self.processed, "dropped": self.dropped,
+               "reps": self.scorer.reps if self.scorer else {}}
+        if self.scorer is not None and self.scorer.gate is not None:
+            out["motion_gate"] = self.scorer.gate.report()
+        return out
+
+    def close(self):
+        self.stop()
+        if self._thread is not None:
+            self._thread.join()
+        if self.scorer is not None:
+            self.scorer.close()
+
+
+class StationServer:
+    """
+    Serves `stations` with `workers` inference threads until every source
+    ends (files) or stop() is called.
+    """
+    def __init__(self, stations, workers=4):
+        self.stations = stations
+        self.workers = workers
+        self._stopping = False
+
+    async def run(self, on_result=None):
+        loop = asyncio.get_running_loop()
+        free_workers = asyncio.Semaphore(self.workers)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="pose") as pool:
+            wakes = []
+            for st in self.stations:
+                wake = asyncio.Event()
+                st.start(loop, wake)
+                wakes.append(wake)
+            try:
+                await asyncio.gather(*(self._serve(st, wake, free_workers, pool, on_result)
+                                       for st, wake in zip(self.stations, wakes)))
+            finally:
+                for st in self.stations:
+                    st.close()
+        return {st.name: st.stats() for st in self.stations}
+
+    def stop(self):
+        self._stopping = True
+        for st in self.stations:
+            st.stop()
+
+    async def _serve(self, st, wake, free_workers, pool, on_result):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            await wake.wait()
+            wake.clear()
+            async with free_workers:
+                # Take the frame only once a worker is free: newest wins
+                item = st.slot.get()
+                if item is not None:
+                    result = await loop.run_in_executor(pool, st.process, item)
+            if item is not None:
+                st.publish(result)
+                if on_result is not None:
+                    on_result(result)
+                # More frames may have arrived while we were busy
+                wake.set()
+            elif st.eof:
+                return
+
+
+def _report(server, every_s, out):
+    start = time.perf_counter()
+    last = {}
+
+    def report():
+        now = time.perf_counter()
+        for st in server.stations:
+            prev_t, prev_n = last.get(st.name, (start, 0))
+            rate = (st.processed - prev_n) / (now - prev_t) if now > prev_t else 0.0
+            last[st.name] = (now, st.processed)
+            reps = st.scorer.reps if st.scorer else {}
+            print(f"{st.name:>12}: {rate:5.1f} fps processed, {st.dropped} dropped, "
+                  f"reps L:{reps.get('left', 0)} R:{reps.get('right', 0)}", file=out)
+
+    async def loop():
+        while True:
+            await asyncio.sleep(every_s)
+            report()
+    return loop()
+
+
+async def _main(args):
+    exercise = load_exercises()[args.exercise]
+    stations = [Station(f"station{i}", src, exercise, {"model_complexity": args.model_complexity},
+                        realtime=not args.no_realtime, motion_gate=args.motion_gate)
+                for i, src in enumerate(args.sources)]
+    server = StationServer(stations, workers=args.workers)
+    on_result = (lambda r: print(json.dumps(r))) if args.jsonl else None
+    # Status goes to stderr when stdout carries the JSON lines
+    status_out = sys.stderr if args.jsonl else sys.stdout
+    reporter = asyncio.ensure_future(_report(server, args.report_every, status_out))
+    try:
+        summary = await server.run(on_result)
+    finally:
+        reporter.cancel()
+    print(json.dumps(summary, indent=2), file=status_out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve many camera stations from one process")
+    parser.add_argument("sources", nargs="+", help="device index, video file or RTSP URL per station")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="inference threads shared by all stations (caps CPU)")
+    parser.add_argument("--exercise", default="bicep_curl", choices=list(load_exercises()))
+    parser.add_argument("--model-complexity", type=int, default=1, choices=[0, 1, 2])
+    parser.add_argument("--no-realtime", action="store_true", help="read files as fast as possible")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between status lines")
+    parser.add_argument("--jsonl", action="store_true", help="print every result as a JSON line")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="skip inference on static frames / while nobody is in view")
+    args = parser.parse_args()
+    cv2.setNumThreads(1)
+    asyncio.run(_main(args))
@@ -0,0 +1,167 @@
+# src/session_store.py
+"""
+Columnar session store: everything process_video computes per frame,
+streamed to disk in fixed-size row groups instead of a DataFrame + CSV.
+
+A session is a directory:
+
+    index.json          schema, meta, row groups (file, first frame, rows),
+                        rep events
+    group_00000.npz     one row group: frame (n,), landmarks (n, 33, 4),
+    group_00001.npz     values / ok / check (n, R) for the R rule instances
+    ...
+
+Only the current row group is held in memory, so hour-long videos write in
+bounded memory. Row groups are plain uncompressed .npz (numpy only, no
+pyarrow), so a reader loads just the groups overlapping a frame range in
+milliseconds. The index is rewritten atomically after every group, so an
+interrupted run still leaves a readable session up to its last group.
+"""
+import json
+import os
+import numpy as np
+from pose_detector import NUM_LANDMARKS
+
+ROW_GROUP = 1024
+INDEX_FILE = "index.json"
+
+
+class SessionWriter:
+    """
+    append() one frame at a time; close() flushes the last partial group.
+    keys name the R rule instances (rule_spec.Exercise.keys).
+    """
+    def __init__(self, path, keys, meta=None, row_group=ROW_GROUP):
+        self.path = path
+        self.keys = list(keys)
+        self.meta = dict(meta or {})
+        self.row_group = row_group
+        self.groups = []
+        self.events = []
+        self.frames = 0
+        os.makedirs(path, exist_ok=True)
+        r = len(self.keys)
+        self._frame = np.empty(row_group, dtype=np.int64)
+        self._landmarks = np.empty((row_group, NUM_LANDMARKS, 4), dtype=np.float32)
+        self._values = np.empty((row_group, r), dtype=np.float64)
+        self._ok = np.empty((row_group, r), dtype=bool)
+        self._check = np.empty((row_group, r), dtype=np.int8)
+        self._n = 0
+
+    def append(self, frame_idx, landmarks, values=None, ok=None, check=None):
+        """
+        One frame: (33, 4) landmark row plus its evaluate() result; a frame
+        without a pose leaves values NaN, ok False and check -1.
+        """
+        i = self._n
+        self._frame[i] = frame_idx
+        self._landmarks[i] = landmarks
+        if values is None:
+            self._values[i] = np.nan
+            self._ok[i] = False
+            self._check[i] = -1
+        else:
+            self._values[i] = values
+            self._ok[i] = ok
+            self._check[i] = check
+        self._n += 1
+        if self._n == self.row_group:
+            self.flush()
+
+    def add_event(self, frame_idx, kind, **fields):
+        """
+        Sparse event (e.g. a completed rep), stored in the index.
+        """
+        self.events.append(dict(fields, frame=int(frame_idx), kind=kind))
+
+    def flush(self):
+        n = self._n
+        if n:
+            name = f"group_{len(self.groups):05d}.npz"
+            tmp = os.path.join(self.path, name + ".tmp.npz")
+            np.savez(tmp, frame=self._frame[:n], landmarks=self._landmarks[:n],
+                     values=self._values[:n], ok=self._ok[:n], check=self._check[:n])
+            os.replace(tmp, os.path.join(self.path, name))
+            self.groups.append({"file": name, "start": int(self._frame[0]), "rows": n})
+            self.frames += n
+            self._n = 0
+        self._write_index()
+
+    def close(self, **meta):
+        """
+        Flushes the last group; extra meta (e.g. the summary) goes into the index.
+        """
+        self.meta.update(meta)
+        self.flush()
+
+    def _write_index(self):
+        index = {"keys": self.keys, "meta": self.meta, "frames": self.frames,
+                 "row_group": self.row_group, "groups": self.groups, "events": self.events}
+        tmp = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, INDEX_FILE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionReader:
+    """
+    Random access to a session written by SessionWriter.
+
+    read(start, stop, columns) -> {column: array} for frames [start, stop),
+    loading only the row groups that overlap the range.
+    """
+    COLUMNS = ("frame", "landmarks", "values", "ok", "check")
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.keys = index["keys"]
+        self.meta = index["meta"]
+        self.frames = index["frames"]
+        self.groups = index["groups"]
+        self.events = index["events"]
+        self._starts = np.array([g["start"] for g in self.groups], dtype=np.int64)
+
+    def __len__(self):
+        return self.frames
+
+    def read(self, start=0, stop=None, columns=COLUMNS):
+        stop = self.frames if stop is None else min(stop, self.frames)
+        parts = {c: [] for c in columns}
+        first = max(int(np.searchsorted(self._starts, start, side="right")) - 1, 0)
+        for g in self.groups[first:]:
+            g_start, g_stop = g["start"], g["start"] + g["rows"]
+            if g_start >= stop:
+                break
+            if g_stop <= start:
+                continue
+            lo, hi = max(start, g_start) - g_start, min(stop, g_stop) - g_start
+            with np.load(os.path.join(self.path, g["file"])) as z:
+                for c in columns:
+                    parts[c].append(z[c][lo:hi])
+        return {c: (np.concatenate(p) if p else self._empty(c)) for c, p in parts.items()}
+
+    def column(self, key, start=0, stop=None):
+        """
+        Values of one rule instance (e.g. "bicep_elbow_angle_left") over a frame range.
+        """
+        return self.read(start, stop, ("values",))["values"][:, self.keys.index(key)]
+
+    def events_between(self, start=0, stop=None, kind=None):
+        stop = self.frames if stop is None else stop
+        return [e for e in self.events
+                if start <= e["frame"] < stop and (kind is None or e["kind"] == kind)]
+
+    def _empty(self, column):
+        r = len(self.keys)
+        return {"frame": np.empty(0, dtype=np.int64),
+                "landmarks": np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32),
+                "values": np.empty((0, r)), "ok": np.empty((0, r), dtype=bool),
+                "check": np.empty((0, r), dtype=np.int8)}[column]
@@ -0,0 +1,51 @@
+# src/synthetic.py
+import numpy as np
+from form_rules import LM
+from pose_detector import NUM_LANDMARKS
+
+
+def synthetic_curl_landmarks(n_frames=3000, fps=30.0, rep_seconds=3.0, noise=0.002, seed=0,
+                             frame_size=(1280, 720), overhead=False):
+    """
+    (n_frames, 33, 4) float32 normalized landmarks (x, y, z, visibility) of a
+    person doing continuous bicep curls with both arms: the elbow angle (in
+    frame_size pixel space) sweeps 170 deg -> 30 deg -> 170 deg once every
+    rep_seconds. overhead=True points the upper arms up instead, the same
+    sweep as an overhead tricep extension. Deterministic for a given seed.
+    """
+    w, h = frame_size
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_frames) / fps
+    # Elbow angle in degrees, bottom (extended) at t=0
+    angle = 100 + 70 * np.cos(2 * np.pi * t / rep_seconds)
+
+    lm = np.zeros((n_frames, NUM_LANDMARKS, 4), dtype=np.float64)
+    # Static body layout (facing camera); unused joints just sit on the torso
+    lm[:, :, 0] = 0.5
+    lm[:, :, 1] = 0.5
+    lm[:, LM["NOSE"], :2] = (0.5, 0.18)
+    lm[:, LM["LEFT_EAR"], :2] = (0.54, 0.17)
+    lm[:, LM["RIGHT_EAR"], :2] = (0.46, 0.17)
+    lm[:, LM["LEFT_HIP"], :2] = (0.56, 0.60)
+    lm[:, LM["RIGHT_HIP"], :2] = (0.44, 0.60)
+
+    # Arm lengths as a fraction of frame height
+    upper_arm = 0.15
+    forearm = 0.14
+    rad = np.radians(angle)
+    # Upper arm hanging down (+1) or raised overhead (-1)
+    down = -1.0 if overhead else 1.0
+    for side, sign in (("LEFT", 1), ("RIGHT", -1)):
+        sh = np.array([0.5 + sign * 0.09, 0.28])
+        el = sh + (0.0, down * upper_arm)
+        lm[:, LM[f"{side}_SHOULDER"], :2] = sh
+        lm[:, LM[f"{side}_ELBOW"], :2] = el
+        # Forearm swings about the elbow; 180 deg = in line with the upper arm.
+        # Offsets are built in pixels (h units) so the pixel-space angle is exact.
+        lm[:, LM[f"{side}_WRIST"], 0] = el[0] + sign * forearm * np.sin(rad) * h / w
+        lm[:, LM[f"{side}_WRIST"], 1] = el[1] - down * forearm * np.cos(rad)
+
+    lm[:, :, :2] += rng.normal(0, noise, size=(n_frames, NUM_LANDMARKS, 2))
+    lm[:, :, 2] = rng.normal(0, 0.05, size=(n_frames, NUM_LANDMARKS))
+    lm[:, :, 3] = 0.95
+    return lm.astype(np.float32)
@@ -0,0 +1,150 @@
+# src/telemetry.py
+import json
+import logging
+import math
+import time
+from collections import Counter, deque
+from threading import Lock
+import cv2
+import numpy as np
+
+logger = logging.getLogger("telemetry")
+
+# Whole-session histogram: log-spaced bins HIST_RATIO wide, so its
+# percentiles are within ~1% of the exact ones at a few hundred counters
+# per stage, however long the session
+HIST_RATIO = 1.02
+_LOG_RATIO = math.log(HIST_RATIO)
+
+
+class Telemetry:
+    """
+    Opt-in per-frame stage timing shared by process_video and the live loops.
+
+    Usage (stages are timed back to back with lap):
+        t = tel.clock()
+        ... capture ...
+        t = tel.lap("capture", t)
+        ... rules ...
+        t = tel.lap("rules", t)
+        tel.frame_done()
+
+    Keeps the last `window` samples per stage for rolling p50/p95/p99 (the
+    periodic log line and the overlay) and a whole-session histogram per
+    stage for summary(), counts dropped frames (reported via drop(), or
+    estimated from gaps between frame_done() calls when expected_fps is
+    given), logs one JSON line every log_every_s seconds and can draw an
+    overlay. When disabled every method
+    returns immediately, so the calls can stay in the hot path.
+    """
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, enabled=True, window=300, log_every_s=10.0, expected_fps=None):
+        self.enabled = enabled
+        self.window = window
+        self.log_every_s = log_every_s
+        self.expected_fps = expected_fps
+        self.samples = {}
+        self.hist = {}
+        self.frames = 0
+        self.dropped = 0
+        self._lock = Lock()
+        self._last_frame_t = None
+        self._last_log_t = time.perf_counter()
+        self._overlay_lines = []
+
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def lap(self, stage, t_start):
+        """
+        Records now - t_start (seconds) under `stage`; returns now.
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        ms = (now - t_start) * 1000.0
+        with self._lock:
+            buf = self.samples.get(stage)
+            if buf is None:
+                buf = self.samples[stage] = deque(maxlen=self.window)
+                self.hist[stage] = Counter()
+            buf.append(ms)
+            self.hist[stage][math.floor(math.log(max(ms, 1e-6)) / _LOG_RATIO)] += 1
+        return now
+
+    def drop(self, n=1):
+        if self.enabled:
+            self.dropped += n
+
+    def frame_done(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.frames += 1
+        if self.expected_fps and self._last_frame_t is not None:
+            # A gap of k frame periods means k - 1 frames never made it through
+            missed = int(round((now - self._last_frame_t) * self.expected_fps)) - 1
+            if missed > 0:
+                self.dropped += missed
+        self._last_frame_t = now
+        if self.frames % 15 == 0:
+            self._overlay_lines = None  # refresh lazily in draw()
+        if now - self._last_log_t >= self.log_every_s:
+            self._last_log_t = now
+            logger.info(json.dumps({"event": "telemetry", "frames": self.frames,
+                                    "dropped": self.dropped, "stages": self.percentiles()}))
+
+    def percentiles(self):
+        """
+        {stage: {"p50": ms, "p95": ms, "p99": ms}} over the rolling window.
+        """
+        with self._lock:
+            snap = {k: np.array(v) for k, v in self.samples.items() if v}
+        return {k: {f"p{p}": round(float(x), 3) for p, x in zip(self.PERCENTILES, np.percentile(a, self.PERCENTILES))}
+                for k, a in snap.items()}
+
+    def session_percentiles(self):
+        """
+        Same as percentiles(), over every sample since the start (from the
+        histogram: each value is its bin's geometric centre).
+        """
+        with self._lock:
+            snap = {k: sorted(c.items()) for k, c in self.hist.items() if c}
+        out = {}
+        for stage, bins in snap.items():
+            counts = np.cumsum([n for _, n in bins])
+            out[stage] = {}
+            for p in self.PERCENTILES:
+                # Nearest rank, as a 1-based sample index
+                i = int(np.searchsorted(counts, max(1, math.ceil(p / 100 * counts[-1]))))
+                out[stage][f"p{p}"] = round(HIST_RATIO ** (bins[i][0] + 0.5), 3)
+        return out
+
+    def summary(self):
+        """
+        Flat numeric dict for merging into a scoring summary (mlflow-safe);
+        the stage percentiles cover the whole session.
+        """
+        if not self.enabled:
+            return {}
+        out = {"telemetry_frames": self.frames, "telemetry_dropped_frames": self.dropped}
+        for stage, pct in self.session_percentiles().items():
+            for name, ms in pct.items():
+                out[f"telemetry_{stage}_{name}_ms"] = ms
+        return out
+
+    def draw(self, frame, origin=(10, None)):
+        """
+        Overlays "stage p50/p95/p99" lines in the bottom-left corner.
+        """
+        if not self.enabled:
+            return
+        if not self._overlay_lines:
+            self._overlay_lines = [f"{k}: {v['p50']:.1f}/{v['p95']:.1f}/{v['p99']:.1f} ms"
+                                   for k, v in self.percentiles().items()]
+            self._overlay_lines.append(f"frames {self.frames}  dropped {self.dropped}")
+        x, y = origin
+        y = y if y is not None else frame.shape[0] - 20 * len(self._overlay_lines) - 10
+        for i, line in enumerate(self._overlay_lines):
+            cv2.putText(frame, line, (x, y + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
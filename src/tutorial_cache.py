@@ -0,0 +1,118 @@
+# src/tutorial_cache.py
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+import cv2
+import numpy as np
+
+
+class TutorialClip:
+    """
+    A fully decoded clip: frames is a (N, H, W, 3) uint8 RGB array already at
+    display size, fps the clip's native rate.
+    """
+    def __init__(self, frames, fps):
+        self.frames = frames
+        self.fps = fps
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class TutorialClipCache:
+    """
+    Decodes each tutorial video once (resize + BGR->RGB included) and keeps
+    the result for looping playback. Clips are evicted least-recently-used
+    once more than max_clips are held or their total size exceeds max_bytes.
+
+    With mmap_dir set, decoded frames are also written there as .npy and
+    read back memory-mapped, so they survive restarts and live in the page
+    cache instead of the process heap.
+    """
+    def __init__(self, size=(320, 240), max_clips=4, max_bytes=256 * 1024 * 1024, mmap_dir=None):
+        self.size = size
+        self.max_clips = max_clips
+        self.max_bytes = max_bytes
+        self.mmap_dir = mmap_dir
+        self._clips = OrderedDict()
+        self._lock = Lock()
+        if mmap_dir:
+            os.makedirs(mmap_dir, exist_ok=True)
+
+    def get(self, path):
+        """
+        Returns the TutorialClip for path (decoding it on first use), or None
+        if the video can't be read.
+        """
+        with self._lock:
+            clip = self._clips.get(path)
+            if clip is not None:
+                self._clips.move_to_end(path)
+                return clip
+
+        clip = self._load(path)
+        if clip is None:
+            return None
+        with self._lock:
+            self._clips[path] = clip
+            self._clips.move_to_end(path)
+            self._evict()
+        return clip
+
+    def _evict(self):
+        while len(self._clips) > 1 and (
+                len(self._clips) > self.max_clips
+                or sum(c.nbytes for c in self._clips.values()) > self.max_bytes):
+            self._clips.popitem(last=False)
+
+    def _mmap_path(self, path):
+        st = os.stat(path)
+        key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{self.size}"
+        return os.path.join(self.mmap_dir, hashlib.sha1(key.encode()).hexdigest() + ".npy")
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        npy_path = self._mmap_path(path) if self.mmap_dir else None
+        if npy_path and os.path.exists(npy_path):
+            with open(npy_path[:-4] + ".json") as f:
+                fps = json.load(f)["fps"]
+            return TutorialClip(np.load(npy_path, mmap_mode="r"), fps)
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        w, h = self.size
+        # Frame count from the container can be off; grow if needed, trim after
+        frames = np.empty((max(n, 1), h, w, 3), dtype=np.uint8)
+        count = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if count == len(frames):
+                frames = np.concatenate([frames, np.empty_like(frames)])
+            small = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=frames[count])
+            count += 1
+        cap.release()
+        if count == 0:
+            return None
+        frames = frames[:count].copy() if count < len(frames) else frames
+
+        if npy_path:
+            # Sidecar first, frames last (atomically): the .npy marks a complete entry
+            with open(npy_path[:-4] + ".json", "w") as f:
+                json.dump({"fps": fps, "video": os.path.basename(path)}, f)
+            np.save(npy_path + ".tmp.npy", frames)
+            os.replace(npy_path + ".tmp.npy", npy_path)
+            return TutorialClip(np.load(npy_path, mmap_mode="r"), fps)
+        return TutorialClip(frames, fps)
@@ -1,85 +1,254 @@
-# src/utils.py
-import math
-import numpy as np
-from scipy.signal import savgol_filter
-
-def calculate_angle(a, b, c):
-    """
-    Calculate angle at point b formed by points a-b-c.
-    Returns angle in degrees (0..180)
-    """
-    a = np.array(a, dtype=float)
-    b = np.array(b, dtype=float)
-    c = np.array(c, dtype=float)
-    v1 = a - b
-    v2 = c - b
-    denom = (np.linalg.norm(v1) * np.linalg.norm(v2))
-    if denom == 0:
-        return 0.0
-    cosang = np.clip(np.dot(v1, v2) / denom, -1.0, 1.0)
-    ang = math.degrees(math.acos(cosang))
-    return ang
-
-def dist(a, b):
-    a = np.array(a)
-    b = np.array(b)
-    return np.linalg.norm(a - b)
-
-def smooth_series(vals, method="savgol", window=11, poly=2):
-    """
-    Smooth 1D numpy array, fill NaNs first
-    """
-    v = np.array(vals, dtype=float)
-    if np.isnan(v).any():
-        idx = np.where(~np.isnan(v))[0]
-        if len(idx) == 0:
-            return v
-        v[:idx[0]] = v[idx[0]]
-        v[idx[-1]+1:] = v[idx[-1]]
-        n_idx = np.isnan(v)
-        if n_idx.any():
-            v[n_idx] = np.interp(np.where(n_idx)[0], np.where(~n_idx)[0], v[~n_idx])
-    if method == "savgol":
-        wl = min(window, len(v) if len(v)%2==1 else len(v)-1)
-        if wl < 5:
-            return v
-        try:
-            return savgol_filter(v, wl, poly)
-        except:
-            return v
-    elif method == "ema":
-        alpha = 0.2
-        out = np.zeros_like(v)
-        out[0] = v[0]
-        for i in range(1, len(v)):
-            out[i] = alpha*v[i] + (1-alpha)*out[i-1]
-        return out
-    return v
-
-def detect_reps_from_angle_series(angle_series, up_thresh=60, down_thresh=150, min_gap=10):
-    """
-    Hysteresis-based rep counter:
-    up_thresh -> top, down_thresh -> bottom
-    """
-    state = "unknown"
-    last_event_frame = -999
-    rep_count = 0
-    events = []
-    for i, a in enumerate(angle_series):
-        if a <= up_thresh:
-            if state == "down" and (i - last_event_frame) > min_gap:
-                state = "up"
-                last_event_frame = i
-            else:
-                state = "up"
-        elif a >= down_thresh:
-            if state == "up" and (i - last_event_frame) > min_gap:
-                rep_count += 1
-                events.append(i)
-                last_event_frame = i
-                state = "down"
-            else:
-                state = "down"
-        else:
-            state = "moving"
-    return rep_count, events
+# src/utils.py
+import math
+from collections import deque
+import numpy as np
+
+# Rep detection / smoothing defaults shared by the offline and live paths
+REP_UP_THRESH = 60       # elbow angle at the top of a rep
+REP_DOWN_THRESH = 150    # elbow angle back at the bottom
+REP_MIN_GAP_S = 0.3      # min seconds between rep events
+SMOOTH_WINDOW = 11
+SMOOTH_POLY = 2
+
+def calculate_angle(a, b, c):
+    """
+    Calculate angle at point b formed by points a-b-c.
+    Returns angle in degrees (0..180)
+    """
+    a = np.array(a, dtype=float)
+    b = np.array(b, dtype=float)
+    c = np.array(c, dtype=float)
+    v1 = a - b
+    v2 = c - b
+    denom = (np.linalg.norm(v1) * np.linalg.norm(v2))
+    if denom == 0:
+        return 0.0
+    cosang = np.clip(np.dot(v1, v2) / denom, -1.0, 1.0)
+    ang = math.degrees(math.acos(cosang))
+    return ang
+
+def calculate_angle_batch(a, b, c):
+    """
+    Vectorized calculate_angle over arrays of points shaped (..., 2|3).
+    Returns angles in degrees (0..180); 0.0 where a vector has zero length,
+    NaN where any input point is NaN (e.g. frames without a pose).
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    c = np.asarray(c, dtype=float)
+    v1 = a - b
+    v2 = c - b
+    # Plain sums and a masked divide: no errstate / einsum overhead, which
+    # dominates on the single frames the live path scores
+    denom = np.sqrt((v1 * v1).sum(-1)) * np.sqrt((v2 * v2).sum(-1))
+    cosang = np.divide((v1 * v2).sum(-1), denom, out=np.zeros_like(denom), where=denom != 0)
+    ang = np.degrees(np.arccos(np.clip(cosang, -1.0, 1.0)))
+    return np.where(denom == 0, 0.0, ang)
+
+def to_pixel_coords(landmarks, w, h):
+    """
+    Normalized (N, 33, 2+) landmark array -> (N, 33, 2) pixel coordinates,
+    truncated the same way as int(p.x * w) in the per-frame loops.
+    """
+    lm = np.asarray(landmarks, dtype=np.float64)
+    px = np.trunc(lm[..., :2] * np.array([w, h], dtype=np.float64))
+    return px.astype(np.float32)
+
+def dist(a, b):
+    a = np.array(a)
+    b = np.array(b)
+    return np.linalg.norm(a - b)
+
+def smooth_series(vals, method="savgol", window=11, poly=2):
+    """
+    Smooth 1D numpy array, fill NaNs first
+    """
+    v = np.array(vals, dtype=float)
+    if np.isnan(v).any():
+        idx = np.where(~np.isnan(v))[0]
+        if len(idx) == 0:
+            return v
+        v[:idx[0]] = v[idx[0]]
+        v[idx[-1]+1:] = v[idx[-1]]
+        n_idx = np.isnan(v)
+        if n_idx.any():
+            v[n_idx] = np.interp(np.where(n_idx)[0], np.where(~n_idx)[0], v[~n_idx])
+    if method == "savgol":
+        from scipy.signal import savgol_filter  # lazy: scipy.signal takes ~1 s to import
+        wl = min(window, len(v) if len(v)%2==1 else len(v)-1)
+        if wl < 5:
+            return v
+        try:
+            return savgol_filter(v, wl, poly)
+        except:
+            return v
+    elif method == "ema":
+        alpha = 0.2
+        out = np.zeros_like(v)
+        out[0] = v[0]
+        for i in range(1, len(v)):
+            out[i] = alpha*v[i] + (1-alpha)*out[i-1]
+        return out
+    return v
+
+def detect_reps_from_angle_series(angle_series, up_thresh=60, down_thresh=150, min_gap=10):
+    """
+    Hysteresis-based rep counter:
+    up_thresh -> top, down_thresh -> bottom
+    Angles in between keep the current state. Same logic as RepCounter.
+    """
+    counter = RepCounter(up_thresh, down_thresh, min_gap)
+    events = [i for i, a in enumerate(angle_series) if counter.update(a)]
+    return counter.count, events
+
+
+def count_reps_grid(angle_series, up_thresh, down_thresh, min_gap):
+    """
+    detect_reps_from_angle_series for a whole grid of settings at once:
+    up_thresh / down_thresh / min_gap broadcast to a common shape G and the
+    result is the rep count per setting (shape G). One vectorized step per
+    sample, not one Python loop per setting.
+    """
+    up, down, gap = np.broadcast_arrays(np.asarray(up_thresh, dtype=float),
+                                        np.asarray(down_thresh, dtype=float),
+                                        np.asarray(min_gap))
+    state = np.zeros(up.shape, dtype=np.int8)  # 0 unknown, 1 up, 2 down
+    last = np.full(up.shape, -999)
+    count = np.zeros(up.shape, dtype=np.int64)
+    for i, a in enumerate(np.asarray(angle_series, dtype=float).tolist()):
+        if a != a:
+            continue  # NaN changes nothing, like RepCounter
+        is_up = a <= up
+        is_down = ~is_up & (a >= down)
+        gap_ok = (i - last) > gap
+        rep = is_down & (state == 1) & gap_ok
+        count += rep
+        last = np.where(rep | (is_up & (state == 2) & gap_ok), i, last)
+        state = np.where(is_up, 1, np.where(is_down, 2, state)).astype(np.int8)
+    return count
+
+
+# --- STREAMING (ONE SAMPLE AT A TIME, CONSTANT MEMORY) ---
+
+class RepCounter:
+    """
+    Streaming version of detect_reps_from_angle_series.
+    update(angle) returns True on the frame a rep completes (top -> bottom).
+    """
+    def __init__(self, up_thresh=60, down_thresh=150, min_gap=10):
+        self.up_thresh = up_thresh
+        self.down_thresh = down_thresh
+        self.min_gap = min_gap
+        self.reset()
+
+    def reset(self):
+        self.state = "unknown"
+        self.frame = -1
+        self.last_event_frame = -999
+        self.count = 0
+
+    def update(self, angle):
+        self.frame += 1
+        i = self.frame
+        if angle <= self.up_thresh:
+            if self.state == "down" and (i - self.last_event_frame) > self.min_gap:
+                self.last_event_frame = i
+            self.state = "up"
+        elif angle >= self.down_thresh:
+            rep = self.state == "up" and (i - self.last_event_frame) > self.min_gap
+            self.state = "down"
+            if rep:
+                self.count += 1
+                self.last_event_frame = i
+                return True
+        return False
+
+
+class StreamingSmoother:
+    """
+    Streaming version of smooth_series: push() one sample (NaN = missing)
+    and get back the smoothed values that became final, flush() at the end.
+    Output equals smooth_series on the whole series.
+
+    savgol lags window // 2 samples behind the input; a NaN gap is held
+    back (as a count, not stored) until the next valid sample so it can
+    be interpolated like the batch version does.
+    """
+    def __init__(self, method="savgol", window=11, poly=2, alpha=0.2):
+        if method == "savgol" and window % 2 == 0:
+            raise ValueError("savgol window must be odd")
+        self.method = method
+        self.window = window
+        self.poly = poly
+        self.alpha = alpha
+        self.half = window // 2
+        self.coeffs = None
+        if method == "savgol":
+            from scipy.signal import savgol_coeffs
+            self.coeffs = savgol_coeffs(window, poly, use="dot")
+        self.reset()
+
+    def reset(self):
+        self.last_valid = None
+        self.gap = 0
+        self.buf = deque(maxlen=self.window)
+        self.seen = 0
+        self.ema = None
+
+    def push(self, x):
+        x = float(x)
+        if np.isnan(x):
+            self.gap += 1
+            return []
+        if self.last_valid is None:
+            # Leading NaNs take the first valid value
+            filled = [x] * (self.gap + 1)
+        else:
+            step = (x - self.last_valid) / (self.gap + 1)
+            filled = [self.last_valid + step * k for k in range(1, self.gap + 1)] + [x]
+        self.gap = 0
+        self.last_valid = x
+        out = []
+        for v in filled:
+            out += self._filter(v)
+        return out
+
+    def flush(self):
+        """
+        Trailing NaNs repeat the last valid value; emits the lagged tail.
+        """
+        out = []
+        if self.last_valid is None:
+            out = [np.nan] * self.gap
+        else:
+            for _ in range(self.gap):
+                out += self._filter(self.last_valid)
+        self.gap = 0
+        if self.method == "savgol" and self.buf:
+            buf = np.array(self.buf)
+            if self.seen < self.window:
+                # Short series: the batch function sees all of it at once
+                out += list(smooth_series(buf, "savgol", self.window, self.poly))
+            else:
+                from scipy.signal import savgol_filter
+                out += list(savgol_filter(buf, self.window, self.poly)[self.half + 1:])
+        self.reset()
+        return out
+
+    def _filter(self, v):
+        if self.method == "ema":
+            self.ema = v if self.ema is None else self.alpha*v + (1-self.alpha)*self.ema
+            return [self.ema]
+        if self.method != "savgol":
+            return [v]
+        self.buf.append(v)
+        self.seen += 1
+        if self.seen < self.window:
+            return []
+        buf = np.array(self.buf)
+        center = float(np.dot(self.coeffs, buf))
+        if self.seen == self.window:
+            # Left edge: polynomial fit over the first window, as savgol_filter does
+            from scipy.signal import savgol_filter
+            return list(savgol_filter(buf, self.window, self.poly)[:self.half]) + [center]
+        return [center]
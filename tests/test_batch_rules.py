@@ -0,0 +1,59 @@
+# tests/test_batch_rules.py
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from form_rules import evaluate_rules_batch
+from pose_detector import landmarks_to_array
+from rule_spec import load_exercises
+from synthetic import synthetic_curl_landmarks
+from utils import calculate_angle, calculate_angle_batch, to_pixel_coords
+
+EXERCISES = load_exercises()
+
+
+def test_calculate_angle_batch_matches_scalar():
+    rng = np.random.default_rng(1)
+    a, b, c = rng.uniform(0, 100, (3, 200, 2))
+    c[:10] = b[:10]  # zero-length limb
+    batch = calculate_angle_batch(a, b, c)
+    np.testing.assert_allclose(batch, [calculate_angle(*p) for p in zip(a, b, c)], atol=1e-9)
+    assert calculate_angle_batch((1, 0), (0, 0), (0, 1)) == 90.0
+    assert np.isnan(calculate_angle_batch([np.nan, 0], [0, 0], [1, 0]))
+
+
+def test_to_pixel_coords_truncates_like_the_frame_loops():
+    lm = synthetic_curl_landmarks(20)
+    px = to_pixel_coords(lm, 1280, 720)
+    assert px.shape == (20, 33, 2)
+    expected = [[(int(p[0] * 1280), int(p[1] * 720)) for p in row.astype(float)] for row in lm]
+    np.testing.assert_array_equal(px, expected)
+
+
+def test_landmarks_to_array():
+    points = [SimpleNamespace(x=i / 33, y=0.5, z=0.0, visibility=0.9) for i in range(33)]
+    row = landmarks_to_array(SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=points)))
+    assert row.shape == (33, 4) and row.dtype == np.float32
+    assert row[3, 0] == np.float32(3 / 33)
+    assert np.isnan(landmarks_to_array(SimpleNamespace(pose_landmarks=None))).all()
+
+
+@pytest.mark.parametrize("name", sorted(EXERCISES))
+def test_batch_matches_per_frame(name):
+    ex = EXERCISES[name]
+    px = to_pixel_coords(synthetic_curl_landmarks(300, seed=3), 1280, 720)
+    px[::25] = np.nan  # frames without a pose
+    batch = evaluate_rules_batch(px, ex)
+    assert list(batch) == ex.keys
+    for i, row in enumerate(px):
+        values, ok, _ = ex.evaluate(row)
+        for r, key in enumerate(ex.keys):
+            assert batch[key][0][i] == ok[r]
+            np.testing.assert_array_equal(batch[key][1][i], values[r])
+
+
+def test_batch_by_exercise_name():
+    px = to_pixel_coords(synthetic_curl_landmarks(50), 1280, 720)
+    by_name = evaluate_rules_batch(px, "tricep_curl")
+    compiled = evaluate_rules_batch(px, EXERCISES["tricep_curl"])
+    for key in compiled:
+        np.testing.assert_array_equal(by_name[key][1], compiled[key][1])
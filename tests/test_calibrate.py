@@ -0,0 +1,22 @@
+# tests/test_calibrate.py
+import numpy as np
+from utils import count_reps_grid, detect_reps_from_angle_series, smooth_series
+
+
+def test_count_reps_grid_matches_detect_reps():
+    rng = np.random.default_rng(0)
+    series = 100 + 70 * np.cos(np.arange(600) * 2 * np.pi / 90) + rng.normal(0, 8, 600)
+    series[::37] = np.nan
+    series = smooth_series(series)
+    series[200:210] = np.nan  # NaN left in: changes nothing, like RepCounter
+    up, down, gap = np.meshgrid([40, 60, 80], [130, 150, 170], [0, 9, 30], indexing="ij")
+    counts = count_reps_grid(series, up, down, gap)
+    assert counts.shape == up.shape
+    for idx in np.ndindex(up.shape):
+        assert counts[idx] == detect_reps_from_angle_series(series, up[idx], down[idx], gap[idx])[0]
+
+
+def test_count_reps_grid_broadcasts_scalars():
+    series = [170, 40, 160, 40, 160]
+    assert count_reps_grid(series, 60, 150, 0) == 2
+    np.testing.assert_array_equal(count_reps_grid(series, [60, 30], 150, 0), [2, 0])
@@ -0,0 +1,55 @@
+# tests/test_motion_gate.py
+import numpy as np
+from motion_gate import MotionGate
+
+FPS = 10.0  # static refresh every 20 frames, absent check every 10
+
+
+def frame(value=0, box=None):
+    f = np.full((240, 320, 3), value, dtype=np.uint8)
+    if box is not None:
+        x, y = box
+        f[y:y + 60, x:x + 60] = 255
+    return f
+
+
+def run(gate, frames, present=True):
+    due = []
+    for f in frames:
+        d = gate.due(f)
+        if d:
+            gate.observe(present)
+        due.append(d)
+    return due
+
+
+def test_static_scene_refreshes_slowly():
+    gate = MotionGate(FPS)
+    due = run(gate, [frame(box=(100, 100))] * 45)
+    assert [i for i, d in enumerate(due) if d] == [0, 20, 40]
+    assert gate.report() == {"frames": 45, "inferred": 3, "skipped_static": 42, "skipped_absent": 0}
+
+
+def test_motion_triggers_inference():
+    gate = MotionGate(FPS)
+    frames = [frame(box=(100, 100))] * 5 + [frame(box=(130, 100))] + [frame(box=(130, 100))] * 3
+    due = run(gate, frames)
+    assert [i for i, d in enumerate(due) if d] == [0, 5]
+
+
+def test_absent_checks_until_someone_moves():
+    gate = MotionGate(FPS)
+    due = run(gate, [frame()] * 25, present=False)
+    assert [i for i, d in enumerate(due) if d] == [0, 10, 20]
+    # Someone walks in: checked after absent_motion frames, not the full interval
+    gate.reset()
+    frames = [frame()] * 3 + [frame(box=(10, 10))] * 3
+    assert [i for i, d in enumerate(run(gate, frames, present=False)) if d] == [0, 3]
+
+
+def test_reset():
+    gate = MotionGate(FPS)
+    run(gate, [frame()] * 5)
+    gate.reset()
+    assert gate.due(frame())  # no reference frame yet
+    assert gate.report()["frames"] == 1
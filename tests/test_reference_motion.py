@@ -0,0 +1,54 @@
+# tests/test_reference_motion.py
+import numpy as np
+import pytest
+from reference_motion import dtw, prepare, rep_start
+
+
+def naive_dtw(a, b, band):
+    # Textbook cell-by-cell DTW over the same Sakoe-Chiba band
+    n, m = len(a), len(b)
+    cost = np.abs(a[:, None, :] - b[None, :, :]).mean(axis=2)
+    r = max(1, int(np.ceil(band * max(n, m))))
+    D = np.full((n + 1, m + 1), np.inf)
+    D[0, 0] = 0.0
+    for i in range(n):
+        centre = i * (m - 1) / max(n - 1, 1)
+        for j in range(m):
+            if np.floor(centre - r) <= j < np.ceil(centre + r) + 1:
+                D[i + 1, j + 1] = cost[i, j] + min(D[i, j], D[i, j + 1], D[i + 1, j])
+    return D[1:, 1:], cost
+
+
+@pytest.mark.parametrize("n, m, band", [(64, 64, 0.15), (40, 64, 0.15), (64, 50, 0.3), (30, 30, 1.0), (5, 9, 0.1)])
+def test_dtw_matches_naive(n, m, band):
+    rng = np.random.default_rng(n * m)
+    a = np.cumsum(rng.normal(0, 5, (n, 3)), axis=0)
+    b = np.cumsum(rng.normal(0, 5, (m, 3)), axis=0)
+    D, cost = naive_dtw(a, b, band)
+    distance, rows, cols = dtw(a, b, band)
+    # Optimal total cost along the returned path, which is a valid warping path
+    assert cost[rows, cols].sum() == pytest.approx(D[-1, -1], rel=1e-9)
+    assert distance == pytest.approx(cost[rows, cols].mean(), rel=1e-12)
+    assert (rows[0], cols[0], rows[-1], cols[-1]) == (0, 0, n - 1, m - 1)
+    steps = np.stack([np.diff(rows), np.diff(cols)], axis=1)
+    assert set(map(tuple, steps)) <= {(0, 1), (1, 0), (1, 1)}
+
+
+def test_dtw_identical_and_shifted():
+    t = np.linspace(0, 2 * np.pi, 64)
+    a = np.stack([np.sin(t), np.cos(t)], axis=1) * 50
+    assert dtw(a, a)[0] == 0.0
+    # A small time shift costs far less than a different shape
+    shifted = np.roll(a, 2, axis=0)
+    assert dtw(a, shifted)[0] < 0.2 * dtw(a, -a)[0]
+
+
+def test_prepare_and_rep_start():
+    angles = np.column_stack([np.linspace(160, 40, 30), np.full(30, np.nan)])
+    out = prepare(angles, 64)
+    assert out.shape == (64, 2)
+    assert np.isnan(out[:, 1]).all()
+    assert out[0, 0] == pytest.approx(160, abs=1) and out[-1, 0] == pytest.approx(40, abs=1)
+    # Hold at the bottom, then the curl: the rep starts after the last >= down frame
+    v = np.array([170, 170, 165, 140, 100, 50, 100, 160], dtype=float)
+    assert rep_start(v, 0, len(v) - 1, 150) == 3
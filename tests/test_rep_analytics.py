@@ -0,0 +1,57 @@
+# tests/test_rep_analytics.py
+import numpy as np
+from rep_analytics import RepAnalytics
+from rule_spec import load_exercises
+from synthetic import synthetic_curl_landmarks
+from utils import REP_MIN_GAP_S, detect_reps_from_angle_series, smooth_series
+
+FPS = 30.0
+EXERCISE = load_exercises()["bicep_curl"]
+
+
+def stream(n=400):
+    lm = synthetic_curl_landmarks(n, fps=FPS)
+    lm[100:110] = np.nan  # a dropout
+    return EXERCISE.evaluate_landmarks(lm, 1280, 720)
+
+
+def run(analytics, values, ok, check):
+    records = []
+    for v, o, c in zip(values, ok, check):
+        records += analytics.push(v, o, c) if not np.isnan(v).all() else analytics.push()
+    return records + analytics.flush()
+
+
+def test_reps_match_offline_counter():
+    values, ok, check = stream()
+    records = run(RepAnalytics(EXERCISE, FPS), values, ok, check)
+    for side, v in EXERCISE.rep_values(values).items():
+        count, events = detect_reps_from_angle_series(smooth_series(v), EXERCISE.rep_up, EXERCISE.rep_down,
+                                                      int(FPS * REP_MIN_GAP_S))
+        assert count > 0
+        assert [r["end"] for r in records if r["side"] == side] == events
+
+
+def test_records_fail_only_own_side():
+    values, ok, check = stream()
+    records = run(RepAnalytics(EXERCISE, FPS), values, ok, check)
+    for r in records:
+        other = "right" if r["side"] == "left" else "left"
+        assert r["fail"]
+        assert not [k for k in r["fail"] if k.endswith("_" + other)]
+        assert "back_symmetry" in r["fail"]
+        assert 0.0 <= min(r["fail"].values()) <= max(r["fail"].values()) <= 1.0
+
+
+def test_reset_starts_over():
+    values, ok, check = stream()
+    seen = []
+    analytics = RepAnalytics(EXERCISE, FPS, on_rep=seen.append)
+    first = run(analytics, values, ok, check)
+    analytics.reset()
+    assert analytics.reps == {"left": 0, "right": 0} and analytics.frames == 0
+    assert run(analytics, values, ok, check) == first
+    assert seen == first + first
+    summary = analytics.summary()
+    assert summary["frames"] == len(values)
+    assert summary["reps_left"] == sum(r["side"] == "left" for r in first)
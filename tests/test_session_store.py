@@ -0,0 +1,78 @@
+# tests/test_session_store.py
+import numpy as np
+from session_store import SessionReader, SessionWriter
+from synthetic import synthetic_curl_landmarks
+
+KEYS = ["a_left", "a_right", "b"]
+
+
+def write_session(path, n=10, row_group=4):
+    rng = np.random.default_rng(0)
+    landmarks = synthetic_curl_landmarks(n)
+    values = rng.uniform(0, 180, (n, len(KEYS)))
+    ok = values < 90
+    check = (values >= 90).astype(np.int8)
+    with SessionWriter(str(path), KEYS, {"fps": 24.0}, row_group=row_group) as writer:
+        for i in range(n):
+            if i == 5:
+                writer.append(i, np.full((33, 4), np.nan))  # no pose
+            else:
+                writer.append(i, landmarks[i], values[i], ok[i], check[i])
+            if i in (3, 8):
+                writer.add_event(i, "rep", side="left", rom=12.5)
+    values[5], ok[5], check[5] = np.nan, False, -1
+    landmarks[5] = np.nan
+    return landmarks, values, ok, check
+
+
+def test_round_trip(tmp_path):
+    landmarks, values, ok, check = write_session(tmp_path)
+    reader = SessionReader(str(tmp_path))
+    assert len(reader) == 10
+    assert reader.keys == KEYS
+    assert reader.meta == {"fps": 24.0}
+    assert len(reader.groups) == 3  # 4 + 4 + 2 rows
+    out = reader.read()
+    np.testing.assert_array_equal(out["frame"], np.arange(10))
+    np.testing.assert_array_equal(out["landmarks"], landmarks)
+    np.testing.assert_array_equal(out["values"], values)
+    np.testing.assert_array_equal(out["ok"], ok)
+    np.testing.assert_array_equal(out["check"], check)
+    assert out["landmarks"].dtype == np.float32
+
+
+def test_frame_ranges_across_groups(tmp_path):
+    _, values, _, _ = write_session(tmp_path)
+    reader = SessionReader(str(tmp_path))
+    out = reader.read(3, 9, ("frame", "values"))
+    assert set(out) == {"frame", "values"}
+    np.testing.assert_array_equal(out["frame"], np.arange(3, 9))
+    np.testing.assert_array_equal(reader.column("a_right", 2, 7), values[2:7, 1])
+    np.testing.assert_array_equal(reader.read(8, 100)["frame"], [8, 9])
+    empty = reader.read(4, 4)
+    assert empty["landmarks"].shape == (0, 33, 4)
+    assert empty["values"].shape == (0, len(KEYS))
+
+
+def test_events_and_close_meta(tmp_path):
+    write_session(tmp_path)
+    reader = SessionReader(str(tmp_path))
+    assert reader.events_between() == [{"side": "left", "rom": 12.5, "frame": 3, "kind": "rep"},
+                                       {"side": "left", "rom": 12.5, "frame": 8, "kind": "rep"}]
+    assert [e["frame"] for e in reader.events_between(4, 10, kind="rep")] == [8]
+    assert reader.events_between(kind="other") == []
+
+    writer = SessionWriter(str(tmp_path / "s2"), KEYS, {"fps": 30.0})
+    writer.append(0, np.zeros((33, 4)))
+    writer.close(summary={"reps_left": 1})
+    assert SessionReader(str(tmp_path / "s2")).meta == {"fps": 30.0, "summary": {"reps_left": 1}}
+
+
+def test_interrupted_session_is_readable(tmp_path):
+    # The index is rewritten after every full group; the open group is lost
+    writer = SessionWriter(str(tmp_path), KEYS, row_group=4)
+    for i in range(6):
+        writer.append(i, np.zeros((33, 4)))
+    reader = SessionReader(str(tmp_path))
+    assert len(reader) == 4
+    np.testing.assert_array_equal(reader.read()["frame"], np.arange(4))
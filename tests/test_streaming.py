@@ -0,0 +1,79 @@
+# tests/test_streaming.py
+import numpy as np
+import pytest
+from utils import RepCounter, StreamingSmoother, detect_reps_from_angle_series, smooth_series
+
+
+def noisy_curls(n=600, seed=0, nan_every=37):
+    rng = np.random.default_rng(seed)
+    v = 100 + 70 * np.cos(np.arange(n) * 2 * np.pi / 90) + rng.normal(0, 8, n)
+    v[::nan_every] = np.nan
+    return v
+
+
+def test_rep_counter_counts_top_then_bottom():
+    counter = RepCounter(60, 150, min_gap=0)
+    events = [i for i, a in enumerate([170, 100, 40, 100, 160, 100, 40, 160]) if counter.update(a)]
+    assert events == [4, 7]
+    assert counter.count == 2
+
+
+def test_rep_counter_band_keeps_state():
+    # Between the thresholds nothing changes: dipping back to 140 after the
+    # top doesn't end the rep, 70 on the way down doesn't restart it
+    counter = RepCounter(60, 150, min_gap=0)
+    assert [counter.update(a) for a in [170, 40, 140, 70, 149, 160]] == [False] * 5 + [True]
+
+
+def test_rep_counter_needs_a_top_first():
+    # Starting at (or below) the bottom is not a rep
+    counter = RepCounter(60, 150, min_gap=0)
+    assert not any(counter.update(a) for a in [160, 170, 155, 149, 151])
+    assert counter.count == 0
+
+
+def test_rep_counter_min_gap():
+    # A rep needs more than min_gap frames since the last event (top or rep)
+    series = [40, 160, 40, 160, 40, 40, 40, 160]
+    assert detect_reps_from_angle_series(series, 60, 150, min_gap=0) == (3, [1, 3, 7])
+    assert detect_reps_from_angle_series(series, 60, 150, min_gap=2) == (2, [1, 7])
+
+
+def test_rep_counter_nan_advances_frames_only():
+    counter = RepCounter(60, 150, min_gap=0)
+    assert [counter.update(a) for a in [40, np.nan, np.nan, 160]] == [False, False, False, True]
+    assert counter.frame == 3
+
+
+def test_rep_counter_reset():
+    counter = RepCounter(60, 150, min_gap=0)
+    for a in [40, 160, 40]:
+        counter.update(a)
+    counter.reset()
+    assert (counter.count, counter.frame, counter.state) == (0, -1, "unknown")
+    assert not counter.update(160)
+
+
+def test_streaming_counter_matches_offline():
+    v = smooth_series(noisy_curls())
+    counter = RepCounter(60, 150, 9)
+    assert [i for i, a in enumerate(v) if counter.update(a)] == detect_reps_from_angle_series(v, 60, 150, 9)[1]
+
+
+@pytest.mark.parametrize("method", ["savgol", "ema"])
+@pytest.mark.parametrize("n", [3, 8, 200])
+def test_streaming_smoother_matches_smooth_series(method, n):
+    v = noisy_curls(n)
+    v[:2] = np.nan   # leading gap
+    v[-3:] = np.nan  # trailing gap
+    smoother = StreamingSmoother(method)
+    out = []
+    for x in v:
+        out += smoother.push(x)
+    out += smoother.flush()
+    np.testing.assert_allclose(out, smooth_series(v, method), rtol=1e-9, atol=1e-9)
+
+
+def test_streaming_smoother_rejects_even_window():
+    with pytest.raises(ValueError):
+        StreamingSmoother("savgol", window=10)